@@ -9,6 +9,15 @@ if sys.version_info[0] == 3:
     from ICP.ICP import __url__
     from ICP.ICP import __copyright__
     from ICP.ICP import ICP
+    from ICP.ICP import ICPResult
+    from ICP.ICP import register
+    from ICP.ICP import prealign_points
+    from ICP.ICP import CorrelativeScanMatcher
+    from ICP.ICP import ScanMatchResult
+    from ICP.ICP import otsu_segmentation
+    from ICP.ICP import edge_pixels
+    from ICP.ICP import FeatureCache
+    from ICP.ICP import ModelIndex
 else:
     from ICP import __version__
     from ICP import __author__
@@ -16,6 +25,15 @@ else:
     from ICP import __url__
     from ICP import __copyright__
     from ICP import ICP
+    from ICP import ICPResult
+    from ICP import register
+    from ICP import prealign_points
+    from ICP import CorrelativeScanMatcher
+    from ICP import ScanMatchResult
+    from ICP import otsu_segmentation
+    from ICP import edge_pixels
+    from ICP import FeatureCache
+    from ICP import ModelIndex
 
 
 
@@ -6,10 +6,10 @@ __copyright__ = "(C) 2017 Avinash Kak. Python Software Foundation."
 
 
 from ICP import ICP
+from ICP.ICP import ICPResult, register, edge_pixels
 
 from PIL import Image
 from PIL import ImageDraw
-from PIL import ImageTk
 from PIL import ImageChops
 from PIL import ImageFont
 import numpy
@@ -19,15 +19,29 @@ import functools
 import math
 import random
 import copy
-if sys.version_info[0] == 3:
+import multiprocessing
+import shutil
+import tempfile
+import traceback
+try:        # for Python3
     import tkinter as Tkinter
     from tkinter.constants import *
     import tkinter.font as tkFont
-else:
-    import Tkinter    
-    from Tkconstants import *
-    import tkFont
-import pymsgbox
+except:     # for Python 2
+    try:
+        import Tkinter    
+        from Tkconstants import *
+        import tkFont
+    except ImportError:     # no Tk: only the non-interactive methods can be used
+        Tkinter = tkFont = None
+try:
+    from PIL import ImageTk
+except ImportError:
+    ImageTk = None
+try:
+    import pymsgbox
+except ImportError:     # needed only by chop_model_and_data_images_into_tiles_interactive()
+    pymsgbox = None
 import time
 
 #___________________________________  Utility functions  ____________________________________
@@ -49,6 +63,72 @@ def file_index(file_name):
     m = re.search(r'_(\d+)\.jpg$', file_name)
     return int(m.group(1))
 
+def _calculate_icp_for_one_pair_of_subimages_in_scratch_directory(task):
+    '''
+    This function is run by the worker processes of apply_icp_to_model_and_data_scanner_dumps_fast()
+    for one pair of subimages.  The registration is carried out in a scratch directory of its own so
+    that the files written by the workers never collide.  The only thing kept from the scratch
+    directory is the __result_<index> directory, which is moved to where the movie methods expect it.
+    Returns the subimage index, the registration result, and the image of the model pixels retained
+    for ICP, or None for the last two if the registration failed, in which case the exception is
+    printed with the subimage index.
+    '''
+    scanner, modelfile, datafile, subimage_index = task
+    cwd = os.getcwd()
+    scratch_directory = tempfile.mkdtemp(prefix="__scratch_", dir=cwd)
+    try:
+        os.chdir(scratch_directory)
+        print("\n\nApplying ICP to image blocks in files %s and %s" % (modelfile,datafile))
+        scanner.calculate_icp_for_one_pair_of_subimages_fast(modelfile, datafile, subimage_index)
+        dir_name_for_results = "__result_" + str(subimage_index)
+        if os.path.exists(os.path.join(cwd, dir_name_for_results)):
+            shutil.rmtree(os.path.join(cwd, dir_name_for_results))
+        shutil.move(dir_name_for_results, os.path.join(cwd, dir_name_for_results))
+        return (subimage_index, scanner.subimage_results[subimage_index], 
+                scanner.model_subimages_with_retained_pixels[subimage_index])
+    except (Exception, SystemExit):
+        # SystemExit too, since a worker that exits would leave the pool waiting for its result:
+        print("\n\nICP failed for the subimage pair at block index %d:\n%s" % (subimage_index, traceback.format_exc()))
+        return (subimage_index, None, None)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+def _bilinear_remap(image_array, displacement_field, warped):
+    '''
+    Warps image_array, a 2D array or a 3D array with the color bands along the last axis, with
+    a dense displacement field of shape (height, width, 2) into warped, a uint8 array of shape
+    (height, width) plus the color bands.  The output pixel at (x,y) is interpolated
+    bilinearly from image_array at (x + displacement_field[y,x,0], y + displacement_field[y,x,1])
+    and the output pixels that map to outside image_array are set to zero.  The pixels are
+    remapped with vectorized numpy operations in bands of rows, so that the temporary arrays
+    are bounded by the size of a band and not by the size of the image.  Returns warped.
+    '''
+    image_height, image_width = image_array.shape[:2]
+    height, width = displacement_field.shape[:2]
+    # About a quarter of a million pixels per band:
+    band_height = max(1, (1 << 18) // max(width, 1))
+    columns = numpy.arange(width, dtype="float32")
+    for band_upper in range(0, height, band_height):
+        band_lower = min(band_upper + band_height, height)
+        band = displacement_field[band_upper:band_lower]
+        x = columns + band[...,0]
+        y = numpy.arange(band_upper, band_lower, dtype="float32")[:,None] + band[...,1]
+        inside = (x >= 0) & (x <= image_width - 1) & (y >= 0) & (y <= image_height - 1)
+        x0 = numpy.clip(numpy.floor(x), 0, max(image_width - 2, 0))
+        y0 = numpy.clip(numpy.floor(y), 0, max(image_height - 2, 0))
+        fx = numpy.clip(x - x0, 0, 1)
+        fy = numpy.clip(y - y0, 0, 1)
+        x0, y0 = x0.astype("intp"), y0.astype("intp")
+        x1 = numpy.minimum(x0 + 1, image_width - 1)
+        y1 = numpy.minimum(y0 + 1, image_height - 1)
+        if image_array.ndim == 3:
+            fx, fy, inside = fx[...,None], fy[...,None], inside[...,None]
+        top = image_array[y0,x0] * (1 - fx) + image_array[y0,x1] * fx
+        bottom = image_array[y1,x0] * (1 - fx) + image_array[y1,x1] * fx
+        warped[band_upper:band_lower] = numpy.where(inside, numpy.clip(numpy.rint(top * (1 - fy) + bottom * fy), 0, 255), 0)
+    return warped
+
 #______________________________  ImageScanner Class Definition  ________________________________
 
 class ICPImageScanner(ICP):
@@ -69,15 +149,20 @@ class ICPImageScanner(ICP):
                    '''ICPImageScanner constructor can only be called with keyword arguments for 
                       the following keywords: model_image_file, data_image_file, binary_or_gray_or_color,
                       corners_or_edges, size_for_calculations, scanning_window_width, scanning_window_height, 
-                      iterations, subimage_index, and debug''')   
-        model_image_file = data_image_file = scanning_window_width = scanning_window_height = subimage_index = min_brightness_level = min_area_threshold = max_area_threshold = iterations = corners_or_edges = debug = None
+                      scanning_window_horizontal_stride, scanning_window_vertical_stride,
+                      raw_image_shape, iterations, subimage_index, and debug''')   
+        model_image_file = data_image_file = raw_image_shape = scanning_window_width = scanning_window_height = scanning_window_horizontal_stride = scanning_window_vertical_stride = subimage_index = min_brightness_level = min_area_threshold = max_area_threshold = corners_or_edges = debug = None
         if 'model_image_file' in kwargs              :   model_image_file = kwargs.pop('model_image_file')
         if 'data_image_file' in kwargs               :   data_image_file = kwargs.pop('data_image_file')
+        if 'raw_image_shape' in kwargs               :   raw_image_shape = kwargs.pop('raw_image_shape')
         if 'corners_or_edges' in kwargs              :   corners_or_edges=kwargs.pop('corners_or_edges')
         if 'subimage_index' in kwargs                :   subimage_index = kwargs.pop('subimage_index')
-        if 'iterations' in kwargs                    :   iterations = kwargs.pop('iterations')
         if 'scanning_window_width' in kwargs         :   scanning_window_width = kwargs.pop('scanning_window_width')
         if 'scanning_window_height' in kwargs        :   scanning_window_height = kwargs.pop('scanning_window_height')
+        if 'scanning_window_horizontal_stride' in kwargs :   scanning_window_horizontal_stride = kwargs.pop('scanning_window_horizontal_stride')
+        if 'scanning_window_vertical_stride' in kwargs   :   scanning_window_vertical_stride = kwargs.pop('scanning_window_vertical_stride')
+        # The subimage pairs have always been registered with this threshold by the scanner:
+        if 'pixel_correspondence_dist_threshold' not in kwargs :   kwargs['pixel_correspondence_dist_threshold'] = 20
         ICP.__init__(self, **kwargs)
         if corners_or_edges == "corners":
             sys.exit("The scanner is not yet set for ICP with corner features. Sorry!")
@@ -85,11 +170,23 @@ class ICPImageScanner(ICP):
             self.corners_or_edges = "edges"
         self.model_im_file = model_image_file
         self.data_im_file = data_image_file
-        self.model_im = Image.open(model_image_file)
-        self.data_im = Image.open(data_image_file)
-        self.iterations = iterations
+        # A .npy or a .raw image file is memory-mapped instead of being opened with PIL:
+        self.model_source = self._memory_mapped_source(model_image_file, raw_image_shape)
+        self.data_source = self._memory_mapped_source(data_image_file, raw_image_shape)
+        self.model_im = Image.open(model_image_file) if self.model_source is None else None
+        self.data_im = Image.open(data_image_file) if self.data_source is None else None
         self.scanning_window_width, self.scanning_window_height  =  scanning_window_width, scanning_window_height
-        self.model_im_width, self.model_im_height = self.model_im.size[0], self.model_im.size[1]
+        # By default, the scanning window moves by its own size, so that the subimages do not overlap:
+        self.scanning_window_horizontal_stride = scanning_window_horizontal_stride if scanning_window_horizontal_stride else scanning_window_width
+        self.scanning_window_vertical_stride = scanning_window_vertical_stride if scanning_window_vertical_stride else scanning_window_height
+        if self.model_source is None:
+            self.model_im_width, self.model_im_height = self.model_im.size[0], self.model_im.size[1]
+        else:
+            self.model_im_width, self.model_im_height = self.model_source.shape[1], self.model_source.shape[0]
+        if self.data_source is None:
+            self.data_im_width, self.data_im_height = self.data_im.size[0], self.data_im.size[1]
+        else:
+            self.data_im_width, self.data_im_height = self.data_source.shape[1], self.data_source.shape[0]
         self.scanner_dump_directory_model = os.path.splitext(model_image_file)[0] + "_scanner_dump"
         self.scanner_dump_directory_data = os.path.splitext(data_image_file)[0] + "_scanner_dump"
         if subimage_index is not None:
@@ -99,7 +196,9 @@ class ICPImageScanner(ICP):
             self.model_subimage = Image.open(self.model_subimage_file)
             self.data_subimage = Image.open(self.data_subimage_file)
         self.model_subimages_with_retained_pixels = None
+        self.subimage_results = None
         self.total_num_window_pos = None
+        self.displacement_field = None
         if debug:                             
             self.debug = debug
         else:
@@ -124,10 +223,11 @@ class ICPImageScanner(ICP):
         self.data_image_width, self.data_image_height = self.data_im.size
         print("size of the model image is: %s" % str((self.model_image_width,self.model_image_height)))
         print("size of the data image is: %s" % str((self.data_image_width,self.data_image_height)))
-        self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-        self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+        self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
         total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
         self.model_subimages_with_retained_pixels = [None] * total_scan_window_positions
+        self.subimage_results = [None] * total_scan_window_positions
         for modelfile,datafile in zip( sorted(glob.glob(self.scanner_dump_directory_model + "/*"), key=lambda x: file_index(x)),
                                        sorted(glob.glob(self.scanner_dump_directory_data + "/*"), key=lambda x: file_index(x)) ):
             try:
@@ -135,31 +235,178 @@ class ICPImageScanner(ICP):
                 self.calculate_icp_for_one_pair_of_subimages_and_display_results(modelfile, datafile, file_index(modelfile))
             except: pass
 
-    def apply_icp_to_model_and_data_scanner_dumps_fast(self):
+    def apply_icp_to_model_and_data_scanner_dumps_fast(self, processes=None):
 
         '''
         Like the previous method, the purpose of this method is also to apply ICP to ALL the subimage 
         pairs in the two scanner dump directories, one for the model image and the other for the data image. 
         This method, however, does NOT display separately the ICP matching results for each pair of
-        subimages.
+        subimages.  When processes is greater than 1, the subimage pairs are registered in parallel by a
+        pool of that many worker processes.  Either way, the results of the registrations end up in the
+        list self.subimage_results as ICPResult instances, in the order of the subimage indexes.
         '''
         if ( (not os.path.exists(self.scanner_dump_directory_model)) or 
              (len(glob.glob(self.scanner_dump_directory_model + "/*")) == 0) or
              (not os.path.exists(self.scanner_dump_directory_data)) or 
              (len(glob.glob(self.scanner_dump_directory_data + "/*")) == 0) ):
             sys.exit("Before you call apply_icp_to_model_and_data_scanner_dumps_and_show_intermediate_results(), you must create a scan dump by running the scanner.  See image scanning scripts in the ExamplesICPImageScanner directory for why.")
-        self.model_image_width, self.model_image_height = self.model_im.size
-        self.data_image_width, self.data_image_height = self.data_im.size
-        self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-        self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+        self.model_image_width, self.model_image_height = self.model_im_width, self.model_im_height
+        self.data_image_width, self.data_image_height = self.data_im_width, self.data_im_height
+        self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
         total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
         self.model_subimages_with_retained_pixels = [None] * total_scan_window_positions
-        for modelfile,datafile in zip( sorted(glob.glob(self.scanner_dump_directory_model + "/*"), key=lambda x: file_index(x)),
-                                       sorted(glob.glob(self.scanner_dump_directory_data + "/*"), key=lambda x: file_index(x)) ):
+        self.subimage_results = [None] * total_scan_window_positions
+        subimage_pairs = list(zip( sorted(glob.glob(self.scanner_dump_directory_model + "/*"), key=lambda x: file_index(x)),
+                                   sorted(glob.glob(self.scanner_dump_directory_data + "/*"), key=lambda x: file_index(x)) ))
+        if processes is None or processes <= 1:
+            for modelfile,datafile in subimage_pairs:
+                try:
+                    print("\n\nApplying ICP to image blocks in files %s and %s" % (modelfile,datafile))
+                    self.calculate_icp_for_one_pair_of_subimages_fast(modelfile, datafile, file_index(modelfile))
+                except: pass
+            return
+        # The workers get a copy of the scanner without the large images and with absolute paths,
+        # since each of them works in a scratch directory of its own:
+        worker_scanner = copy.copy(self)
+        worker_scanner.model_im = worker_scanner.data_im = None
+        worker_scanner.model_source = worker_scanner.data_source = None
+        worker_scanner.model_subimages_with_retained_pixels = worker_scanner.subimage_results = None
+        worker_scanner.scanner_dump_directory_model = os.path.abspath(self.scanner_dump_directory_model)
+        worker_scanner.scanner_dump_directory_data = os.path.abspath(self.scanner_dump_directory_data)
+        if self.font_file is not None:
+            worker_scanner.font_file = os.path.abspath(self.font_file)
+        tasks = [(worker_scanner, os.path.abspath(modelfile), os.path.abspath(datafile), file_index(modelfile))
+                                                                     for modelfile,datafile in subimage_pairs]
+        pool = multiprocessing.Pool(processes)
+        try:
+            outcomes = pool.map(_calculate_icp_for_one_pair_of_subimages_in_scratch_directory, tasks)
+        finally:
+            pool.close()
+            pool.join()
+        if not os.path.exists("__model"):
+            os.mkdir("__model")
+        for subimage_index, result, model_subim_result in outcomes:
+            if result is None: continue
+            self.subimage_results[subimage_index] = result
+            self.model_subimages_with_retained_pixels[subimage_index] = model_subim_result
+            model_subim_result.save("__model/__model_subimage" + str(subimage_index) + ".jpg")
+
+    def apply_icp_to_model_and_data_images_in_memory(self):
+        '''
+        This method registers all the corresponding pairs of subimages, just like the previous
+        method, but without the scanner dumps.  The model and the data images are decoded and
+        converted to grayscale once, the subimages are taken as numpy views into the resulting
+        arrays, and each pair goes straight to the pixel extraction and the headless register()
+        function without anything being written to or read from the disk.  So there is no
+        JPEG-encoding of the subimages, either, whose artifacts would otherwise show up in the
+        edge maps.  For memory-mapped images, the subimages are views into the memory maps and so
+        only the pixels inside the scanning window are read for each pair.  The results are placed
+        in self.subimage_results and the pixels retained for ICP in
+        self.model_subimages_with_retained_pixels, as for the previous method.  Since no
+        __result_<index> directories are created, the movie methods cannot be used afterwards.
+        Returns self.subimage_results.
+        '''
+        model_array = self._scanner_image_array('model')
+        data_array = self._scanner_image_array('data')
+        model_tile_boxes = self._tile_boxes((self.model_im_width, self.model_im_height))
+        data_tile_boxes = self._tile_boxes((self.data_im_width, self.data_im_height))
+        self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
+        self.model_subimages_with_retained_pixels = [None] * len(model_tile_boxes)
+        self.subimage_results = [None] * len(model_tile_boxes)
+        for subimage_index, (model_box, data_box) in enumerate(zip(model_tile_boxes, data_tile_boxes)):
+            model_subimage = model_array[model_box[1]:model_box[3], model_box[0]:model_box[2]]
+            data_subimage = data_array[data_box[1]:data_box[3], data_box[0]:data_box[2]]
+            model_list, model_subim_result, _ = self._edge_pixels_of_subimage(Image.fromarray(model_subimage))
+            data_list, _, _ = self._edge_pixels_of_subimage(Image.fromarray(data_subimage))
+            print("\n\nApplying ICP to the subimage pair at block index: %d" % subimage_index)
             try:
-                print("\n\nApplying ICP to image blocks in files %s and %s" % (modelfile,datafile))
-                self.calculate_icp_for_one_pair_of_subimages_fast(modelfile, datafile, file_index(modelfile))
-            except: pass
+                self.subimage_results[subimage_index] = register(model_list, data_list, 
+                                                                 **self._registration_parameters())
+            except ValueError:
+                # No edge pixels in one of the subimages or no correspondences between them:
+                continue
+            self.model_subimages_with_retained_pixels[subimage_index] = model_subim_result
+        return self.subimage_results
+
+    def calculate_displacement_field(self, field_file=None):
+        '''
+        This method turns the rigid transforms found for the subimage pairs into a dense
+        displacement field over the whole model image.  The transform of each subimage pair is
+        applied to every pixel in its scanning window and, where the windows overlap because the
+        strides are smaller than the window, the displacements are blended with weights that fall
+        off linearly from the center of each window.  The field is a float32 array of shape
+        (height, width, 2) such that the model pixel at (x,y) corresponds to the data pixel at
+        (x + field[y,x,0], y + field[y,x,1]).  The pixels not covered by any successfully
+        registered window get zero displacement.  The field is put together in bands of rows
+        as tall as the vertical stride, so that apart from the field itself the memory used is
+        bounded by the size of a band.  If field_file is supplied, the field is written band by
+        band into a .npy file of that name and returned as a memory map of the file, so that it
+        does not have to fit into the memory either.  One of the apply_icp_* methods must be
+        called first.  The field is stored in self.displacement_field and returned.
+        '''
+        if self.subimage_results is None:
+            sys.exit("Before you call calculate_displacement_field(), you must register the subimage pairs with one of the apply_icp_* methods.")
+        height, width = self.model_im_height, self.model_im_width
+        if field_file is None:
+            field = numpy.zeros((height, width, 2), dtype="float32")
+        else:
+            field = numpy.lib.format.open_memmap(field_file, mode="w+", dtype="float32", shape=(height, width, 2))
+        # The registrations were carried out on the subimages reduced to calculation_image_size:
+        reduced_subimage = Image.new("L", (self.scanning_window_width, self.scanning_window_height))
+        reduced_subimage.thumbnail( (self.calculation_image_size, self.calculation_image_size), Image.ANTIALIAS )
+        scale_x = self.scanning_window_width / float(reduced_subimage.size[0])
+        scale_y = self.scanning_window_height / float(reduced_subimage.size[1])
+        x_offsets = numpy.arange(self.scanning_window_width, dtype="float32")
+        y_offsets = numpy.arange(self.scanning_window_height, dtype="float32")
+        reduced_x = (x_offsets + 0.5) / scale_x - 0.5
+        reduced_y = (y_offsets + 0.5) / scale_y - 0.5
+        # The weights do not drop all the way to zero at the border of the window:
+        window_weights = numpy.outer(
+             1.0 - numpy.abs(y_offsets + 0.5 - self.scanning_window_height / 2.0) / (self.scanning_window_height / 2.0 + 1.0),
+             1.0 - numpy.abs(x_offsets + 0.5 - self.scanning_window_width / 2.0) / (self.scanning_window_width / 2.0 + 1.0)
+                                    ).astype("float32")
+        # The registered windows, row by row of the positions of the scanning window:
+        horizontal_positions_of_scan_window, vertical_positions_of_scan_window = self._scan_window_positions((width, height))
+        windows = list(zip(self.subimage_results, self._tile_boxes((width, height)),
+                           self._tile_boxes((self.data_im_width, self.data_im_height))))
+        window_rows = [[window for window in windows[row * horizontal_positions_of_scan_window :
+                                                     (row + 1) * horizontal_positions_of_scan_window] if window[0] is not None]
+                       for row in range(vertical_positions_of_scan_window)]
+        band_height = self.scanning_window_vertical_stride
+        for band_upper in range(0, height, band_height):
+            band_lower = min(band_upper + band_height, height)
+            band_field = numpy.zeros((band_lower - band_upper, width, 2), dtype="float32")
+            band_weights = numpy.zeros((band_lower - band_upper, width), dtype="float32")
+            # Only the rows of windows that start above the end of the band and end below its start:
+            first_row = max(0, (band_upper - self.scanning_window_height) // self.scanning_window_vertical_stride)
+            for window_row in window_rows[first_row : band_upper // self.scanning_window_vertical_stride + 1]:
+                for result, model_box, data_box in window_row:
+                    left, upper, right, lower = model_box
+                    top, bottom = max(upper, band_upper), min(lower, band_lower)
+                    if top >= bottom: continue
+                    rows = slice(top - upper, bottom - upper)
+                    R = numpy.asarray(result.R, dtype="float")
+                    T = numpy.asarray(result.T, dtype="float").ravel()
+                    model_mean = numpy.asarray(result.model_mean, dtype="float").ravel()
+                    # Inverting R (x_d - model_mean) + T = x_m - model_mean gives the data pixel of each
+                    # model pixel as an affine function of x and y, that is, as a sum of a row and a column:
+                    u = reduced_x - model_mean[0] - T[0]
+                    v = reduced_y[rows] - model_mean[1] - T[1]
+                    displacement = numpy.empty((bottom - top, right - left, 2), dtype="float32")
+                    displacement[...,0] = ((data_box[0] - left - 0.5 + (model_mean[0] + 0.5 + u * R[0,0]) * scale_x - x_offsets)[None,:] +
+                                           (v * R[1,0] * scale_x)[:,None])
+                    displacement[...,1] = ((u * R[0,1] * scale_y)[None,:] +
+                                           (data_box[1] - upper - 0.5 + (model_mean[1] + 0.5 + v * R[1,1]) * scale_y - y_offsets[rows])[:,None])
+                    band_field[top - band_upper : bottom - band_upper, left:right] += window_weights[rows,:,None] * displacement
+                    band_weights[top - band_upper : bottom - band_upper, left:right] += window_weights[rows]
+            numpy.divide(band_field, band_weights[...,None], out=band_field, where=band_weights[...,None] > 0)
+            field[band_upper:band_lower] = band_field
+        if field_file is not None:
+            field.flush()
+        self.displacement_field = field
+        return self.displacement_field
 
     def calculate_icp_for_one_pair_of_subimages_and_display_results(self, modelfile=None, datafile=None, subimage_index=None):
         '''
@@ -182,21 +429,22 @@ class ICPImageScanner(ICP):
             self.subimage_index = subimage_index
         # Make sure we have the info on how many positions of the scanning window horizontally and vertically:
         if self.model_subimages_with_retained_pixels is None:
-            self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-            self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+            self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
             total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
             self.model_subimages_with_retained_pixels = [None] * total_scan_window_positions
+            self.subimage_results = [None] * total_scan_window_positions
         # Now construct an instance of the ICP class:
         icp = ICP(
                binary_or_color = self.binary_or_color,
                corners_or_edges = self.corners_or_edges,
-               calculation_image_size = 200,
-               max_num_of_pixels_used_for_icp = 300,
-               pixel_correspondence_dist_threshold = 20,
-               iterations = self.iterations,
+               calculation_image_size = self.calculation_image_size,
+               max_num_of_pixels_used_for_icp = self.max_num_of_pixels_used_for_icp,
                model_image =  model_subimage_file,
                data_image = data_subimage_file,
                subimage_index = self.subimage_index,
+               font_file = self.font_file,
+               **self._registration_parameters()
             )
         # Extract low-level information from the two corresponding subimages:
         self._extract_pixels_from_subimage('model')
@@ -210,6 +458,7 @@ class ICPImageScanner(ICP):
         self.model_subimages_with_retained_pixels[self.subimage_index] = self.model_subim_result
         # Now call the ICP algorithm:
         icp.icp()
+        self.subimage_results[self.subimage_index] = self._subimage_result(icp)
         self.display_subimage_pair_used_for_edge_based_icp()
         icp.display_results_as_movie()
 #        icp.cleanup_directory()
@@ -235,21 +484,22 @@ class ICPImageScanner(ICP):
             self.subimage_index = subimage_index
         # Make sure we have the info on how many positions of the scanning window horizontally and vertically:
         if self.model_subimages_with_retained_pixels is None:
-            self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-            self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+            self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
             total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
             self.model_subimages_with_retained_pixels = [None] * total_scan_window_positions
+            self.subimage_results = [None] * total_scan_window_positions
         # Now construct an instance of the ICP class:
         icp = ICP(
                binary_or_color = self.binary_or_color,
                corners_or_edges = self.corners_or_edges,
-               calculation_image_size = 200,
-               max_num_of_pixels_used_for_icp = 300,
-               pixel_correspondence_dist_threshold = 20,
-               iterations = self.iterations,
+               calculation_image_size = self.calculation_image_size,
+               max_num_of_pixels_used_for_icp = self.max_num_of_pixels_used_for_icp,
                model_image =  model_subimage_file,
                data_image = data_subimage_file,
                subimage_index = self.subimage_index,
+               font_file = self.font_file,
+               **self._registration_parameters()
             )
         # Extract low-level information from the two corresponding subimages:
         self._extract_pixels_from_subimage('model')
@@ -263,6 +513,7 @@ class ICPImageScanner(ICP):
         self.model_subimages_with_retained_pixels[self.subimage_index] = self.model_subim_result
         # Now call the ICP algorithm:
         icp.icp()
+        self.subimage_results[self.subimage_index] = self._subimage_result(icp)
 
     def display_subimage_pair_used_for_edge_based_icp(self):
         '''
@@ -297,19 +548,19 @@ class ICPImageScanner(ICP):
             fontsize = 25
         else:
             fontsize = 15
-        font = ImageFont.truetype(self.font_file, fontsize)
+        font = self._display_font(fontsize)
 
         model_image_width, model_image_height = self.model_im_width, self.model_im_height
 
         original_model_im = self.model_im.copy()
         original_data_im  = self.data_im.copy()
 
-        self.num_horiz_positions_for_subimages = model_image_width // self.scanning_window_width
-        self.num_vert_positions_for_subimages = model_image_height // self.scanning_window_height
+        self.num_horiz_positions_for_subimages, self.num_vert_positions_for_subimages = \
+                           self._scan_window_positions((model_image_width, model_image_height))
         vert_pos_index_for_subimage = self.subimage_index // self.num_horiz_positions_for_subimages
         horz_pos_index_for_subimage = self.subimage_index - vert_pos_index_for_subimage * self.num_horiz_positions_for_subimages
-        ulcx = upper_left_corner_x = horz_pos_index_for_subimage * self.scanning_window_width
-        ulcy = upper_left_corner_y = vert_pos_index_for_subimage * self.scanning_window_height
+        ulcx = upper_left_corner_x = horz_pos_index_for_subimage * self.scanning_window_horizontal_stride
+        ulcy = upper_left_corner_y = vert_pos_index_for_subimage * self.scanning_window_vertical_stride
 
         draw1 = ImageDraw.Draw(original_model_im)
         draw2 = ImageDraw.Draw(original_data_im)
@@ -398,12 +649,44 @@ class ICPImageScanner(ICP):
         messageLabelText.set('''Close this window to see a movie of image registration''')
         Tkinter.mainloop()
         
+    def chop_model_and_data_images_into_tiles(self):
+        '''
+        This method creates the same dumps of subimages as the next method, but without showing
+        anything to the user, so that it can also be run on a machine without a display.  The
+        subimages are cut out of the model and the data images with Image.crop(), or sliced out of
+        their memory maps, in a loop over the positions of the scanning window.  Returns the number
+        of subimages in the model dump and the number in the data dump, which differ when the two
+        images are of different sizes.  The number for the model is also stored in
+        self.total_num_window_pos.
+        '''
+        number_of_subimages = {}
+        for image_type in ('model','data'):
+            scanner_dump_directory = self.scanner_dump_directory_model if image_type == 'model' else self.scanner_dump_directory_data
+            image_size = (self.model_im_width, self.model_im_height) if image_type == 'model' else (self.data_im_width, self.data_im_height)
+            if os.path.exists(scanner_dump_directory):
+                for filename in glob.glob(scanner_dump_directory + "/*"):
+                    os.remove(filename)
+            else:
+                os.mkdir(scanner_dump_directory)
+            tile_boxes = self._tile_boxes(image_size)
+            for block_index, box in enumerate(tile_boxes):
+                if self.debug: print("Creating subimage for window position at block index: %d" % block_index)
+                self._subimage(image_type, box).convert("RGB").save(scanner_dump_directory + "/subimage_" + str(block_index) + ".jpg")
+            number_of_subimages[image_type] = len(tile_boxes)
+        self.total_num_window_pos = number_of_subimages['model']
+        return number_of_subimages['model'], number_of_subimages['data']
+
     def chop_model_and_data_images_into_tiles_interactive(self):
         '''
         This method creates a dump of subimages extracted from large model and data images.  The
         method is interactive in the sense that it shows the user each subimage for his/her 
         examination before storing it in a dump directory.
+        The scanning window can only move by its own size here, so a ValueError is raised if the
+        strides are set to anything else.
         '''
+        if (self.scanning_window_horizontal_stride != self.scanning_window_width or
+            self.scanning_window_vertical_stride != self.scanning_window_height):
+            raise ValueError("chop_model_and_data_images_into_tiles_interactive() moves the scanning window by its own size.  Use chop_model_and_data_images_into_tiles() for other strides.")
         for image_type in ('model','data'):
             scanner_dump_directory = self.scanner_dump_directory_model if image_type == 'model' else self.scanner_dump_directory_data
             self.displayImage6(self.model_im if image_type == 'model' else self.data_im, "input_image -- close window when done viewing")
@@ -411,9 +694,6 @@ class ICPImageScanner(ICP):
             image = self.model_im.copy() if image_type == 'model' else self.data_im.copy()
             self.image_width,self.image_height = self.model_im.size if image_type == 'model' else self.data_im.size
             print("size of the image is: %s" % str((self.image_width,self.image_height)))
-            self.array_R = numpy.zeros((N, M), dtype="int")
-            self.array_G = numpy.zeros((N, M), dtype="int")
-            self.array_B = numpy.zeros((N, M), dtype="int")
             mw = Tkinter.Tk()
             winsize_x,winsize_y = None,None
             screen_width,screen_height = mw.winfo_screenwidth(),mw.winfo_screenheight()
@@ -472,8 +752,8 @@ class ICPImageScanner(ICP):
         also colorizes the pixels of the data subimages for all different iterations.
         '''
         if (self.horiz_positions_of_scan_window is None) or (self.vert_positions_of_scan_window is None):
-            self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-            self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+            self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
         total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
         if self.scanning_window_width > self.scanning_window_height:
             cell_width = cell_height = self.scanning_window_width + 10
@@ -604,8 +884,8 @@ class ICPImageScanner(ICP):
         previous method and this method.
         '''
         if (self.horiz_positions_of_scan_window is None) or (self.vert_positions_of_scan_window is None):
-            self.horiz_positions_of_scan_window = self.model_im_width // self.scanning_window_width
-            self.vert_positions_of_scan_window = self.model_im_height // self.scanning_window_height
+            self.horiz_positions_of_scan_window, self.vert_positions_of_scan_window = \
+                           self._scan_window_positions((self.model_im_width, self.model_im_height))
         total_scan_window_positions = self.horiz_positions_of_scan_window * self.vert_positions_of_scan_window
         if self.scanning_window_width > self.scanning_window_height:
             cell_width = cell_height = self.scanning_window_width + 10
@@ -754,56 +1034,71 @@ class ICPImageScanner(ICP):
             os.rmdir(directory_name)
         os.rmdir('__model')
 
+    def warp_data_image(self, displacement_field=None, output_file=None):
+        '''
+        Warps the whole data image into the frame of the model image with a dense displacement
+        field as returned by calculate_displacement_field().  If no field is supplied, the one
+        in self.displacement_field is used, after calculating it if necessary.  The remapping is
+        bilinear and is vectorized over bands of rows of the output.  Returns the warped data
+        image as a PIL image of the same size as the model image.  If output_file is supplied,
+        the warped image is instead written band by band into a .npy file of that name and a
+        memory map of the file is returned.  With a memory-mapped data image and a field kept
+        in a file, the whole warp then needs no more memory than a band.
+        '''
+        if displacement_field is None:
+            if self.displacement_field is None:
+                self.calculate_displacement_field()
+            displacement_field = self.displacement_field
+        if self.data_source is not None:
+            # Only the pixels the field maps to are read from the memory map:
+            data_array = self.data_source
+        else:
+            data_im = self.data_im if self.data_im.mode in ("L", "RGB") else self.data_im.convert("RGB")
+            data_array = numpy.asarray(data_im)
+        shape = displacement_field.shape[:2] + data_array.shape[2:]
+        if output_file is not None:
+            warped = numpy.lib.format.open_memmap(output_file, mode="w+", dtype="uint8", shape=shape)
+            _bilinear_remap(data_array, displacement_field, warped)
+            warped.flush()
+            return warped
+        warped = numpy.empty(shape, dtype="uint8")
+        _bilinear_remap(data_array, displacement_field, warped)
+        return Image.fromarray(warped, "L" if warped.ndim == 2 else "RGB")
+
     #______________________  Private Methods of the ICPImageScanner Class  ____________________
 
-    def _extract_pixels_from_subimage(self, model_or_data):
-        if model_or_data == "model":
-            im = self.model_subimage
-        else:
-            im = self.data_subimage
+    def _edge_pixels_of_subimage(self, im):
+        '''
+        Returns the list of the edge pixels retained for ICP in the subimage im, reduced to
+        calculation_image_size, together with the images of those pixels and of the edge map.
+        '''
         im = im.convert('L')        ## convert to gray level
         im.thumbnail( (self.calculation_image_size, self.calculation_image_size), Image.ANTIALIAS )
         if self.debug: im.show()
         width,height = im.size
         if self.debug: print("width: %d    height: %d" % (width, height))
-        dx = numpy.zeros((height, width), dtype="float")
-        dy = numpy.zeros((height, width), dtype="float")
-        rval = numpy.zeros((height, width), dtype="float")  # rval at a pixel = determinant / trace^2
         result_im = Image.new("1", (width,height), 0)
-        edge_im = Image.new("L", (width,height), 0)
         edge_pixel_list = []    
-        corner_pixels = []
         # Note that array indexing is 'opposite' of the image indexing with the first index along what 
         # is y for the image and the second index along what is x for the image.  For the image, x is 
         # the horizontal axis to the right, y is the vertical axis pointing downwards.  In what follows, 
         # we treat i and j as the image coordinates.  That is, i increments horizontally to the right
         # and j increments vertically downwards.
-        for i in range(3,width-3):
-            for j in range(3,height-3):
-                ip1,im1,jp1,jm1 = i+1,i-1,j+1,j-1
-                dx[(j,i)] = (im.getpixel((ip1,jm1)) + 2*im.getpixel((ip1,j)) + \
-                             im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                             2*im.getpixel((im1,j)) + im.getpixel((im1,jp1))) 
-                dy[(j,i)] = (im.getpixel((im1,jp1)) + 2*im.getpixel((i,jp1)) + \
-                             im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                             2*im.getpixel((i,jm1)) + im.getpixel((ip1,jm1))) 
-        edge_pixel_dict = {}
-        for i in range(3,width-3):                 # i is for horizontal axis to the right
-            for j in range(3,height-3):            # j is for vertical axis to the bottom
-                edge_strength = math.sqrt(dx[(j,i)]**2 + dy[(j,i)]**2)
-                edge_im.putpixel((i,j), int(edge_strength))   
-                if edge_strength > self.edge_detection_threshold:            
-                    edge_pixel_dict["e_" + str(i) + "_" + str(j)] = edge_strength
-        sorted_edge_pixels = sorted(edge_pixel_dict.keys(), \
-                                      key=lambda x: edge_pixel_dict[x], reverse=True)
-        if len(sorted_edge_pixels) > self.max_num_of_pixels_used_for_icp:
-            sorted_edge_pixels = sorted_edge_pixels[0:self.max_num_of_pixels_used_for_icp]
-        for pixel_label in sorted_edge_pixels: 
-            parts = re.split(r'_', pixel_label)
-            i_index,j_index = int(parts[-2]), int(parts[-1])
+        strongest_edge_pixels, edge_strength, dx, dy = edge_pixels(numpy.asarray(im), 
+                                   self.edge_detection_threshold, self.max_num_of_pixels_used_for_icp)
+        edge_im = Image.fromarray(numpy.minimum(edge_strength, 255).astype("uint8"), "L")
+        for i_index,j_index in strongest_edge_pixels.tolist():
             edge_pixel_list.append((i_index,j_index))
             result_im.putpixel((i_index,j_index), 255)
         if self.debug: result_im.show()
+        return edge_pixel_list, result_im, edge_im
+
+    def _extract_pixels_from_subimage(self, model_or_data):
+        if model_or_data == "model":
+            im = self.model_subimage
+        else:
+            im = self.data_subimage
+        edge_pixel_list, result_im, edge_im = self._edge_pixels_of_subimage(im)
         if model_or_data == "model":
             if os.path.exists("__model"):
                 files = glob.glob("__model/*")
@@ -822,96 +1117,170 @@ class ICPImageScanner(ICP):
             self.data_subim_edge_map = edge_im
             if self.debug: edge_im.save("data_edge_image.jpg")
 
+    def _subimage_result(self, icp):
+        '''
+        Packs the outcome of icp.icp() for a pair of subimages into an ICPResult.
+        '''
+        return ICPResult(numpy.asarray(icp.R), numpy.asarray(icp.T).ravel(), numpy.asarray(icp.model_mean).ravel(),
+                         icp.error_for_iterations, icp.stop_reason, None, {})
+
+    def _registration_parameters(self):
+        '''
+        Returns the keyword parameters that the registration of every subimage pair gets from the
+        scanner, so that the pipeline with the scanner dumps and the one in memory register the
+        pairs in the same way.
+        '''
+        return dict(iterations = self.iterations,
+                    pixel_correspondence_dist_threshold = self.pixel_correspondence_dist_threshold,
+                    correspondence_backend = self.correspondence_backend,
+                    error_change_threshold = self.error_change_threshold,
+                    rotation_change_threshold = self.rotation_change_threshold,
+                    translation_change_threshold = self.translation_change_threshold,
+                    max_seconds_for_icp = self.max_seconds_for_icp,
+                    error_metric = self.error_metric,
+                    trim_fraction = self.trim_fraction,
+                    robust_weighting = self.robust_weighting,
+                    robust_weighting_scale = self.robust_weighting_scale)
+
+    def _scan_window_positions(self, image_size):
+        '''
+        Returns the number of the horizontal and the vertical positions of the scanning window
+        in an image of the given size when the window is moved by the strides.
+        '''
+        image_width, image_height = image_size
+        if image_width < self.scanning_window_width or image_height < self.scanning_window_height:
+            return 0, 0
+        return ((image_width - self.scanning_window_width) // self.scanning_window_horizontal_stride + 1,
+                (image_height - self.scanning_window_height) // self.scanning_window_vertical_stride + 1)
+
+    def _tile_boxes(self, image_size):
+        '''
+        Returns the (left, upper, right, lower) boxes of the positions of the scanning window in
+        an image of the given size, row by row, so that the index of a box in the list is the
+        index of the subimage cut out with it.  The boxes overlap when the strides are smaller
+        than the window.
+        '''
+        horizontal_positions_of_scan_window, vertical_positions_of_scan_window = self._scan_window_positions(image_size)
+        return [(x * self.scanning_window_horizontal_stride, y * self.scanning_window_vertical_stride,
+                 x * self.scanning_window_horizontal_stride + self.scanning_window_width,
+                 y * self.scanning_window_vertical_stride + self.scanning_window_height)
+                for y in range(vertical_positions_of_scan_window)
+                for x in range(horizontal_positions_of_scan_window)]
+
+    def _memory_mapped_source(self, image_file, raw_image_shape):
+        '''
+        Memory-maps the image file if it is a .npy file or a .raw file of 8-bit pixels, the
+        latter with the shape given by raw_image_shape, and returns the read-only array.  Nothing
+        is read from the disk until a subimage is sliced out of the array.  Returns None for all
+        other image files, which are opened with PIL.
+        '''
+        extension = os.path.splitext(image_file)[1].lower()
+        if extension == ".npy":
+            source = numpy.load(image_file, mmap_mode="r")
+        elif extension == ".raw":
+            if raw_image_shape is None:
+                raise ValueError("raw_image_shape must be supplied for the raw image file %s" % image_file)
+            source = numpy.memmap(image_file, dtype="uint8", mode="r", shape=tuple(raw_image_shape))
+        else:
+            return None
+        if source.dtype != numpy.uint8 or source.ndim not in (2,3) or (source.ndim == 3 and source.shape[2] != 3):
+            raise ValueError("%s must hold 8-bit pixels in an array of shape (height, width) or (height, width, 3)" % image_file)
+        return source
+
+    def _scanner_image_array(self, model_or_data):
+        '''
+        Returns an array for the model or the data image that the subimages can be sliced out
+        of as views.  For a memory-mapped image, this is the memory map itself.  Otherwise, the
+        image is decoded and converted to grayscale.
+        '''
+        source = self.model_source if model_or_data == "model" else self.data_source
+        if source is not None:
+            return source
+        im = self.model_im if model_or_data == "model" else self.data_im
+        return numpy.asarray(im.convert("L"))
+
+    def _subimage(self, model_or_data, box):
+        '''
+        Returns the subimage in the (left, upper, right, lower) box of the model or the data
+        image as a PIL image.  For a memory-mapped image, only the pixels in the box are read.
+        '''
+        source = self.model_source if model_or_data == "model" else self.data_source
+        if source is None:
+            return (self.model_im if model_or_data == "model" else self.data_im).crop(box)
+        left, upper, right, lower = box
+        return Image.fromarray(numpy.ascontiguousarray(source[upper:lower, left:right]))
+
     def _move(self, image_type):
-        self.num_remaining_pos -= 1
-        print("Creating pixel values array for local window at block index: %d" % self.block_index)
         original_im = self.model_im if image_type == 'model' else self.data_im
         scanner_dump_directory = self.scanner_dump_directory_model if image_type == 'model' else self.scanner_dump_directory_data
-        for x in range(self.x_incr * self.scanning_window_width, (self.x_incr + 1) * self.scanning_window_width):        
-            for y in range(self.y_incr * self.scanning_window_height, (self.y_incr + 1) * self.scanning_window_height):
-                r,g,b = original_im.getpixel((x,y))
-                self.array_R[y % self.scanning_window_height, x % self.scanning_window_width] = r
-                self.array_G[y % self.scanning_window_height, x % self.scanning_window_width] = g
-                self.array_B[y % self.scanning_window_height, x % self.scanning_window_width] = b
-        height,width = self.array_R.shape
-        newimage = Image.new("RGB", (width,height), (0,0,0))
-        for i in range(0, height):
-            for j in range(0, width):
-                r,g,b = self.array_R[i,j], self.array_G[i,j], self.array_B[i,j]
-                newimage.putpixel((j,i), (r,g,b))
-        newimage.save(scanner_dump_directory +  "/subimage_" + str(self.block_index) + ".jpg")
-        width,height = newimage.size
-        tk2 = Tkinter.Toplevel(takefocus = True)
-        winsize_x,winsize_y = None,None
-        screen_width,screen_height = tk2.winfo_screenwidth(),tk2.winfo_screenheight()
-        if screen_width <= screen_height:
-            winsize_x = int(0.5 * screen_width)
-            winsize_y = int(winsize_x * (height * 1.0 / width))            
-        else:
-            winsize_y = int(0.5 * screen_height)
-            winsize_x = int(winsize_y * (width * 1.0 / height))
-        display_image = newimage.resize((winsize_x,winsize_y), Image.ANTIALIAS)
-        tk2.title("scanned window")   
-        frame = Tkinter.Frame(tk2, relief=RIDGE, borderwidth=2)
-        frame.pack(fill=BOTH,expand=1)
-        photo_image = ImageTk.PhotoImage( display_image )
-        label = Tkinter.Label(frame, image=photo_image)
-        label.pack(fill=X, expand=1)
-        tk2.update()
-        print("========= done with scan window display =========")
-        response = pymsgbox.confirm("Done with viewing scan window?")
-        if response == "OK": 
-            tk2.after(10, self._callback, tk2)
-        new_posx = self.old_posx + self.delta_x
-        if new_posx + self.delta_x < int(self.image_width * self.scale_x):
-            self.canvas.move( self.rect, self.delta_x, 0)
-            self.old_posx = new_posx
-            self.x_incr += 1
-        elif self.old_posy + 2 * self.delta_y < int(self.image_height * self.scale_y):
-            self.canvas.move( self.rect, -1 * self.moves_horizontal * self.delta_x, self.delta_y ) 
-            self.old_posx = 0
-            self.x_incr = 0
-            self.old_posy += self.delta_y
-            self.y_incr += 1    
-        self.canvas.update()
-        self.block_index += 1
-        if self.num_remaining_pos > 0:
-            self._move(image_type)
+        # One pass of the loop for each position of the scanning window:
+        while self.num_remaining_pos > 0:
+            self.num_remaining_pos -= 1
+            print("Creating subimage for window position at block index: %d" % self.block_index)
+            box = (self.x_incr * self.scanning_window_width, self.y_incr * self.scanning_window_height,
+                   (self.x_incr + 1) * self.scanning_window_width, (self.y_incr + 1) * self.scanning_window_height)
+            newimage = original_im.crop(box).convert("RGB")
+            newimage.save(scanner_dump_directory +  "/subimage_" + str(self.block_index) + ".jpg")
+            width,height = newimage.size
+            tk2 = Tkinter.Toplevel(takefocus = True)
+            winsize_x,winsize_y = None,None
+            screen_width,screen_height = tk2.winfo_screenwidth(),tk2.winfo_screenheight()
+            if screen_width <= screen_height:
+                winsize_x = int(0.5 * screen_width)
+                winsize_y = int(winsize_x * (height * 1.0 / width))            
+            else:
+                winsize_y = int(0.5 * screen_height)
+                winsize_x = int(winsize_y * (width * 1.0 / height))
+            display_image = newimage.resize((winsize_x,winsize_y), Image.ANTIALIAS)
+            tk2.title("scanned window")   
+            frame = Tkinter.Frame(tk2, relief=RIDGE, borderwidth=2)
+            frame.pack(fill=BOTH,expand=1)
+            photo_image = ImageTk.PhotoImage( display_image )
+            label = Tkinter.Label(frame, image=photo_image)
+            label.pack(fill=X, expand=1)
+            tk2.update()
+            print("========= done with scan window display =========")
+            response = pymsgbox.confirm("Done with viewing scan window?")
+            if response == "OK": 
+                tk2.after(10, self._callback, tk2)
+            new_posx = self.old_posx + self.delta_x
+            if new_posx + self.delta_x < int(self.image_width * self.scale_x):
+                self.canvas.move( self.rect, self.delta_x, 0)
+                self.old_posx = new_posx
+                self.x_incr += 1
+            elif self.old_posy + 2 * self.delta_y < int(self.image_height * self.scale_y):
+                self.canvas.move( self.rect, -1 * self.moves_horizontal * self.delta_x, self.delta_y ) 
+                self.old_posx = 0
+                self.x_incr = 0
+                self.old_posy += self.delta_y
+                self.y_incr += 1    
+            self.canvas.update()
+            self.block_index += 1
 
     def _move_noninteractive(self):
         if self.block_index == 0:
             time.sleep(1)             # one second
-        self.num_remaining_pos -= 1
-        print("Creating pixel values array for local window at block index: %d" % self.block_index)
-        for x in range(self.x_incr * self.scanning_window_width, (self.x_incr + 1) * self.scanning_window_width):        
-            for y in range(self.y_incr * self.scanning_window_height, (self.y_incr + 1) * self.scanning_window_height):
-                r,g,b = self.original_im.getpixel((x,y))
-                self.array_R[y % self.scanning_window_height, x % self.scanning_window_width] = r
-                self.array_G[y % self.scanning_window_height, x % self.scanning_window_width] = g
-                self.array_B[y % self.scanning_window_height, x % self.scanning_window_width] = b
-        height,width = self.array_R.shape
-        newimage = Image.new("RGB", (width,height), (0,0,0))
-        for i in range(0, height):
-            for j in range(0, width):
-                r,g,b = self.array_R[i,j], self.array_G[i,j], self.array_B[i,j]
-                newimage.putpixel((j,i), (r,g,b))
-        newimage.save(self.scanner_dump_directory + "/subimage_" + str(self.block_index) + ".jpg")
-        new_posx = self.old_posx + self.delta_x
-        if new_posx + self.delta_x < int(self.image_width * self.scale_x):
-            self.canvas.move( self.rect, self.delta_x, 0)
-            self.old_posx = new_posx
-            self.x_incr += 1
-        elif self.old_posy + 2 * self.delta_y < int(self.image_height * self.scale_y):
-            # we need to bring the window back from the last col to the first col in the next row:
-            self.canvas.move( self.rect, -1 * self.moves_horizontal * self.delta_x, self.delta_y ) 
-            self.old_posx = 0
-            self.x_incr = 0
-            self.old_posy += self.delta_y
-            self.y_incr += 1
-        self.canvas.update()
-        self.block_index += 1
-        if self.num_remaining_pos > 0:
-            self._move_noninteractive()
+        while self.num_remaining_pos > 0:
+            self.num_remaining_pos -= 1
+            print("Creating subimage for window position at block index: %d" % self.block_index)
+            box = (self.x_incr * self.scanning_window_width, self.y_incr * self.scanning_window_height,
+                   (self.x_incr + 1) * self.scanning_window_width, (self.y_incr + 1) * self.scanning_window_height)
+            newimage = self.original_im.crop(box).convert("RGB")
+            newimage.save(self.scanner_dump_directory + "/subimage_" + str(self.block_index) + ".jpg")
+            new_posx = self.old_posx + self.delta_x
+            if new_posx + self.delta_x < int(self.image_width * self.scale_x):
+                self.canvas.move( self.rect, self.delta_x, 0)
+                self.old_posx = new_posx
+                self.x_incr += 1
+            elif self.old_posy + 2 * self.delta_y < int(self.image_height * self.scale_y):
+                # we need to bring the window back from the last col to the first col in the next row:
+                self.canvas.move( self.rect, -1 * self.moves_horizontal * self.delta_x, self.delta_y ) 
+                self.old_posx = 0
+                self.x_incr = 0
+                self.old_posy += self.delta_y
+                self.y_incr += 1
+            self.canvas.update()
+            self.block_index += 1
 
     def _callback(self,arg):
         arg.destroy()
@@ -0,0 +1,51 @@
+import math
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from PIL import ImageDraw
+
+def make_test_images():
+    # The data image is the model image rotated by 4 degrees and shifted by (28,-20) pixels:
+    for name, (dx, dy), angle in [("model.png", (0,0), 0), ("data.png", (28,-20), 4)]:
+        im = Image.new("L", (400,400), 0)
+        draw = ImageDraw.Draw(im)
+        draw.polygon([(100,100),(300,120),(280,300),(180,250),(120,310)], outline=255)
+        draw.line([(150,150),(250,200)], fill=255)
+        im = im.rotate(angle, center=(200,200))
+        im = im.transform((400,400), Image.AFFINE, (1,0,-dx,0,1,-dy))
+        im.save(name)
+
+def make_test_points():
+    '''
+    Returns 120 random model points in [0,100) x [0,100), the data points, and the
+    rotation by 4 degrees R_true and the translation T_true such that
+    R_true data + T_true = model.
+    '''
+    numpy.random.seed(1)
+    model = numpy.random.uniform(0, 100, (120,2))
+    theta = math.radians(4)
+    R_true = numpy.array([[math.cos(theta), -math.sin(theta)],[math.sin(theta), math.cos(theta)]])
+    T_true = numpy.array([3.0, -2.0])
+    return model, (model - T_true).dot(R_true), R_true, T_true
+
+class ImageTestCase(unittest.TestCase):
+    '''
+    Runs each test in a temporary directory of its own, in which make_images()
+    has written the model and the data images.
+    '''
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        self.make_images()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def make_images(self):
+        make_test_images()
@@ -1,7 +1,7 @@
-__version__ = '2.1.0'
+__version__ = '2.1.1'
 __author__  = "Avinash Kak (kak@purdue.edu)"
-__date__    = '2017-November-20'
-__url__     = 'https://engineering.purdue.edu/kak/distICP/ICP-2.1.0.html'
+__date__    = '2017-November-25'
+__url__     = 'https://engineering.purdue.edu/kak/distICP/ICP-2.1.1.html'
 __copyright__ = "(C) 2017 Avinash Kak. Python Software Foundation."
 
 __doc__ = '''
@@ -18,6 +18,14 @@ Date: ''' + __date__ + '''
 @title    
 CHANGE LOG:
 
+  Version 2.1.1:
+
+    This version fixes a bug in the newly introduced scanning mode for
+    applying the ICP algorithm to two large images.  This bug made itself
+    evident if you chopped your large images into non-square arrays of
+    subimages. I had the row and column indexing reversed in the movie
+    making part of the code for demonstrating the ICP results.
+
   Version 2.1.0: 
 
     This is a significant upgrade of the ICP module: (1) The module now
@@ -260,8 +268,25 @@ CONSTRUCTOR PARAMETERS:
     binary_or_color:     Must be set to 'binary' for binary images and to
                          'color' for grayscale and color images. (REQUIRED)
 
+    binary_subsampling:  For binary images, all the object pixels are used for
+                         ICP by default, regardless of the value of
+                         max_num_of_pixels_used_for_icp.  For binary images
+                         with a very large number of object pixels, such as
+                         rasterized Lidar maps, you can set this parameter
+                         to 'random' or 'stratified' to retain no more than
+                         max_num_of_pixels_used_for_icp of them.  With
+                         'random', the pixels are drawn at random (but
+                         repeatably).  With 'stratified', the image is
+                         divided into square cells and one pixel is kept
+                         from each occupied cell, so the retained pixels are
+                         spread evenly over the scene.  (DEFAULTS TO 'none')
+
     calculation_image_size:   The size to which a large image will be reduced
-                         for ICP processing.  (DEFAULTS TO 200)
+                         for ICP processing.  A large JPEG color image is
+                         decoded directly at a reduced resolution that is
+                         still at least three times this size, which is
+                         much faster than decoding it in full.  (DEFAULTS
+                         TO 200)
 
     corner_detection_threshold: When corner pixels are needed for ICP
                          calculations, the module uses the Harris Corner
@@ -278,14 +303,85 @@ CONSTRUCTOR PARAMETERS:
                          It must be set to either 'edges' or 'corners'. 
                          (DEFAULTS TO 'edges')
 
+    correspondence_backend: How to search for the closest model pixel for
+                         each data pixel in each ICP iteration.  It must be
+                         set to either 'brute_force' or 'kdtree'.  With
+                         'brute_force', the distance from every data pixel
+                         to every model pixel is calculated in every
+                         iteration.  With 'kdtree', a KD-tree is built just
+                         once on the model pixels at the start of icp() and
+                         all the data pixels are looked up in it in one
+                         call.  Both yield the same correspondences, but
+                         the 'kdtree' option is much faster when you set
+                         max_num_of_pixels_used_for_icp to a large value.
+                         The 'kdtree' option requires scipy. (DEFAULTS TO
+                         'brute_force')
+
     data_image:          The name of the data image file    (REQUIRED)
 
+    error_metric:        What icp() minimizes.  It must be set to either
+                         'point_to_point' or 'point_to_line'.  With
+                         'point_to_point', it is the distance between each
+                         data pixel and its closest model pixel, as
+                         explained in the THEORETICAL BASIS section.  With
+                         'point_to_line', it is the distance between each
+                         data pixel and the line through its closest model
+                         pixel that runs along the local edge there.  For
+                         edge-based ICP, the direction of the edge at a
+                         model pixel is given by the Sobel gradient
+                         computed by extract_pixels_from_color_image().
+                         In the other modes, it is estimated from the
+                         neighboring model pixels.  Point-to-line ICP
+                         usually converges in far fewer iterations for
+                         scenes dominated by straight edges such as walls.
+                         The error reported for the iterations is then the
+                         mean point-to-line distance.  (DEFAULTS TO
+                         'point_to_point')
+
+    edge_detection_low_threshold: The lower of the two hysteresis thresholds
+                         on the edge strength when thin_edges is set.
+                         (DEFAULTS TO half of edge_detection_threshold)
+
+    error_change_threshold: When set, icp() stops as soon as the relative
+                         change in the registration error from one
+                         iteration to the next falls below this value.
+                         For example, 0.01 stops the iterations when the
+                         error changes by less than 1%.  (DEFAULTS TO None,
+                         meaning that this criterion is not used)
+
+    feature_cache:       A FeatureCache instance in which the pixels extracted
+                         from color images are kept, keyed by the contents
+                         of the image and the extraction parameters.  When
+                         the same model image is registered against many
+                         data images with one cache passed to each ICP
+                         instance, the model pixels are extracted only once.
+                         See the section on headless registration below.
+                         (DEFAULTS TO None, meaning no caching)
+
     image_polarity:      When the corners_or_edges parameter is set to 'corners',
                          you must specify the image polarity.  The polarity is
                          1 if the object pixels are generally brighter than the
                          background pixels.  Otherwise, it is -1.  (REQUIRED
                          when corners_or_edges is set to "corners")
 
+    initial_pose:        A guess for the rotation and the translation of the
+                         data image with respect to the model image, such
+                         as the motion between two Lidar scans estimated
+                         from the wheel encoders.  It is given as a pair
+                         (R0, T0) with R0 a 2x2 rotation matrix or as a pair
+                         (angle, T0) with the angle in degrees, such that a
+                         data pixel x_d lands at R0 x_d + T0 in the model
+                         image.  The coordinates are those of the images
+                         used in the calculations, that is, after the
+                         images have been reduced to calculation_image_size.
+                         The guess is converted to the model-mean origin
+                         used by icp() and the iterations start from it
+                         instead of from the identity rotation and zero
+                         translation.  A good guess lets ICP cope with
+                         larger motions and cuts down on the number of
+                         iterations.  The same guess can also be passed to
+                         icp() directly.  (DEFAULTS TO None)
+
     iterations:          The maximum number of iterations to try (DEFAULTS
                          TO 24)
 
@@ -300,12 +396,70 @@ CONSTRUCTOR PARAMETERS:
                          of pixels that will be chosen for ICP calculations.
                          (DEFAULTS TO 100)
 
+    max_seconds_for_icp: When set, icp() stops after the iteration during
+                         which this many seconds of wall-clock time have
+                         elapsed.  (DEFAULTS TO None)
+
     model_image:         The name of the model image file   (REQUIRED)    
 
     pixel_correspondence_dist_threshold:  This parameter controls how far the 
                          the data image will be searched for a corresponding 
                          pixel for a model image pixel. (DEFAULTS TO 100).
 
+    prealign:            When set to 1, icp() first estimates the rotation and
+                         the translation of the data with respect to the
+                         model with the FFT-based phase correlation of the
+                         function prealign_points() and then starts the
+                         iterations from that estimate.  This removes the
+                         limitation of ICP to small rotations and shifts.
+                         It is not used when an initial_pose is supplied.
+                         (DEFAULTS TO 0)
+
+    pyramid_levels:      When set to a value L greater than 1, icp() first
+                         registers the images at L-1 coarser resolutions,
+                         each half the size of the next, before the
+                         registration at calculation_image_size.  The pixels
+                         are extracted afresh from the original images at
+                         each coarser level.  Since the value of
+                         pixel_correspondence_dist_threshold is applied in
+                         the pixels of each level, the threshold is widest
+                         at the coarsest level and shrinks by half from one
+                         level to the next when measured at the final
+                         resolution.  Each level starts from the rotation
+                         and translation found at the previous level, so
+                         larger displacements between the model and the
+                         data can be recovered.  When you also set the
+                         convergence thresholds such as
+                         error_change_threshold, the finer levels usually
+                         stop after one or two iterations.  (DEFAULTS TO 1,
+                         meaning no pyramid)
+
+    robust_weighting:    How the matched pixels are weighted in the update of
+                         R and T at each iteration.  It must be one of
+                         'none', 'huber', 'tukey', or 'cauchy'.  With
+                         'none', every data pixel that has a model pixel
+                         within pixel_correspondence_dist_threshold counts
+                         equally, so a few bad matches caused by, say, the
+                         noisy returns in Lidar data can pull the solution
+                         away from the right answer.  The other three
+                         options weight each match by the corresponding
+                         M-estimator of its residual, which is recomputed at
+                         every iteration (iteratively reweighted least
+                         squares).  Tukey weighting ignores the gross
+                         outliers altogether.  (DEFAULTS TO 'none')
+
+    robust_weighting_scale: The tuning constant in pixels for the
+                         robust_weighting option.  Residuals well below this
+                         value get a weight close to 1.  When not set, it
+                         is estimated at each iteration from the median
+                         residual.  (DEFAULTS TO None)
+
+    rotation_change_threshold: When set, icp() stops as soon as the
+                         rotation applied by an iteration is smaller than
+                         this many degrees and the translation applied is
+                         smaller than translation_change_threshold (if that
+                         is set too).  (DEFAULTS TO None)
+
     smoothing_low_medium_or_high: A useful parameter when you are applying
                          ICP to color (or grayscale) images in the "corner"
                          mode.  This parameter controls the degree of
@@ -314,6 +468,38 @@ CONSTRUCTOR PARAMETERS:
                          pixels.  Its value must be either 'low', or
                          'medium', or 'high'.  (DEFAULTS TO 'medium')
 
+    thin_edges:          When set to 1 for edge-based ICP, the edges are thinned
+                         to a width of one pixel in the manner of the Canny
+                         edge detector before the strongest edge pixels are
+                         chosen.  A pixel is kept only if its edge strength
+                         is a maximum along the direction of the gradient,
+                         and then only if its edge strength exceeds
+                         edge_detection_threshold or if it exceeds
+                         edge_detection_low_threshold and it is connected
+                         to a pixel that exceeds edge_detection_threshold.
+                         Without thinning, the edges are two to three
+                         pixels thick, so most of the pixels allowed by
+                         max_num_of_pixels_used_for_icp end up as
+                         neighbors along the strongest edges.  With
+                         thinning, the same number of pixels covers more of
+                         the scene.  The connectivity analysis uses
+                         scipy.ndimage when it is available.  (DEFAULTS TO 0)
+
+    trim_fraction:       When set to a number in (0, 1], only this fraction of
+                         the matched data pixels, those with the smallest
+                         residuals, is used for the update of R and T at
+                         each iteration.  This is known as trimmed ICP.
+                         For example, 0.8 discards the worst 20% of the
+                         matches at every iteration.  It can be combined
+                         with robust_weighting.  (DEFAULTS TO None, meaning
+                         that all the matches are used)
+
+    translation_change_threshold: When set, icp() stops as soon as the
+                         translation applied by an iteration is shorter
+                         than this many pixels and the rotation applied is
+                         smaller than rotation_change_threshold (if that is
+                         set too).  (DEFAULTS TO None)
+
     font_file:           For displaying labels on the results, the module 
                          uses the font file 'FreeSerif.ttf' by default. The 
                          module assumes that this file can be located through 
@@ -322,7 +508,9 @@ CONSTRUCTOR PARAMETERS:
                          you don't like the FreeSerif true-type font for 
                          some reason, starting with Version 2.1 you can 
                          specify your own font file through the "font_file" 
-                         constructor option.
+                         constructor option.  The font file is looked up
+                         only when the results are displayed, so the pixel
+                         extraction and the registration do not need it.
 
 @title
 METHODS:
@@ -342,7 +530,26 @@ METHODS:
 
     (3) icp() 
 
-        You must call the method icp() for the basic ICP calculations.
+        You must call the method icp() for the basic ICP calculations.  It
+        takes an optional argument initial_pose that is a guess for the
+        rotation and the translation of the data with respect to the model;
+        it has the same meaning as the constructor parameter of the same
+        name and overrides it.  The
+        model and the data pixels are held in (N,2) numpy arrays and each
+        iteration transforms, matches, and updates all of them with array
+        operations.  When the method returns, the instance attributes R and
+        T hold the final rotation and translation, R_for_iterations and
+        T_for_iterations hold their values at each iteration, and
+        error_for_iterations holds the registration error at each iteration.
+        The attribute iterations_run holds the number of iterations that
+        were actually carried out and stop_reason says why the iterations
+        stopped: 'max_iterations', 'error_converged' (see the constructor
+        parameter error_change_threshold), 'increment_converged' (see
+        rotation_change_threshold and translation_change_threshold), or
+        'time_budget' (see max_seconds_for_icp).  When pyramid_levels is
+        greater than 1, the attribute pyramid_level_results holds a tuple of
+        the calculation_image_size, the number of iterations, and the final
+        error for each of the coarser levels.
 
     (4) display_images_used_for_edge_based_icp()
         display_images_used_for_corner_based_icp()
@@ -380,6 +587,137 @@ HOW THE RESULTS ARE DISPLAYED:
     registration between the model image and the data image.
 
 
+@title
+HEADLESS REGISTRATION OF POINT ARRAYS:
+
+    If you already have the points to register, say from a lidar scan, you
+    can call the module-level function register() instead of going through
+    the ICP class:
+
+        import numpy
+        import ICP
+        result = ICP.register( model_points, data_points,
+                               iterations = 24,
+                               pixel_correspondence_dist_threshold = 20,
+                               rotation_change_threshold = 0.01,
+                               translation_change_threshold = 0.01 )
+        print(result.R, result.T, result.angle, result.error_for_iterations)
+
+    where model_points and data_points are (N,2) numpy arrays of (x,y)
+    coordinates.  The function never reads or writes any files and it does
+    not need the font file or Tkinter.  It returns an ICPResult instance
+    with the attributes R, T, angle (in degrees), model_mean,
+    error_for_iterations, iterations_run, stop_reason,
+    number_of_points_matched, and timings (wall-clock seconds).  As with
+    icp(), R and T are with respect to the model mean.  The method
+    transform_points() of the result applies the registration to points in
+    the data coordinates.  You can also supply an initial guess for the pose
+    through the init argument, either as (R0, T0) or as (angle_in_degrees,
+    T0), with R0 and T0 meaning x_m = R0 x_d + T0 in the coordinates of the
+    points.
+
+    When many data scans are to be registered against the same model, as
+    in a localization loop against a fixed map, build the model side once:
+
+        index = ICP.ModelIndex( model_points, distance_field_margin = 20 )
+        for data_points in scans:
+            result = ICP.register( index, data_points, iterations = 24,
+                                   pixel_correspondence_dist_threshold = 20 )
+
+    A ModelIndex holds the model mean, the model points with the mean
+    subtracted, the KD-tree on them, and the normals at them for the
+    point-to-line error metric, so that none of these is recomputed for
+    each scan.  With distance_field_margin, it also holds a lookup table of
+    the nearest model point over a grid of cells (of
+    distance_field_resolution pixels, 1 by default) that extends that far
+    around the model.  For pixel_correspondence_dist_threshold no larger
+    than the margin, each correspondence is then a table lookup, correct to
+    within a fraction of a cell.  The index can also be built from a model
+    image with ModelIndex.from_image(model_image, **params), where params
+    are ICP constructor parameters.  Like register(), this does not need
+    the font file.
+
+    When the rotation between the two point sets may be large, call
+
+        angle, T0 = ICP.prealign_points( model_points, data_points )
+
+    first and pass (angle, T0) as init, or just call register() with
+    prealign = 1.  The function prealign_points() rasterizes the two point
+    sets and estimates the rotation by phase correlation of the log-polar
+    resampled magnitudes of their Fourier transforms, and then the
+    translation by phase correlation of the rasters themselves.  Its cost
+    is that of a handful of FFTs and does not depend on how large the
+    rotation and the translation are.
+
+    As an alternative to ICP altogether, you can use a correlative scan
+    matcher:
+
+        matcher = ICP.CorrelativeScanMatcher( model_points, resolution = 1.0,
+                                              sigma = 2.0 )
+        match = matcher.match( data_points, translation_window = 20,
+                               angle_window = 20 )
+        print(match.angle, match.T, match.score)
+
+    The constructor turns the model points into a lookup table of the
+    likelihood of observing a point at each cell, blurred by sigma pixels,
+    together with a coarse version of the table.  The method match() then
+    searches all the rotations and translations in the given window for
+    the pose that maximizes the likelihood of the data points, using the
+    coarse table to prune the search before refining with the fine table.
+    Since the search is exhaustive, it cannot be trapped by a local minimum
+    the way ICP can, and its cost does not depend on the data.  The matcher
+    can be reused for any number of scans against the same model, and the
+    pair (match.angle, match.T) can be given to register() as init to
+    polish the result.  With an instance of the ICP class, the model and
+    the data points are in the attributes model_list and data_list after
+    the pixel extraction.
+
+    The segmentation of the object pixels from the background used for
+    corner-based ICP is also available by itself:
+
+        segmentation, threshold = ICP.otsu_segmentation( image, image_polarity,
+                                                         "medium" )
+
+    where image is a PIL image.  It smooths the image, thresholds it at the
+    Otsu threshold, and returns the binary segmentation image and the
+    threshold.  The results for the most recently segmented images are
+    cached by the contents of the image, so segmenting the same image again
+    costs only the computation of a hash.
+
+    Likewise, the extraction of the edge pixels for edge-based ICP is
+    available as
+
+        pixels, edge_strength, dx, dy = ICP.edge_pixels( gray, 50, 100 )
+
+    where gray is a 2D numpy array of the gray levels of an image, 50 is
+    the edge_detection_threshold and 100 the maximum number of pixels
+    retained.  It returns the (i,j) coordinates of the strongest edge
+    pixels as an (N,2) integer array, together with the edge strength and
+    the Sobel derivatives over the image.  With thin_edges = 1, only the
+    pixels on the thinned edges are retained, as with the constructor
+    option of the same name.
+
+    The same idea applies to all of the pixel extraction for color images
+    when you register a fixed model image against many data images:
+
+        cache = ICP.FeatureCache( max_entries = 16, directory = "feature_cache" )
+        for data_image in data_images:
+            icp = ICP.ICP( model_image = "map.jpg", data_image = data_image,
+                           feature_cache = cache, ... )
+            icp.extract_pixels_from_color_image("model")
+            icp.extract_pixels_from_color_image("data")
+            icp.icp()
+
+    The first call to extract_pixels_from_color_image("model") computes the
+    pixels and stores them, together with the edge map or the corner
+    response and the segmentation, under a hash of the model image and the
+    extraction parameters.  Later calls with the same image and parameters
+    find them in the cache.  At most max_entries entries are kept in memory
+    and the least recently used are evicted first.  When directory is
+    given, the entries are also saved there as .npz files, so that other
+    processes and later runs can use them too.
+
+
 @title
 THE EXAMPLES DIRECTORY:
 
@@ -398,12 +736,12 @@ THE EXAMPLES DIRECTORY:
             This script shows registration results with edge-based ICP on
             overhead photos of a highway interchange.
 
-    3.   color_image_registration_with_edge_pixels_example3.py 
+    3.  color_image_registration_with_edge_pixels_example3.py 
 
             This script shows registration results on a pair of generic
             images with square blocks.
 
-    4.   color_image_registration_with_corner_pixels_example1.py
+    4.  color_image_registration_with_corner_pixels_example1.py
 
             This script shows registration results with corner-pixels based
             ICP on two photos of my wife's earrings.  The model photo is
@@ -411,12 +749,12 @@ THE EXAMPLES DIRECTORY:
             the best of what I can tell, there are no copyright issues
             related to the use of this photo here.
 
-    5.   binary_image_registration_example1.py
+    5.  binary_image_registration_example1.py
 
             This is an example of registering two binary images of a
             triangular shape.
 
-    6.   binary_image_registration_example2.py
+    6.  binary_image_registration_example2.py
 
             This is another example of binary image registration that only
             involves a single straight line in the images.
@@ -601,6 +939,29 @@ THEORETICAL BASIS:
 
     STEP 12:    Back to Step 3
 
+    When the constructor parameter error_metric is set to 'point_to_line',
+    what is minimized in each iteration is the distance of each moved data
+    point p = R x_d + T from the line through its model correspondent x_m
+    whose normal is n:
+
+         e  =  (p - x_m)^t . n
+
+    For a small rotation by the angle a and a translation t applied on top
+    of the current R and T, the moved point becomes p + a (-p_y, p_x) + t,
+    which makes e linear in (a, t_x, t_y):
+
+         e  =  (p - x_m)^t . n  +  a (p_x n_y - p_y n_x)  +  t^t . n
+
+    Setting e to zero for all the matched points gives an overdetermined
+    linear system in (a, t_x, t_y) that is solved in the least-squares
+    sense.  The iteration then updates
+
+         R  =  R(a) . R             T  =  R(a) . T  +  t
+
+    For edge-based ICP, the normal n at a model pixel is the direction of
+    the Sobel gradient there.  Otherwise, it is the direction of least
+    spread of the five model pixels closest to x_m.
+
 
 @title
 THE ICPImageScanner CLASS:
@@ -628,6 +989,8 @@ THE ICPImageScanner CLASS:
             scanner = ICPImageScanner.ICPImageScanner(
                            model_image_file = model_image_file,
                            data_image_file = data_image_file,
+                           calculation_image_size = 200,
+                           max_num_of_pixels_used_for_icp = 300, 
                            binary_or_color = "color",
                            corners_or_edges = "edges",
                            scanning_window_width = 250,
@@ -637,7 +1000,10 @@ THE ICPImageScanner CLASS:
     
     The code shown above will deposit the subimages into two scanner dump
     directories, one for the model and the other for the data, whose names
-    are keyed to the names of the image files.  Subsequently, you can test
+    are keyed to the names of the image files.  On a machine without a
+    display, or when you don't need to look at each subimage, call
+    chop_model_and_data_images_into_tiles() instead.  It creates the same
+    dump directories without any GUI.  Subsequently, you can test
     the application of the ICP algorithm to just one pair of corresponding
     subimages through the following constructor call and the invocation
     shown below that:
@@ -721,6 +1087,26 @@ CONSTRUCTOR PARAMETERS OF THE ICPImageScanner CLASS:
                     registration on just a pair of subimages extracted from
                     the original model and the data images.
 
+                    For very large images, either of the two image files
+                    can also be a .npy file or a .raw file of 8-bit pixels
+                    in an array of shape (height, width) or (height, width,
+                    3).  Such files are memory-mapped rather than read into
+                    the memory, and the pixels inside a scanning window are
+                    read from the disk only when the subimage is needed.
+                    This bounds the memory used for the images by the
+                    tiling and the registration methods.  The displacement
+                    field and the warped data image cover the whole model
+                    image, so they are kept within a bounded memory only
+                    when they are written to files (see the fourth and the
+                    thirteenth methods listed below).  The methods that
+                    display the original images require regular image
+                    files.
+
+    raw_image_shape: The shape, (height, width) or (height, width, 3), of
+                    the pixel arrays in the .raw image files.  It must be
+                    supplied when the model or the data image file is a
+                    .raw file.
+
     binary_or_color: For now you must set it to 'color' for grayscale and
                     color images. (I have not yet allowed for 'binary" in
                     the ICPImageScanner class.  Will add that functionality
@@ -741,10 +1127,17 @@ CONSTRUCTOR PARAMETERS OF THE ICPImageScanner CLASS:
     pixel_correspondence_dist_threshold: The value of this parameter is
                     passed to the parent instance of the ICP class.  See
                     the documentation on this parameter as presented
-                    earlier in the context of the ICP class.
+                    earlier in the context of the ICP class.  For the
+                    scanner, it defaults to 20.
  
     iterations: The maximum number of iterations to try for ICP based
-                    registration.
+                    registration.  It defaults to 24.
+
+    Any other parameters of the ICP class that control the registration,
+    such as correspondence_backend, the convergence thresholds,
+    error_metric, trim_fraction, and robust_weighting, are used for the
+    registration of every pair of subimages, whether the pairs come from
+    the scanner dumps or are registered in memory.
 
     scanning_window_width: As should be obvious by its name, this parameter
                     specifies the width of the scanning window for chopping
@@ -754,34 +1147,97 @@ CONSTRUCTOR PARAMETERS OF THE ICPImageScanner CLASS:
                     specifies the height of the scanning window for
                     chopping a large image into subimages.
 
+    scanning_window_horizontal_stride: This parameter specifies by how many
+                    pixels the scanning window is moved horizontally from
+                    one position to the next.  It defaults to the width of
+                    the scanning window, which gives you non-overlapping
+                    subimages.  With a smaller stride, the subimages
+                    overlap and the displacement field calculated from
+                    their registrations is smoother.  Other strides than
+                    the window size are not supported by
+                    chop_model_and_data_images_into_tiles_interactive(),
+                    which raises a ValueError for them.
+
+    scanning_window_vertical_stride: As with the previous entry, but for
+                    the vertical movement of the scanning window.  It
+                    defaults to the height of the scanning window.
+
             
 @title
 PUBLIC METHODS OF THE ICPImageScanner CLASS:
 
-    (1) apply_icp_to_model_and_data_scanner_dumps_and_show_intermediate_results()
+    (1) apply_icp_to_model_and_data_images_in_memory()
+
+        This method registers all of the corresponding pairs of subimages
+        without going through the scanner dump directories.  The model and
+        the data images are converted to grayscale arrays once, each
+        subimage is a numpy view into one of these arrays, and the pixels
+        extracted from each pair go straight to the register() function.
+        Nothing is written to the disk, so the subimages are not subject to
+        JPEG compression artifacts either.  When the images are supplied as
+        memory-mapped .npy or .raw files, the subimages are views into the
+        memory maps and only the pixels inside the scanning window are read
+        from the disk for each pair, so the memory used for the images does
+        not grow with their size.  The results are stored in the list
+        subimage_results, as for the third method below, and the
+        registrations are carried out with the same parameters.  Since this
+        method does not create the intermediate results needed for the
+        movies, the display methods listed below cannot be used with it.
+
+
+    (2) apply_icp_to_model_and_data_scanner_dumps_and_show_intermediate_results()
 
         The purpose of this method is to apply the ICP algorithm to ALL the
         subimage pairs extracted from the supplied model and data images.
-        The scanning function (see the fifth method listed below) in the
-        ICPImageScanner class creates two dump directories containing the
-        subimages, one for the model image and the other for the data
-        image.  See the script
+        The scanning functions (see the seventh and the eighth methods listed
+        below) in the ICPImageScanner class create two dump directories
+        containing the subimages, one for the model image and the other for
+        the data image.  See the script
         "ICPforScannerDump_show_intermediate_results.py" in the
         ExamplesICPImageScanner directory that illustrates how you can
         invoke this method.
  
 
-    (2) apply_icp_to_model_and_data_scanner_dumps_fast():
+    (3) apply_icp_to_model_and_data_scanner_dumps_fast( processes = None ):
 
         This is a faster version of the previous method.  It is faster
         because it does not show ICP registration results separately for
         each pair of subimages.  See the script
         "ICPforScannerDump_no_intermediate_results.py" in the
         ExamplesICPImageScanner directory that illustrates how you can use
-        this method.
-
-
-    (3) calculate_icp_for_one_pair_of_subimages_and_display_results()
+        this method.  Since the subimage pairs are registered independently
+        of one another, you can have them registered in parallel by setting
+        processes to the number of worker processes to use.  Each worker
+        does its work in a scratch directory of its own, so the workers do
+        not trip over one another's intermediate files.  Either way, the
+        rotation, the translation, and the registration errors for each
+        subimage pair are stored as an ICPResult in the list
+        subimage_results of the scanner, at the index of the pair.
+
+
+    (4) calculate_displacement_field( field_file = None )
+
+        After the subimage pairs have been registered by one of the first
+        three methods, this method turns the rotation and the translation
+        found for each pair into a dense displacement field over the whole
+        model image.  The field is a float32 numpy array of shape (height,
+        width, 2) such that the model pixel at (x,y) corresponds to the
+        data pixel at (x + field[y,x,0], y + field[y,x,1]).  Where the
+        scanning windows overlap, the displacements of the overlapping
+        windows are blended with weights that fall off linearly from the
+        center of each window, so that with strides smaller than the window
+        the field varies smoothly over the image.  Pixels not covered by
+        any successfully registered window get zero displacement.  The
+        field is put together in bands of rows, so that apart from the 8
+        bytes per pixel of the field itself, the memory used is bounded by
+        the size of a band.  For images too large for the field to fit into
+        the memory, you can supply the name of a .npy file as field_file.
+        The field is then written into that file band by band and it is
+        returned as a memory map of the file.  The field is returned and
+        also stored in the attribute displacement_field of the scanner.
+
+
+    (5) calculate_icp_for_one_pair_of_subimages_and_display_results()
 
         If you want to carry out ICP registration only for a specific pair
         of subimages, then this is the method to invoke.  Note that the
@@ -798,15 +1254,26 @@ PUBLIC METHODS OF THE ICPImageScanner CLASS:
         ExamplesICPImageScanner directory for how to use this method.
 
 
-    (4) calculate_icp_for_one_pair_of_subimages_fast()
+    (6) calculate_icp_for_one_pair_of_subimages_fast()
 
         This is a faster version of the previous method.  It is faster
         because it does not create visual representations of ICP
-        registration.  In the current code, it is called by the second
+        registration.  In the current code, it is called by the third
         method listed above.
 
 
-    (5) chop_model_and_data_images_into_tiles_interactive():
+    (7) chop_model_and_data_images_into_tiles():
+
+        This method chops the model and the data images into subimages and
+        dumps them into the same directories as the next method, but
+        without any interaction with the user and without needing Tkinter.
+        The subimages are cut out with Image.crop() in a loop over the
+        positions of the scanning window, so even very large images are
+        chopped quickly.  The method returns a tuple of the number of
+        subimages in the model dump and the number in the data dump.
+
+
+    (8) chop_model_and_data_images_into_tiles_interactive():
 
         This is the method to call for chopping your model and data images
         into subimages.  The subimages are dumped in two separate
@@ -816,7 +1283,7 @@ PUBLIC METHODS OF THE ICPImageScanner CLASS:
         ExamplesICPImageScanner directory for how to invoke this method.
 
 
-    (6) cleanup_scanner_examples_directory():
+    (9) cleanup_scanner_examples_directory():
 
         Several of the methods listed here create directories for the
         intermediate results that are subsequently used for a "movie"
@@ -827,18 +1294,18 @@ PUBLIC METHODS OF THE ICPImageScanner CLASS:
         method.
       
 
-    (7) display_subimage_pair_used_for_edge_based_icp():
+    (10) display_subimage_pair_used_for_edge_based_icp():
 
         If you are working with just one pair of corresponding subimages in
         the two scanner dump directories and you want to display the
         subimages, the edges extracted from them, and the pixels retained
         for ICP registration, this is the method you want to invoke.  In
-        the current code, this functionality is called by the third method
+        the current code, this functionality is called by the fifth method
         listed above for displaying the intermediate results on individual
         pairs of subimages.
 
 
-    (8) display_results_for_all_subimage_pairs_together_as_a_movie():
+    (11) display_results_for_all_subimage_pairs_together_as_a_movie():
 
         This method displays ICP registration for ALL the subimages in the
         form of a composite "movie".  You should invoke this method only if
@@ -852,7 +1319,7 @@ PUBLIC METHODS OF THE ICPImageScanner CLASS:
         presenting the results in the form of a a movie.
 
 
-    (9) display_results_for_all_subimage_pairs_together_as_a_movie_with_colorization():
+    (12) display_results_for_all_subimage_pairs_together_as_a_movie_with_colorization():
 
         If you have opted for the fast (meaning no display of intermediate
         results) methods for ICP registration of the corresponding
@@ -865,6 +1332,24 @@ PUBLIC METHODS OF THE ICPImageScanner CLASS:
         presenting the results in the form of a composite movie.
 
 
+    (13) warp_data_image( displacement_field = None, output_file = None ):
+
+        This method warps the whole data image into the frame of the model
+        image with the dense displacement field returned by the fourth
+        method listed above.  If you do not supply a field, the method uses
+        the one stored in the scanner, calculating it first if necessary.
+        The remapping is bilinear and is carried out with vectorized numpy
+        operations in bands of rows, so that apart from the data image and
+        the warped image, the memory used is bounded by the size of a
+        band.  The warped image is returned as a PIL image.  If you supply
+        the name of a .npy file as output_file, the warped image is instead
+        written into that file band by band and returned as a memory map
+        of the file.  When the data image is a memory-mapped .npy or .raw
+        file as well and the field is kept in a file, only the pixels a
+        band maps to are read, so the warp then needs no more memory than
+        a band.
+
+
 @title
 THE ExamplesICPImageScanner DIRECTORY:
 
@@ -988,21 +1473,38 @@ from PIL import ImageFilter
 from PIL import ImageFont
 from PIL import ImageDraw
 from PIL import ImageChops
-from PIL import ImageTk
 import numpy
 import numpy.linalg
 import math
-import re
 import sys, os, os.path, glob
 import functools
+import time
+import copy
+import hashlib
+import collections
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+try:
+    from scipy import ndimage
+except ImportError:
+    ndimage = None
 try:        # for Python3
     import tkinter as Tkinter
     from tkinter.constants import *
     import tkinter.font as tkFont
 except:     # for Python 2
-    import Tkinter
-    from Tkconstants import *
-    import tkFont
+    try:
+        import Tkinter
+        from Tkconstants import *
+        import tkFont
+    except ImportError:     # no Tk: only the headless register() can be used
+        Tkinter = tkFont = None
+try:
+    from PIL import ImageTk
+except ImportError:
+    ImageTk = None
 
 #---------------------------------------- Support Functions ---------------------------------------
 def _euclidean(p, q):
@@ -1065,6 +1567,1193 @@ def _least_dist_mapping(data_dict, model_dict, dist_threshold):
                 break;
     return mapping, error_dict
 
+#---------------------------------- Array-Based Pixel Extraction ----------------------------------
+def _sobel_gradients(gray):
+    '''
+    Returns the horizontal and the vertical Sobel derivatives dx and dy of
+    the 2D array gray, with the first index along the rows of the image.
+    As in the rest of the module, the derivatives are left at zero within
+    3 pixels of the image border.
+    '''
+    height, width = gray.shape
+    dx = numpy.zeros((height, width), dtype="float")
+    dy = numpy.zeros((height, width), dtype="float")
+    if width < 7 or height < 7: return dx, dy
+    # The neighbors of the interior pixels (j,i) with 3 <= i < width-3 and 3 <= j < height-3:
+    def shifted(dj, di):
+        return gray[3+dj:height-3+dj, 3+di:width-3+di]
+    dx[3:height-3,3:width-3] = (shifted(-1,1) + 2*shifted(0,1) + shifted(1,1)) - \
+                               (shifted(-1,-1) + 2*shifted(0,-1) + shifted(1,-1))
+    dy[3:height-3,3:width-3] = (shifted(1,-1) + 2*shifted(1,0) + shifted(1,1)) - \
+                               (shifted(-1,-1) + 2*shifted(-1,0) + shifted(-1,1))
+    return dx, dy
+
+def _strongest_pixels(values, threshold, max_num_of_pixels):
+    '''
+    Returns an (N,2) integer array of the (i,j) image coordinates of the at
+    most max_num_of_pixels elements of the 2D array values that exceed
+    threshold, in the order of decreasing value.  Ties are broken by i and
+    then by j.  Only the candidates that can make the cut are fully sorted.
+    '''
+    cols, rows = numpy.nonzero(values.T > threshold)
+    selected = values[rows, cols]
+    if len(selected) > max_num_of_pixels:
+        # Everything tied with the value at the cut is kept for the sort below:
+        cutoff = -numpy.partition(-selected, max_num_of_pixels - 1)[max_num_of_pixels - 1]
+        keep = selected >= cutoff
+        cols, rows, selected = cols[keep], rows[keep], selected[keep]
+    # Since the candidates are in the order of i and then j, sorting on the position breaks the ties:
+    order = numpy.lexsort((numpy.arange(len(selected)), -selected))[:max_num_of_pixels]
+    return numpy.column_stack((cols[order], rows[order])).astype("int")
+
+def _binary_image_pixels(binary, border=3):
+    '''
+    Returns an (N,2) integer array of the (i,j) image coordinates of the
+    nonzero elements of the 2D array binary, leaving out those within
+    border pixels of the edges of the image, ordered by i and then by j.
+    '''
+    height, width = binary.shape
+    inside = numpy.zeros((height, width), dtype="bool")
+    inside[border:height-border, border:width-border] = True
+    cols, rows = numpy.nonzero((numpy.asarray(binary) != 0).T & inside.T)
+    return numpy.column_stack((cols, rows)).astype("int")
+
+def _subsample_pixels(pixels, max_num_of_pixels, method="random"):
+    '''
+    Returns at most max_num_of_pixels rows of the (N,2) array pixels, in
+    their original order.  With method 'random', they are drawn at random,
+    with a fixed seed so that the result is repeatable.  With method
+    'stratified', the image is divided into square cells of the smallest
+    size for which no more than max_num_of_pixels cells are occupied, and
+    the first pixel of each occupied cell is kept, so the retained pixels
+    are spread evenly over the scene regardless of its local density.
+    '''
+    if len(pixels) <= max_num_of_pixels: return pixels
+    if method == "random":
+        chosen = numpy.random.RandomState(0).choice(len(pixels), max_num_of_pixels, replace=False)
+        return pixels[numpy.sort(chosen)]
+    if method != "stratified":
+        raise ValueError('''The subsampling method must be either "random" or "stratified"''')
+    low, high = 1, int(pixels.max()) + 1                 # a single cell of size high holds everything
+    while low < high:
+        cell_size = (low + high) // 2
+        cells = numpy.unique(pixels // cell_size, axis=0)
+        if len(cells) <= max_num_of_pixels:
+            high = cell_size
+        else:
+            low = cell_size + 1
+    cells = pixels // low
+    unused, first = numpy.unique(cells, axis=0, return_index=True)
+    return pixels[numpy.sort(first)]
+
+def _thin_edges(dx, dy, edge_strength, low_threshold, high_threshold):
+    '''
+    Canny-style edge thinning.  An edge pixel is first retained only if its
+    edge strength is no smaller than that of its two neighbors along the
+    direction of the gradient, with the direction quantized to 0, 45, 90,
+    or 135 degrees.  Of the retained pixels, those stronger than
+    high_threshold are kept along with those stronger than low_threshold
+    that are connected to them through other such pixels (hysteresis).
+    Returns the boolean array of the edge pixels that survive.
+    '''
+    height, width = edge_strength.shape
+    padded = numpy.zeros((height + 2, width + 2), dtype="float")
+    padded[1:-1,1:-1] = edge_strength
+    def neighbor(dj, di):
+        return padded[1+dj:1+dj+height, 1+di:1+di+width]
+    # The gradient direction modulo 180 degrees, in the image coordinates with j pointing down:
+    direction = (numpy.round(numpy.degrees(numpy.arctan2(dy, dx)) / 45.0).astype(int)) % 4
+    is_maximum = numpy.zeros((height, width), dtype="bool")
+    for sector, (dj, di) in enumerate([(0,1), (1,1), (1,0), (1,-1)]):
+        in_sector = direction == sector
+        # A plateau two pixels wide keeps only its first pixel:
+        is_maximum |= in_sector & (edge_strength >= neighbor(dj, di)) & (edge_strength > neighbor(-dj, -di))
+    weak = is_maximum & (edge_strength > low_threshold)
+    strong = weak & (edge_strength > high_threshold)
+    if ndimage is not None:
+        labels, num_labels = ndimage.label(weak, structure=numpy.ones((3,3)))
+        connected_to_strong = numpy.zeros(num_labels + 1, dtype="bool")
+        connected_to_strong[labels[strong]] = True
+        connected_to_strong[0] = False
+        return connected_to_strong[labels]
+    # Without scipy, the strong pixels are grown into the weak pixels one step at a time:
+    edges = strong
+    while True:
+        grown = numpy.zeros((height + 2, width + 2), dtype="bool")
+        for dj in (-1, 0, 1):
+            for di in (-1, 0, 1):
+                grown[1+dj:1+dj+height, 1+di:1+di+width] |= edges
+        grown = grown[1:-1,1:-1] & weak
+        if numpy.array_equal(grown, edges): return edges
+        edges = grown
+
+def _box_sum(values, radius):
+    '''
+    Returns the sum of the 2D array values over the (2*radius+1) x
+    (2*radius+1) window centered at each element, with zeros beyond the
+    borders of the array.  The sums are computed with cumulative sums, so
+    the cost does not depend on the window size.
+    '''
+    height, width = values.shape
+    padded = numpy.zeros((height + 2*radius + 1, width + 2*radius + 1), dtype=values.dtype)
+    padded[radius+1:radius+1+height, radius+1:radius+1+width] = values
+    integral = padded.cumsum(axis=0).cumsum(axis=1)
+    size = 2*radius + 1
+    return integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size] + integral[:-size, :-size]
+
+def _otsu_threshold(histogram, coarseness=8):
+    '''
+    Returns the gray level that maximizes the ratio of the between-class to
+    the within-class variance for the 256-bin histogram of an image, with
+    the gray levels grouped into bins of coarseness levels.  The class
+    probabilities and first moments for all the candidate thresholds are
+    obtained with cumulative sums.
+    '''
+    hist = numpy.asarray(histogram[:256], dtype="int64")
+    probs = hist.reshape(-1, coarseness).sum(axis=1) / float(hist.sum())
+    prob_times_graylevel = coarseness * numpy.arange(len(probs)) * probs
+    mu_T = prob_times_graylevel.cumsum()[-1]                             # mean for the image
+    sigma_squared_T = ((coarseness * numpy.arange(len(probs)) - mu_T)**2 * probs).cumsum()[-1]
+    m0 = probs.cumsum()
+    m1 = prob_times_graylevel.cumsum()
+    valid = (m0 > 0) & (m0 < 1.0)
+    if not numpy.any(valid): return 0
+    variance_ratio = numpy.full(len(probs), -numpy.inf)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        sigmaB_squared = (mu_T * m0[valid] - m1[valid])**2 / (m0[valid] * (1.0 - m0[valid]))
+        variance_ratio[valid] = sigmaB_squared / (sigma_squared_T - sigmaB_squared)
+    return int(numpy.nanargmax(variance_ratio)) * coarseness
+
+def edge_pixels(gray, edge_detection_threshold, max_num_of_pixels, thin_edges=0, 
+                edge_detection_low_threshold=None):
+    '''
+    Extracts the pixels for edge-based ICP from the 2D array gray of the gray
+    levels of an image.  Returns an (N,2) integer array of the (i,j) image
+    coordinates of the at most max_num_of_pixels pixels of the strongest
+    edges above edge_detection_threshold, in the order of decreasing
+    strength, together with the edge strength and the Sobel derivatives dx
+    and dy as 2D arrays.  With thin_edges, the edges are first thinned by
+    non-maximum suppression and hysteresis between
+    edge_detection_low_threshold, which defaults to half of
+    edge_detection_threshold, and edge_detection_threshold.
+    '''
+    dx, dy = _sobel_gradients(numpy.asarray(gray, dtype="float"))
+    edge_strength = numpy.sqrt(dx**2 + dy**2)
+    if thin_edges:
+        # Only the pixels on the thinned edges compete for the places in the point set:
+        if edge_detection_low_threshold is None: edge_detection_low_threshold = edge_detection_threshold / 2.0
+        is_edge = _thin_edges(dx, dy, edge_strength, edge_detection_low_threshold, edge_detection_threshold)
+        pixels = _strongest_pixels(numpy.where(is_edge, edge_strength, -numpy.inf), -numpy.inf, 
+                                   max_num_of_pixels)
+    else:
+        pixels = _strongest_pixels(edge_strength, edge_detection_threshold, max_num_of_pixels)
+    return pixels, edge_strength, dx, dy
+
+_segmentation_cache = collections.OrderedDict()
+_SEGMENTATION_CACHE_SIZE = 16
+
+def otsu_segmentation(im, image_polarity, smoothing_low_medium_or_high="medium"):
+    '''
+    Segments the object pixels from the background pixels of the grayscale
+    image im as needed for corner-based ICP.  The image is smoothed by
+    repeated blurring, the amount of which is controlled by
+    smoothing_low_medium_or_high, and then thresholded at the Otsu threshold
+    of the smoothed image.  With image_polarity 1, the object pixels are
+    those brighter than the threshold, and with image_polarity -1, those
+    darker.  Returns the segmentation as a binary image with the object
+    pixels set to 255, and the threshold.  Since the result depends only on
+    the image and the two parameters, the results for the most recent
+    images are cached, keyed by a hash of the image contents, so that the
+    same image is not segmented twice.
+    '''
+    how_much_smoothing = {"low" : 1, "medium" : 5, "high" : 10}.get(smoothing_low_medium_or_high)
+    if how_much_smoothing is None:
+        raise ValueError('''smoothing_low_medium_or_high must be either "low", or "medium", or "high"''')
+    if image_polarity not in (1, -1):
+        raise ValueError("image_polarity must be 1 or -1")
+    im = im.convert("L")
+    key = (hashlib.sha1(im.tobytes()).hexdigest(), im.size, image_polarity, how_much_smoothing)
+    if key in _segmentation_cache:
+        _segmentation_cache[key] = _segmentation_cache.pop(key)          # most recently used goes last
+        segmentation, otsu_threshold = _segmentation_cache[key]
+        return segmentation.copy(), otsu_threshold
+    smoothed = im
+    for i in range(how_much_smoothing):
+        smoothed = smoothed.filter(ImageFilter.BLUR) 
+    otsu_threshold = _otsu_threshold(smoothed.histogram())
+    gray = numpy.asarray(smoothed, dtype="uint8")
+    is_object = gray > otsu_threshold if image_polarity == 1 else gray < otsu_threshold
+    segmentation = Image.fromarray(numpy.where(is_object, 255, 0).astype("uint8"), "L").convert("1")
+    _segmentation_cache[key] = (segmentation, otsu_threshold)
+    while len(_segmentation_cache) > _SEGMENTATION_CACHE_SIZE:
+        _segmentation_cache.popitem(last=False)
+    return segmentation.copy(), otsu_threshold
+
+def _corner_response(dx, dy, mask, radius=2):
+    '''
+    Returns the corner response det(C) / trace(C)^2 at every pixel where
+    mask is true, with C the structure tensor formed by summing dx^2, dx dy
+    and dy^2 over the (2*radius+1) x (2*radius+1) window around the pixel.
+    The response is zero elsewhere, where the trace is zero, and within 3
+    pixels of the border of the image.
+    '''
+    c11 = _box_sum(dx * dx, radius)
+    c12 = _box_sum(dx * dy, radius)
+    c22 = _box_sum(dy * dy, radius)
+    determinant = c11 * c22 - c12 * c12
+    trace = c11 + c22
+    valid = mask & (trace != 0)
+    valid[:3,:] = valid[-3:,:] = False
+    valid[:,:3] = valid[:,-3:] = False
+    rval = numpy.zeros(dx.shape, dtype="float")
+    rval[valid] = determinant[valid] / (trace[valid] * trace[valid])
+    return rval
+
+def _non_maximum_corners(rval, is_corner, max_num_of_corners):
+    '''
+    Carries out the non-maximum suppression of the corners, i.e., the
+    pixels where the boolean array is_corner is true: a corner survives only
+    if its value in rval is strictly larger than the values of all the other
+    corners in its 3x3 neighborhood.  Returns the (i,j) coordinates of at
+    most max_num_of_corners surviving corners in the order of decreasing
+    rval, with ties broken by i and then by j.
+    '''
+    height, width = rval.shape
+    corner_values = numpy.full((height + 2, width + 2), -numpy.inf)
+    corner_values[1:-1,1:-1] = numpy.where(is_corner, rval, -numpy.inf)
+    neighbor_max = numpy.full((height, width), -numpy.inf)
+    for dj in (-1, 0, 1):
+        for di in (-1, 0, 1):
+            if dj == 0 and di == 0: continue
+            neighbor_max = numpy.maximum(neighbor_max, corner_values[1+dj:1+dj+height, 1+di:1+di+width])
+    pixels = _strongest_pixels(numpy.where(is_corner & (rval > neighbor_max), rval, -numpy.inf),
+                               -numpy.inf, max_num_of_corners)
+    return [tuple(pixel) for pixel in pixels.tolist()]
+
+#----------------------------------------- Feature Cache ------------------------------------------
+class FeatureCache(object):
+    '''
+    A cache for the pixels extracted from color images by ICP, for when the
+    same model image is registered against many data images.  An entry is
+    keyed by a hash of the image contents and of the parameters that
+    control the extraction, so a changed image or a changed parameter
+    simply misses.  An entry holds the extracted pixel list together with
+    the edge map, the normals, the corner response rval, and the
+    segmentation, whichever the extraction mode produced, as a dict of
+    numpy arrays.
+
+    At most max_entries entries are kept in memory, the least recently used
+    being evicted first.  When directory is given, every entry is also
+    written there as a .npz file named after its key, and entries that are
+    not in memory are looked up there, so the cache survives across
+    processes.  The attributes hits and misses count the lookups.  Pass the
+    cache to the ICP constructor through the feature_cache option.
+    '''
+    def __init__(self, max_entries=16, directory=None):
+        if int(max_entries) != max_entries or max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+        self.max_entries = int(max_entries)
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, im, params):
+        '''
+        Returns the key for the PIL image im extracted with the parameters
+        in the dict params.
+        '''
+        sha1 = hashlib.sha1()
+        sha1.update(("%s %s %s" % (im.mode, im.size, sorted(params.items()))).encode("utf-8"))
+        sha1.update(im.tobytes())
+        return sha1.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        '''
+        Returns the features stored under key, or None.
+        '''
+        if key in self.entries:
+            self.entries[key] = self.entries.pop(key)                   # most recently used goes last
+            self.hits += 1
+            return self.entries[key]
+        if self.directory is not None and os.path.isfile(self._path(key)):
+            with numpy.load(self._path(key)) as stored:
+                features = dict((name, stored[name]) for name in stored.files)
+            self._remember(key, features)
+            self.hits += 1
+            return features
+        self.misses += 1
+        return None
+
+    def put(self, key, features):
+        '''
+        Stores the dict of numpy arrays features under key.
+        '''
+        self._remember(key, features)
+        if self.directory is not None:
+            numpy.savez(self._path(key), **features)
+
+    def _remember(self, key, features):
+        self.entries[key] = features
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        '''
+        Empties the in-memory part of the cache.  The .npz files are left alone.
+        '''
+        self.entries.clear()
+
+#------------------------------------- Array-Based ICP Kernel -------------------------------------
+class _NearestModelPointField(object):
+    '''
+    A lookup table, over a grid of cells of the given resolution covering
+    the model points and a margin around them, of the index of the model
+    point nearest to the center of each cell, or -1 for the cells farther
+    than margin from every model point.  Looking up the cell of a point is
+    much faster than a KD-tree search, at the cost of the correspondent
+    found being the nearest model point to the center of the cell, which
+    may not be the nearest to the point itself.
+    '''
+    def __init__(self, model, margin, resolution=1.0, model_tree=None):
+        self.resolution = float(resolution)
+        self.margin = float(margin)
+        self.origin = model.min(axis=0) - self.margin
+        num_cols, num_rows = (numpy.ceil((model.max(axis=0) + self.margin - self.origin) / self.resolution)
+                                                                                       .astype(int) + 1)
+        cols, rows = numpy.meshgrid(numpy.arange(num_cols), numpy.arange(num_rows))
+        centers = self.origin + (numpy.column_stack((cols.ravel(), rows.ravel())) + 0.5) * self.resolution
+        indexes, dists = _closest_model_points(centers, model, numpy.inf, model_tree)
+        indexes[dists > self.margin + self.resolution] = -1
+        self.indexes = indexes.reshape(num_rows, num_cols)
+
+    def closest(self, points, model):
+        '''
+        Returns the index of the model point looked up for each row of the
+        (N,2) array points and the distance to it, with -1 and inf for the
+        points outside the table.
+        '''
+        cells = numpy.floor((points - self.origin) / self.resolution).astype(int)
+        num_rows, num_cols = self.indexes.shape
+        inside = (cells[:,0] >= 0) & (cells[:,0] < num_cols) & (cells[:,1] >= 0) & (cells[:,1] < num_rows)
+        indexes = numpy.full(len(points), -1, dtype="int")
+        indexes[inside] = self.indexes[cells[inside,1], cells[inside,0]]
+        dists = numpy.full(len(points), numpy.inf)
+        found = indexes >= 0
+        diff = points[found] - model[indexes[found]]
+        dists[found] = numpy.sqrt((diff * diff).sum(axis=1))
+        return indexes, dists
+
+def _closest_model_points(xformed_data, model, dist_threshold, model_tree=None):
+    '''
+    For each row of the (N,2) array xformed_data, finds the closest row of
+    the (M,2) array model.  Returns two arrays of length N: the index of the
+    closest model point and the distance to it.  The index is -1 (and the
+    distance is inf) when no model point is closer than dist_threshold.
+    When several model points are at exactly the same distance, the one with
+    the smallest index is chosen, as in _least_dist_mapping().  If a KD-tree
+    on the model points is supplied, it is used for the search.  If a
+    _NearestModelPointField is supplied instead, the closest model point is
+    looked up rather than searched for.
+    '''
+    num_data, num_model = len(xformed_data), len(model)
+    indexes = numpy.full(num_data, -1, dtype="int")
+    dists = numpy.full(num_data, numpy.inf)
+    if num_data == 0 or num_model == 0: return indexes, dists
+    if isinstance(model_tree, _NearestModelPointField):
+        indexes[:], dists[:] = model_tree.closest(xformed_data, model)
+    elif model_tree is not None:
+        # We ask the tree for a few nearest neighbors so that exact ties can be resolved
+        # toward the smallest model index.  For the rare data point for which all of them
+        # are tied, we fall back on the brute-force search:
+        k = min(8, num_model)
+        tree_dists, tree_indexes = model_tree.query(xformed_data, k=k, distance_upper_bound=dist_threshold)
+        tree_dists = tree_dists.reshape(num_data, k)
+        tree_indexes = tree_indexes.reshape(num_data, k)
+        tied = tree_dists == tree_dists[:,:1]
+        indexes[:] = numpy.where(tied, tree_indexes, num_model).min(axis=1)
+        dists[:] = tree_dists[:,0]
+        if k < num_model:
+            for row in numpy.nonzero(tied[:,-1] & numpy.isfinite(tree_dists[:,0]))[0]:
+                indexes[row:row+1], dists[row:row+1] = \
+                      _closest_model_points(xformed_data[row:row+1], model, dist_threshold)
+    else:
+        # The full distance matrix is formed in chunks of data points to bound the memory:
+        chunk = max(1, 2**20 // num_model)
+        for start in range(0, num_data, chunk):
+            diff = xformed_data[start:start+chunk,None,:] - model[None,:,:]
+            chunk_dists = numpy.sqrt((diff * diff).sum(axis=2))
+            best = chunk_dists.argmin(axis=1)
+            indexes[start:start+chunk] = best
+            dists[start:start+chunk] = chunk_dists[numpy.arange(len(best)), best]
+    outside = ~(dists < dist_threshold)
+    indexes[outside] = -1
+    dists[outside] = numpy.inf
+    return indexes, dists
+
+def _estimate_normals(points, num_neighbors=5):
+    '''
+    Estimates the unit normal at each row of the (N,2) array points from
+    its num_neighbors closest points (including itself).  The normal is the
+    direction of least spread of the neighborhood, that is the eigenvector
+    of the neighborhood covariance matrix with the smaller eigenvalue.
+    This is meant for scan points that lie along walls and other outlines.
+    '''
+    points = numpy.asarray(points, dtype="float").reshape(-1,2)
+    num_points = len(points)
+    k = min(num_neighbors, num_points)
+    if num_points == 0: return numpy.zeros((0,2))
+    if cKDTree is not None:
+        neighbors = cKDTree(points).query(points, k=k)[1].reshape(num_points, k)
+    else:
+        neighbors = numpy.empty((num_points, k), dtype="int")
+        chunk = max(1, 2**20 // num_points)
+        for start in range(0, num_points, chunk):
+            diff = points[start:start+chunk,None,:] - points[None,:,:]
+            chunk_dists = (diff * diff).sum(axis=2)
+            neighbors[start:start+chunk] = numpy.argsort(chunk_dists, axis=1, kind="mergesort")[:,:k]
+    neighborhoods = points[neighbors] - points[neighbors].mean(axis=1)[:,None,:]
+    covariances = numpy.einsum('nki,nkj->nij', neighborhoods, neighborhoods)
+    eigenvalues, eigenvectors = numpy.linalg.eigh(covariances)
+    return eigenvectors[:,:,0]
+
+def _gradient_normals(dx, dy, pixel_list):
+    '''
+    Returns an (N,2) array of the unit normals at the pixels (i,j) in
+    pixel_list as given by the direction of the image gradient (dx,dy) at
+    those pixels.  The gradient at an edge pixel is perpendicular to the
+    edge.
+    '''
+    if len(pixel_list) == 0: return numpy.zeros((0,2))
+    i_coords, j_coords = numpy.array(pixel_list, dtype="int").T
+    normals = numpy.column_stack((dx[j_coords, i_coords], dy[j_coords, i_coords]))
+    norms = numpy.sqrt((normals * normals).sum(axis=1))
+    norms[norms == 0] = 1.0
+    return normals / norms[:,None]
+
+def _robust_weights(residuals, trim_fraction=None, robust_weighting=None, scale=None):
+    '''
+    Returns the weights to use for the matched data points in an ICP update
+    given their residuals.  With trim_fraction set, the points outside that
+    fraction of the smallest absolute residuals get zero weight.  With
+    robust_weighting set to 'huber', 'tukey', or 'cauchy', the remaining
+    points are weighted by the corresponding M-estimator with the tuning
+    constant scale in pixels.  When scale is None, it is set to the usual
+    95%-efficiency constant for the estimator times the robust standard
+    deviation 1.4826 * median(|residual|) of the kept points.
+    '''
+    r = numpy.abs(numpy.asarray(residuals, dtype="float"))
+    weights = numpy.ones(len(r))
+    if trim_fraction is not None and trim_fraction < 1:
+        num_kept = max(3, int(math.ceil(trim_fraction * len(r))))
+        if num_kept < len(r):
+            # Ties are broken by the index so that the selection is deterministic:
+            order = numpy.lexsort((numpy.arange(len(r)), r))
+            weights[order[num_kept:]] = 0
+    if robust_weighting is None or robust_weighting == "none":
+        return weights
+    kept = weights > 0
+    if scale is None:
+        tuning_constant = {"huber" : 1.345, "tukey" : 4.685, "cauchy" : 2.3849}[robust_weighting]
+        scale = tuning_constant * 1.4826 * numpy.median(r[kept])
+    if scale <= 0:
+        # All the kept residuals are zero, so there is nothing to downweight:
+        return weights
+    u = r / scale
+    if robust_weighting == "huber":
+        weights[kept] = numpy.minimum(1.0, 1.0 / numpy.maximum(u[kept], 1e-12))
+    elif robust_weighting == "tukey":
+        weights[kept] = numpy.where(u[kept] < 1, (1 - u[kept]**2)**2, 0.0)
+    else:
+        weights[kept] = 1.0 / (1 + u[kept]**2)
+    if not numpy.any(weights > 0):
+        # Every point lies beyond the Tukey cutoff; fall back to the unweighted update:
+        weights = kept.astype("float")
+    return weights
+
+def _check_robust_params(trim_fraction, robust_weighting):
+    '''
+    Raises ValueError for the values of trim_fraction and robust_weighting
+    that _robust_weights() cannot use.
+    '''
+    if trim_fraction is not None and not (0 < trim_fraction <= 1):
+        raise ValueError('''trim_fraction must be a number in the interval (0, 1]''')
+    if robust_weighting is not None and robust_weighting not in ("none", "huber", "tukey", "cauchy"):
+        raise ValueError('''robust_weighting must be one of "none", "huber", "tukey", or "cauchy"''')
+
+def _icp_kernel(model, data, iterations, dist_threshold, model_tree=None, callback=None, debug=0,
+                error_change_threshold=None, rotation_change_threshold=None, 
+                translation_change_threshold=None, max_seconds_for_icp=None,
+                initial_R=None, initial_T=None, model_normals=None,
+                trim_fraction=None, robust_weighting=None, robust_weighting_scale=None):
+    '''
+    Carries out the ICP iterations on the (M,2) array of zero-mean model
+    points and the (N,2) array of data points expressed with respect to the
+    same origin.  This is the calculation described in the THEORETICAL BASIS
+    section of the documentation, with all the points of an iteration
+    transformed, matched, and used for the R and T updates as whole arrays.
+    If supplied, callback(iteration, R, T, error, number_of_points_matched)
+    is called at the end of each iteration.  The iterations start from
+    initial_R and initial_T when they are supplied and from the identity
+    rotation and zero translation otherwise.
+
+    When the (M,2) array model_normals of the unit normals at the model
+    points is supplied, the point-to-line error is minimized instead: the
+    error for a data point is its distance to the line through its model
+    correspondent that is perpendicular to the normal there.  The update
+    of each iteration is then the closed-form least-squares solution of
+    the problem linearized in the small rotation angle.
+
+    When trim_fraction is supplied, only that fraction of the matched data
+    points with the smallest residuals is used for the update of each
+    iteration.  When robust_weighting is set to 'huber', 'tukey', or
+    'cauchy', the update of each iteration is a weighted least-squares
+    solution with the weights returned by _robust_weights() for the
+    residuals of that iteration, which amounts to iteratively reweighted
+    least squares over the iterations.  The reported error is always the
+    mean residual over all of the matched points.
+
+    The iterations stop before the given number of iterations is reached
+    when the relative change in the error falls below
+    error_change_threshold, or when the rotation (in degrees) and the
+    translation (in pixels) applied by an iteration fall below
+    rotation_change_threshold and translation_change_threshold, or when
+    max_seconds_for_icp seconds have elapsed.  A criterion whose threshold
+    is None is not checked.
+
+    Returns R as a 2x2 array, T as a 2-element array, the list of the
+    registration errors for the iterations carried out, and a string that
+    says why the iterations stopped: 'max_iterations', 'error_converged',
+    'increment_converged', or 'time_budget'.
+    '''
+    start_time = time.time()
+    model = numpy.asarray(model, dtype="float").reshape(-1,2)
+    data = numpy.asarray(data, dtype="float").reshape(-1,2)
+    R = numpy.eye(2) if initial_R is None else numpy.array(initial_R, dtype="float").reshape(2,2)
+    T = numpy.zeros(2) if initial_T is None else numpy.array(initial_T, dtype="float").reshape(2)
+    error_for_iterations = []
+    stop_reason = "max_iterations"
+    for iteration in range(iterations):
+        old_R, old_T = R, T
+        xformed_data = data.dot(R.T) + T
+        indexes, dists = _closest_model_points(xformed_data, model, dist_threshold, model_tree)
+        matched = indexes >= 0
+        number_of_points_matched = int(matched.sum())
+        if debug: print("\nnumber of points matched: %s" % str(number_of_points_matched))
+        if number_of_points_matched == 0:
+            raise ValueError("No data pixel has a model pixel within the distance %s. Try a larger "
+                             "value for pixel_correspondence_dist_threshold." % str(dist_threshold))
+        # The data points that participated in matching and their model correspondents:
+        matched_model = model[indexes[matched]]
+        if model_normals is None:
+            residuals = dists[matched]
+        else:
+            p = xformed_data[matched]
+            n = model_normals[indexes[matched]]
+            residuals = ((p - matched_model) * n).sum(axis=1)
+        error = numpy.abs(residuals).sum() / number_of_points_matched
+        error_for_iterations.append(error)
+        if debug: print("\nerror: %s" % str(error))
+        weights = None
+        if trim_fraction is not None or robust_weighting not in (None, "none"):
+            weights = _robust_weights(residuals, trim_fraction, robust_weighting, robust_weighting_scale)
+        if model_normals is None:
+            A = data[matched].T
+            B = (matched_model - T).T
+            if weights is None:
+                AATI = A.T.dot(numpy.linalg.inv(A.dot(A.T)))
+                R_update = B.dot(AATI).dot(R.T)
+            else:
+                R_update = (B * weights).dot(A.T).dot(numpy.linalg.pinv((A * weights).dot(A.T))).dot(R.T)
+            U,S,VT = numpy.linalg.svd(R_update)
+            deter = numpy.linalg.det(U.dot(VT))
+            U[:,1] = U[:,1] * deter
+            R = U.dot(VT).dot(R)
+            # Rotate the data for estimating the translation T:
+            if weights is None:
+                T = matched_model.mean(axis=0) - R.dot(A).mean(axis=1)
+            else:
+                T = (weights.dot(matched_model) - R.dot(A).dot(weights)) / weights.sum()
+        else:
+            # For a small rotation angle a about the origin and a translation t, the moved point
+            # is p + a (-p_y, p_x) + t.  Setting its residual to zero for all points gives an
+            # overdetermined linear system in (a, t_x, t_y):
+            J = numpy.column_stack((p[:,0] * n[:,1] - p[:,1] * n[:,0], n[:,0], n[:,1]))
+            if weights is None:
+                solution = numpy.linalg.lstsq(J, -residuals, rcond=None)[0]
+            else:
+                root_weights = numpy.sqrt(weights)
+                solution = numpy.linalg.lstsq(J * root_weights[:,None], -residuals * root_weights, 
+                                              rcond=None)[0]
+            angle, t = solution[0], solution[1:]
+            R_update = numpy.array([[math.cos(angle), -math.sin(angle)], [math.sin(angle), math.cos(angle)]])
+            R = R_update.dot(R)
+            T = R_update.dot(T) + t
+        if debug: print("\nRotation: %s\nTranslation: %s" % (str(R), str(T)))
+        if callback is not None:
+            callback(iteration, R, T, error, number_of_points_matched)
+        if iteration == iterations - 1: break
+        # Check the convergence criteria:
+        if error_change_threshold is not None and len(error_for_iterations) > 1:
+            old_error = error_for_iterations[-2]
+            if old_error == 0 or abs(old_error - error) / old_error < error_change_threshold:
+                stop_reason = "error_converged"
+                break
+        if rotation_change_threshold is not None or translation_change_threshold is not None:
+            R_change = R.dot(old_R.T)
+            rotation_change = abs(math.degrees(math.atan2(R_change[1,0], R_change[0,0])))
+            translation_change = numpy.linalg.norm(T - old_T)
+            if (rotation_change_threshold is None or rotation_change < rotation_change_threshold) and \
+               (translation_change_threshold is None or translation_change < translation_change_threshold):
+                stop_reason = "increment_converged"
+                break
+        if max_seconds_for_icp is not None and time.time() - start_time >= max_seconds_for_icp:
+            stop_reason = "time_budget"
+            break
+    return R, T, error_for_iterations, stop_reason
+
+#------------------------------------ Global Pre-Alignment ----------------------------------------
+def _rasterize_points(points, canvas_size, offset, sigma=1.0):
+    '''
+    Returns a canvas_size x canvas_size array with a Gaussian blob of
+    standard deviation sigma at each of the points shifted by offset.  The
+    blurring is carried out in the frequency domain.
+    '''
+    canvas = numpy.zeros((canvas_size, canvas_size), dtype="float")
+    pixels = numpy.round(numpy.asarray(points, dtype="float").reshape(-1,2) + offset).astype(int)
+    inside = numpy.all((pixels >= 0) & (pixels < canvas_size), axis=1)
+    numpy.add.at(canvas, (pixels[inside,1], pixels[inside,0]), 1.0)
+    freqs = numpy.fft.fftfreq(canvas_size)
+    blur = numpy.exp(-2 * (math.pi * sigma)**2 * (freqs[:,None]**2 + freqs[None,:]**2))
+    return numpy.real(numpy.fft.ifft2(numpy.fft.fft2(canvas) * blur))
+
+def _phase_correlation(a, b):
+    '''
+    Returns the circular shift (along axis 0, along axis 1) that takes the
+    array b into the array a, refined to subpixel accuracy by fitting a
+    parabola through the correlation peak along each axis, and the height of
+    the peak.
+    '''
+    cross_power = numpy.fft.fft2(a) * numpy.conj(numpy.fft.fft2(b))
+    cross_power /= numpy.maximum(numpy.abs(cross_power), 1e-12)
+    correlation = numpy.real(numpy.fft.ifft2(cross_power))
+    peak = numpy.unravel_index(numpy.argmax(correlation), correlation.shape)
+    shifts = []
+    for axis in range(2):
+        n = correlation.shape[axis]
+        before, after = list(peak), list(peak)
+        before[axis], after[axis] = (peak[axis] - 1) % n, (peak[axis] + 1) % n
+        y0, y1, y2 = correlation[tuple(before)], correlation[peak], correlation[tuple(after)]
+        denominator = y0 - 2 * y1 + y2
+        shift = peak[axis] + (0.5 * (y0 - y2) / denominator if denominator != 0 else 0.0)
+        if shift > n / 2.0: shift -= n
+        shifts.append(shift)
+    return tuple(shifts), correlation[peak]
+
+def _bilinear_sample(image, x, y):
+    '''
+    Samples the 2D array image at the real-valued column coordinates x and
+    row coordinates y.  The coordinates are clamped to the array.
+    '''
+    height, width = image.shape
+    x0, y0 = numpy.floor(x).astype(int), numpy.floor(y).astype(int)
+    fx, fy = x - x0, y - y0
+    def at(rows, cols):
+        return image[numpy.clip(rows, 0, height-1), numpy.clip(cols, 0, width-1)]
+    return at(y0, x0) * (1-fx) * (1-fy) + at(y0, x0+1) * fx * (1-fy) + \
+           at(y0+1, x0) * (1-fx) * fy + at(y0+1, x0+1) * fx * fy
+
+def _log_polar_magnitude(image, num_angles=360, num_radii=128):
+    '''
+    Resamples the high-pass filtered magnitude of the Fourier transform of
+    a square image on a log-polar grid with num_angles angles covering 180
+    degrees along axis 0 and num_radii logarithmically spaced radii along
+    axis 1.  The magnitude does not change when the image is translated,
+    and a rotation of the image becomes a circular shift along axis 0.
+    '''
+    size = image.shape[0]
+    magnitude = numpy.abs(numpy.fft.fftshift(numpy.fft.fft2(image)))
+    freqs = numpy.linspace(-0.5, 0.5, size, endpoint=False)
+    cosines = numpy.cos(math.pi * freqs[:,None]) * numpy.cos(math.pi * freqs[None,:])
+    magnitude *= (1 - cosines) * (2 - cosines)
+    angles = numpy.arange(num_angles) * math.pi / num_angles
+    radii = numpy.exp(numpy.linspace(0, math.log(size / 2.0 - 1), num_radii))
+    center = size / 2.0
+    x = center + radii[None,:] * numpy.cos(angles)[:,None]
+    y = center + radii[None,:] * numpy.sin(angles)[:,None]
+    return _bilinear_sample(magnitude, x, y)
+
+def prealign_points(model_points, data_points, image_size=None, num_angles=360):
+    '''
+    Estimates the rotation and the translation of the data points with
+    respect to the model points by FFT-based phase correlation, without any
+    iterations and regardless of how large the rotation and the translation
+    are.  The two point sets are rasterized on a common canvas.  The
+    rotation is found by phase correlation of the log-polar resampled
+    magnitude spectra of the two rasters.  Since the magnitude spectrum
+    cannot tell a rotation from the same rotation plus 180 degrees, both
+    candidates are tried: the data points are rotated about the center of
+    the image and the translation is found by phase correlation of the
+    rasters, and the candidate with the higher correlation peak wins.
+    image_size is the (width, height) of the images the points come from;
+    it defaults to the bounding box of the points.  Returns the angle in
+    degrees and the translation in the same form as the initial pose
+    accepted by register() and by the ICP constructor, that is, such that
+    a data point x_d lands at R x_d + T.  The accuracy is about a pixel and
+    a fraction of a degree, which is more than enough as a starting point
+    for ICP.
+    '''
+    model = numpy.asarray(model_points, dtype="float").reshape(-1,2)
+    data = numpy.asarray(data_points, dtype="float").reshape(-1,2)
+    if image_size is None:
+        image_size = numpy.ceil(numpy.vstack((model, data)).max(axis=0)) + 1
+    center = numpy.asarray(image_size, dtype="float") / 2.0
+    # The canvas leaves enough room around the image for the rotated data and for the shifts:
+    side = int(max(image_size))
+    canvas_size, offset = 2 * side, side / 2.0
+    model_raster = _rasterize_points(model, canvas_size, offset)
+    data_raster = _rasterize_points(data, canvas_size, offset)
+    (angle_shift, scale_shift), peak = _phase_correlation(
+                                         _log_polar_magnitude(model_raster, num_angles),
+                                         _log_polar_magnitude(data_raster, num_angles))
+    best = None
+    for angle in (angle_shift * 180.0 / num_angles, angle_shift * 180.0 / num_angles + 180):
+        theta = math.radians(angle)
+        R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        rotated_data = (data - center).dot(R.T) + center
+        (dy, dx), peak = _phase_correlation(model_raster, 
+                                            _rasterize_points(rotated_data, canvas_size, offset))
+        if best is None or peak > best[0]:
+            best = (peak, angle, center - R.dot(center) + numpy.array([dx, dy]))
+    peak, angle, T = best
+    return (angle + 180) % 360 - 180, T
+
+#---------------------------------- Correlative Scan Matching -------------------------------------
+def _sliding_max(table, width):
+    '''
+    Returns the array whose element (i,j) is the maximum of table over the
+    width x width block whose top-left corner is at (i,j).  The table is
+    taken to be zero beyond its bottom and right edges.  The maximum is
+    built up by doubling the block size, so it takes O(log width) passes.
+    '''
+    result = table.copy()
+    covered = 1
+    while covered < width:
+        step = min(covered, width - covered)
+        shifted = numpy.zeros_like(result)
+        shifted[:-step,:] = result[step:,:]
+        result = numpy.maximum(result, shifted)
+        shifted = numpy.zeros_like(result)
+        shifted[:,:-step] = result[:,step:]
+        result = numpy.maximum(result, shifted)
+        covered += step
+    return result
+
+class ScanMatchResult(object):
+    '''
+    Holds the outcome of CorrelativeScanMatcher.match().  R and T take the
+    data points into the model points in the coordinates of the points,
+    that is R x_d + T = x_m, and angle is the rotation in degrees.  The
+    pair (angle, T) can be passed as the initial pose to register() or to
+    the ICP constructor.  The attribute score is the mean likelihood of the
+    transformed data points, between 0 and 1, and
+    number_of_candidates_scored is the number of (x, y, theta) candidates
+    for which the score was computed with the fine lookup table.
+    '''
+    def __init__(self, angle, T, score, number_of_candidates_scored, timings):
+        theta = math.radians(angle)
+        self.angle = angle
+        self.R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        self.T = T
+        self.score = score
+        self.number_of_candidates_scored = number_of_candidates_scored
+        self.timings = timings
+
+    def transform_points(self, points):
+        '''
+        Applies the match to an (N,2) array of points in the coordinate
+        frame of the data and returns them in the frame of the model.
+        '''
+        points = numpy.asarray(points, dtype="float").reshape(-1,2)
+        return points.dot(self.R.T) + self.T
+
+    def __repr__(self):
+        return "ScanMatchResult(angle=%.4f, T=(%.4f, %.4f), score=%.4f)" % \
+               (self.angle, self.T[0], self.T[1], self.score)
+
+class CorrelativeScanMatcher(object):
+    '''
+    A correlative scan matcher in the manner of Olson's "Real-time
+    correlative scan matching".  The model points are turned once into a
+    lookup table of the likelihood exp(-d^2 / 2 sigma^2) of observing a
+    point at each cell, where d is the distance from the center of the cell
+    to the nearest model point.  A match then scores every (x, y, theta)
+    candidate in the search window by looking up the transformed data
+    points in the table.  The search is exact but does not visit every
+    candidate: a coarse table, whose cells hold the maximum of the fine
+    table over blocks of coarse_factor x coarse_factor cells, including
+    the blocks that hang over the edges of the fine table, gives an
+    upper bound on the score of all the translations in a block, and the
+    blocks are refined with the fine table in the order of their bounds
+    until no remaining block can beat the best score found.
+
+    The constructor takes the (M,2) model points and the keyword
+    parameters resolution (the size of a table cell in pixels, default
+    1.0), sigma (in pixels, default 2.0), coarse_factor (default 8), and
+    correspondence_backend ('brute_force' or 'kdtree'), which is used for
+    building the table.  The matcher can be kept around and reused for any
+    number of data scans against the same model.
+    '''
+    def __init__(self, model_points, resolution=1.0, sigma=2.0, coarse_factor=8, 
+                                     correspondence_backend=None):
+        model = numpy.asarray(model_points, dtype="float").reshape(-1,2)
+        if len(model) == 0:
+            raise ValueError("CorrelativeScanMatcher needs at least one model point")
+        if resolution <= 0 or sigma <= 0 or int(coarse_factor) != coarse_factor or coarse_factor < 1:
+            raise ValueError('''resolution and sigma must be positive and coarse_factor must be '''
+                             '''a positive integer''')
+        if correspondence_backend is None:
+            correspondence_backend = "brute_force" if cKDTree is None else "kdtree"
+        if correspondence_backend not in ("brute_force", "kdtree"):
+            raise ValueError('''correspondence_backend must be either "brute_force" or "kdtree"''')
+        if correspondence_backend == "kdtree" and cKDTree is None:
+            raise ValueError('''The "kdtree" correspondence backend needs scipy.spatial.cKDTree''')
+        self.resolution = float(resolution)
+        self.sigma = float(sigma)
+        self.coarse_factor = int(coarse_factor)
+        # Beyond 4 sigma from the model the likelihood is negligible, so the table stops there:
+        margin = 4 * self.sigma
+        self.origin = model.min(axis=0) - margin
+        num_cols, num_rows = (numpy.ceil((model.max(axis=0) + margin - self.origin) / self.resolution)
+                                                                                  .astype(int) + 1)
+        cols, rows = numpy.meshgrid(numpy.arange(num_cols), numpy.arange(num_rows))
+        centers = self.origin + (numpy.column_stack((cols.ravel(), rows.ravel())) + 0.5) * self.resolution
+        model_tree = cKDTree(model) if correspondence_backend == "kdtree" else None
+        indexes, dists = _closest_model_points(centers, model, margin, model_tree)
+        self.fine_table = numpy.exp(-dists**2 / (2 * self.sigma**2)).reshape(num_rows, num_cols)
+        # A block that starts up to coarse_factor-1 cells above or to the left of the fine table
+        # still covers some of it, so the coarse table is padded on those sides as well:
+        self.coarse_padding = self.coarse_factor - 1
+        padded_table = numpy.zeros((num_rows + self.coarse_padding, num_cols + self.coarse_padding))
+        padded_table[self.coarse_padding:, self.coarse_padding:] = self.fine_table
+        self.coarse_table = _sliding_max(padded_table, self.coarse_factor)
+
+    def _scores(self, table, cells, offsets, padding=0):
+        '''
+        Returns the mean table value at the (N,2) integer cells (column, row)
+        shifted by each of the (K,2) integer offsets, as an array of length
+        K.  The cell (0,0) is at the index (padding, padding) of the table.
+        Cells that fall outside the table count as zero.
+        '''
+        num_rows, num_cols = table.shape
+        scores = numpy.zeros(len(offsets))
+        chunk = max(1, 2**20 // len(cells))
+        for start in range(0, len(offsets), chunk):
+            shifted = cells[None,:,:] + offsets[start:start+chunk,None,:] + padding
+            inside = (shifted[:,:,0] >= 0) & (shifted[:,:,0] < num_cols) & \
+                     (shifted[:,:,1] >= 0) & (shifted[:,:,1] < num_rows)
+            values = table[numpy.clip(shifted[:,:,1], 0, num_rows-1), numpy.clip(shifted[:,:,0], 0, num_cols-1)]
+            scores[start:start+chunk] = (values * inside).sum(axis=1) / len(cells)
+        return scores
+
+    def match(self, data_points, init=None, translation_window=20.0, angle_window=20.0, angle_step=None):
+        '''
+        Finds the rotation and translation of the data points that maximize
+        their likelihood under the model.  The search covers the rotations
+        within angle_window degrees and the translations within
+        translation_window pixels in x and y of the initial pose init, which
+        has the same forms as for register() and defaults to the identity.
+        The rotations are about the centroid of the data points.  When
+        angle_step is not given, it is set so that the data point farthest
+        from the centroid moves by about one table cell from one rotation to
+        the next.  Returns an instance of ScanMatchResult.
+        '''
+        start_time = time.time()
+        data = numpy.asarray(data_points, dtype="float").reshape(-1,2)
+        if len(data) == 0:
+            raise ValueError("match() needs at least one data point")
+        R0, T0 = (numpy.eye(2), numpy.zeros(2)) if init is None else _initial_pose_about_origin(init, (0,0))
+        angle0 = math.degrees(math.atan2(R0[1,0], R0[0,0]))
+        centroid = data.mean(axis=0)
+        # With the rotations taken about the centroid, this translation reproduces the initial pose:
+        shift = T0 + R0.dot(centroid) - centroid
+        if angle_step is None:
+            max_radius = numpy.sqrt(((data - centroid)**2).sum(axis=1)).max()
+            angle_step = math.degrees(self.resolution / max(max_radius, self.resolution))
+        num_angle_steps = int(math.floor(angle_window / angle_step))
+        angles = angle0 + angle_step * numpy.arange(-num_angle_steps, num_angle_steps + 1)
+        # The candidate translations are the whole numbers of table cells in the search window.  At
+        # the coarse level, one offset stands for a block of coarse_factor x coarse_factor of them:
+        half_width = int(math.ceil(translation_window / self.resolution))
+        block_starts = numpy.arange(-half_width, half_width + 1, self.coarse_factor)
+        block_offsets = numpy.array([(x, y) for y in block_starts for x in block_starts])
+        within_block = numpy.array([(x, y) for y in range(self.coarse_factor) for x in range(self.coarse_factor)])
+        candidates = []
+        rotated_cells = []
+        for angle_index, angle in enumerate(angles):
+            theta = math.radians(angle)
+            R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+            # The data points rotated about their centroid and moved to the initial position:
+            rotated = (data - centroid).dot(R.T) + centroid + shift
+            cells = numpy.floor((rotated - self.origin) / self.resolution).astype(int)
+            rotated_cells.append(cells)
+            bounds = self._scores(self.coarse_table, cells, block_offsets, self.coarse_padding)
+            candidates.extend(zip(bounds, [angle_index] * len(bounds), range(len(bounds))))
+        candidates.sort(key = lambda x: (-x[0], x[1], x[2]))
+        search_time = time.time()
+        best_score, best_angle_index, best_offset = -1.0, None, None
+        number_of_candidates_scored = 0
+        for bound, angle_index, block_index in candidates:
+            if bound <= best_score: break
+            offsets = block_offsets[block_index] + within_block
+            offsets = offsets[numpy.all(numpy.abs(offsets) <= half_width, axis=1)]
+            scores = self._scores(self.fine_table, rotated_cells[angle_index], offsets)
+            number_of_candidates_scored += len(offsets)
+            best = scores.argmax()
+            if scores[best] > best_score:
+                best_score, best_angle_index, best_offset = scores[best], angle_index, offsets[best]
+        angle = angles[best_angle_index]
+        theta = math.radians(angle)
+        R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        T = centroid - R.dot(centroid) + shift + best_offset * self.resolution
+        end_time = time.time()
+        timings = {'coarse' : search_time - start_time, 'fine' : end_time - search_time,
+                   'total' : end_time - start_time}
+        return ScanMatchResult(angle, T, best_score, number_of_candidates_scored, timings)
+
+#------------------------------------ Headless Registration ---------------------------------------
+class ICPResult(object):
+    '''
+    Holds the outcome of a call to register().  R and T are the rotation
+    and the translation that take the data points into the model points
+    with respect to the origin at model_mean, that is
+
+         R (x_d - model_mean) + T   =   x_m - model_mean
+
+    which is the same convention as for the R and T computed by ICP.icp().
+    The attribute angle is the rotation in degrees.  The attribute timings
+    is a dict with the wall-clock seconds spent in 'setup' (building the
+    arrays and the KD-tree), 'iterations', and 'total'.
+    '''
+    def __init__(self, R, T, model_mean, error_for_iterations, stop_reason, 
+                       number_of_points_matched, timings):
+        self.R = R
+        self.T = T
+        self.model_mean = model_mean
+        self.angle = math.degrees(math.atan2(R[1,0], R[0,0]))
+        self.error_for_iterations = error_for_iterations
+        self.error = error_for_iterations[-1] if error_for_iterations else None
+        self.iterations_run = len(error_for_iterations)
+        self.stop_reason = stop_reason
+        self.number_of_points_matched = number_of_points_matched
+        self.timings = timings
+
+    def transform_points(self, points):
+        '''
+        Applies the registration to an (N,2) array of points in the
+        coordinate frame of the data and returns them in the frame of the
+        model.
+        '''
+        points = numpy.asarray(points, dtype="float").reshape(-1,2)
+        return (points - self.model_mean).dot(self.R.T) + self.T + self.model_mean
+
+    def __repr__(self):
+        return "ICPResult(angle=%.4f, T=(%.4f, %.4f), error=%s, iterations_run=%d, stop_reason=%s)" % \
+               (self.angle, self.T[0], self.T[1], str(self.error), self.iterations_run, self.stop_reason)
+
+def _initial_pose_about_origin(init, origin):
+    '''
+    The initial pose init is given in the coordinate frame of the images,
+    meaning x_m = R0 x_d + T0.  It can be supplied either as a pair (R0, T0)
+    with R0 a 2x2 rotation matrix or as a pair (angle, T0) with the angle in
+    degrees.  Returns the same pose for the coordinates measured from the
+    point origin:
+
+        x_m - origin  =  R0 (x_d - origin)  +  (T0 + R0 origin - origin)
+    '''
+    rotation, translation = init
+    if numpy.ndim(rotation) == 0:
+        theta = math.radians(rotation)
+        R0 = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+    else:
+        R0 = numpy.asarray(rotation, dtype="float").reshape(2,2)
+    T0 = numpy.asarray(translation, dtype="float").reshape(2)
+    origin = numpy.asarray(origin, dtype="float").reshape(2)
+    return R0, T0 + R0.dot(origin) - origin
+
+class ModelIndex(object):
+    '''
+    The model side of a registration, built once and then passed to
+    register() in place of the model points for any number of data scans,
+    as in a localization loop against a fixed map.  It holds the model
+    points in model_points, their mean in model_mean, the points with the
+    mean subtracted in zero_mean_model, the KD-tree on the latter when the
+    correspondence_backend is 'kdtree' (the default when scipy is
+    available), and the model normals, which are estimated on first use if
+    they are not supplied.
+
+    When distance_field_margin is given, the index also holds a lookup
+    table of the nearest model point over a grid of cells of
+    distance_field_resolution pixels covering the model and that margin
+    around it.  Registrations whose pixel_correspondence_dist_threshold
+    does not exceed the margin then find the correspondents by table
+    lookup instead of by searching.  A correspondent so found is the
+    nearest model point to the center of the cell of the data point, which
+    is within a fraction of a cell of being the nearest to the data point.
+    '''
+    def __init__(self, model_points, correspondence_backend=None, model_normals=None,
+                       distance_field_margin=None, distance_field_resolution=1.0):
+        model = numpy.asarray(model_points, dtype="float").reshape(-1,2)
+        if len(model) == 0:
+            raise ValueError("ModelIndex needs at least one model point")
+        if correspondence_backend is None:
+            correspondence_backend = "brute_force" if cKDTree is None else "kdtree"
+        if correspondence_backend not in ("brute_force", "kdtree"):
+            raise ValueError('''correspondence_backend must be either "brute_force" or "kdtree"''')
+        if correspondence_backend == "kdtree" and cKDTree is None:
+            raise ValueError('''The "kdtree" correspondence backend needs scipy.spatial.cKDTree''')
+        self.model_points = model
+        self.model_mean = model.mean(axis=0)
+        self.zero_mean_model = model - self.model_mean
+        self.correspondence_backend = correspondence_backend
+        self.model_tree = cKDTree(self.zero_mean_model) if correspondence_backend == "kdtree" else None
+        if model_normals is not None:
+            model_normals = numpy.asarray(model_normals, dtype="float").reshape(-1,2)
+            if len(model_normals) != len(model):
+                raise ValueError("model_normals must have one row for each model point")
+        self.model_normals = model_normals
+        self.distance_field = None
+        if distance_field_margin is not None:
+            if distance_field_margin <= 0 or distance_field_resolution <= 0:
+                raise ValueError("distance_field_margin and distance_field_resolution must be positive")
+            self.distance_field = _NearestModelPointField(self.zero_mean_model, distance_field_margin,
+                                                          distance_field_resolution, self.model_tree)
+
+    @classmethod
+    def from_image(cls, model_image, distance_field_margin=None, distance_field_resolution=1.0, 
+                                     **params):
+        '''
+        Builds the index from the pixels that the ICP class extracts from
+        the model image file.  The keyword params are ICP constructor
+        parameters, binary_or_color being required.  For edge-based ICP,
+        the normals are those given by the image gradients.  The points
+        are in the coordinates of the image reduced to
+        calculation_image_size, so the data points must be too.  Since the
+        ICP class looks up the font file only for displaying the results,
+        this works without the font file.
+        '''
+        icp = ICP(model_image=model_image, **params)
+        if icp.binary_or_color == "binary":
+            icp.extract_pixels_from_binary_image("model")
+        else:
+            icp.extract_pixels_from_color_image("model")
+        return cls(icp.model_list, icp.correspondence_backend, icp.model_normals,
+                   distance_field_margin, distance_field_resolution)
+
+    def normals(self):
+        '''
+        Returns the unit normals at the zero-mean model points, estimating
+        them from the neighboring model points the first time if they were
+        not supplied.
+        '''
+        if self.model_normals is None:
+            self.model_normals = _estimate_normals(self.zero_mean_model)
+        return self.model_normals
+
+    def correspondence_search(self, dist_threshold):
+        '''
+        Returns what _closest_model_points() should search with for the
+        given distance threshold: the distance field if there is one with a
+        margin that is large enough, the KD-tree otherwise, or None for the
+        brute-force search.
+        '''
+        if self.distance_field is not None and dist_threshold <= self.distance_field.margin:
+            return self.distance_field
+        return self.model_tree
+
+def register(model_points, data_points, init=None, **params):
+    '''
+    Registers the data points with the model points without any images,
+    files, fonts or Tkinter windows being involved.  The two point sets are
+    supplied as (N,2) arrays (or lists of (x,y) tuples) of pixel
+    coordinates.  Instead of the model points, you can supply a ModelIndex
+    built from them, which saves the setup for the model when you register
+    many data scans against the same model.  The optional init is an
+    initial guess for the pose of the data with respect to the model in the
+    same coordinates; see _initial_pose_about_origin() for the forms it can
+    take.  The keyword parameters, all optional, are iterations,
+    pixel_correspondence_dist_threshold, correspondence_backend,
+    error_change_threshold, rotation_change_threshold,
+    translation_change_threshold, max_seconds_for_icp, error_metric,
+    trim_fraction, robust_weighting, robust_weighting_scale, and prealign.
+    They mean the same thing as the ICP constructor parameters of the same
+    names.  The default correspondence_backend is 'kdtree' when scipy is
+    available.  With error_metric set to 'point_to_line', you can also
+    supply model_normals, an (N,2) array of the unit normals at the model
+    points; they are estimated from the neighboring model points if you
+    don't.  With a ModelIndex, correspondence_backend and model_normals
+    are those of the index.  Returns an instance of ICPResult.
+    '''
+    start_time = time.time()
+    iterations = params.pop('iterations', 24)
+    dist_threshold = params.pop('pixel_correspondence_dist_threshold', 100)
+    correspondence_backend = params.pop('correspondence_backend', None)
+    error_metric = params.pop('error_metric', "point_to_point")
+    model_normals = params.pop('model_normals', None)
+    prealign = params.pop('prealign', 0)
+    convergence_params = {}
+    for name in ('error_change_threshold', 'rotation_change_threshold', 
+                 'translation_change_threshold', 'max_seconds_for_icp',
+                 'trim_fraction', 'robust_weighting', 'robust_weighting_scale'):
+        convergence_params[name] = params.pop(name, None)
+    if len(params) != 0:
+        raise ValueError('''You have provided unrecognizable keyword args for register(): %s''' % 
+                                                                               str(sorted(params)))
+    if error_metric not in ("point_to_point", "point_to_line"):
+        raise ValueError('''error_metric must be either "point_to_point" or "point_to_line"''')
+    _check_robust_params(convergence_params['trim_fraction'], convergence_params['robust_weighting'])
+    data = numpy.asarray(data_points, dtype="float").reshape(-1,2)
+    if isinstance(model_points, ModelIndex):
+        if correspondence_backend is not None or model_normals is not None:
+            raise ValueError('''With a ModelIndex, the correspondence_backend and the model_normals '''
+                             '''are those of the index''')
+        model_index = model_points
+    else:
+        if len(data) == 0 or numpy.size(model_points) == 0:
+            raise ValueError("register() needs at least one model point and one data point")
+        model_index = ModelIndex(model_points, correspondence_backend, 
+                                 model_normals if error_metric == "point_to_line" else None)
+    if len(data) == 0:
+        raise ValueError("register() needs at least one data point")
+    model_mean = model_index.model_mean
+    model = model_index.zero_mean_model
+    data = data - model_mean
+    initial_R = initial_T = None
+    if init is None and prealign:
+        init = prealign_points(model_index.model_points, data_points)
+    if init is not None:
+        initial_R, initial_T = _initial_pose_about_origin(init, model_mean)
+    model_tree = model_index.correspondence_search(dist_threshold)
+    model_normals = model_index.normals() if error_metric == "point_to_line" else None
+    matches = [0]
+    def record_matches(iteration, R, T, error, number_of_points_matched):
+        matches[0] = number_of_points_matched
+    setup_done_time = time.time()
+    R, T, error_for_iterations, stop_reason = _icp_kernel(model, data, iterations, dist_threshold, 
+                      model_tree = model_tree, callback = record_matches, 
+                      initial_R = initial_R, initial_T = initial_T, model_normals = model_normals, 
+                      **convergence_params)
+    end_time = time.time()
+    timings = {'setup' : setup_done_time - start_time, 
+               'iterations' : end_time - setup_done_time,
+               'total' : end_time - start_time}
+    return ICPResult(R, T, model_mean, error_for_iterations, stop_reason, matches[0], timings)
+
 #-------------------------------------- ICP Class Definition --------------------------------------
 
 class ICP(object):
@@ -1078,10 +2767,21 @@ class ICP(object):
                       corner_detection_threshold, pixel_correspondence_dist_threshold, 
                       edge_detection_threshold, max_num_of_pixels_used_for_icp,
                       image_polarity, auto_select_model_and_data, 
-                      smoothing_low_medium_or_high, font_file, debug1, and debug2''')       
+                      smoothing_low_medium_or_high, correspondence_backend, 
+                      error_change_threshold, rotation_change_threshold, 
+                      translation_change_threshold, max_seconds_for_icp, 
+                      error_metric, trim_fraction, robust_weighting, 
+                      robust_weighting_scale, pyramid_levels, initial_pose, 
+                      prealign, binary_subsampling, thin_edges, 
+                      edge_detection_low_threshold, feature_cache, font_file, debug1, 
+                      and debug2''')       
         model_image=data_image=calculation_image_size=iterations=corner_detection_threshold=None
         corners_or_edges=edge_detection_threshold=pixel_correspondence_dist_threshold=None
         max_num_of_pixels_used_for_icp=smoothing_low_medium_or_high=subimage_index=None
+        correspondence_backend=error_change_threshold=rotation_change_threshold=None
+        translation_change_threshold=max_seconds_for_icp=error_metric=None
+        trim_fraction=robust_weighting=robust_weighting_scale=pyramid_levels=initial_pose=None
+        prealign=binary_subsampling=thin_edges=edge_detection_low_threshold=feature_cache=None
         image_polarity=auto_select_model_and_data=font_file=debug1=debug2=None
 
         if 'model_image' in kwargs                 :              model_image=kwargs.pop('model_image')
@@ -1109,32 +2809,50 @@ class ICP(object):
                             max_num_of_pixels_used_for_icp=kwargs.pop('max_num_of_pixels_used_for_icp')
         if 'smoothing_low_medium_or_high' in kwargs: \
                                 smoothing_low_medium_or_high=kwargs.pop('smoothing_low_medium_or_high')
+        if 'correspondence_backend' in kwargs: \
+                                            correspondence_backend=kwargs.pop('correspondence_backend')
+        if 'error_change_threshold' in kwargs: \
+                                            error_change_threshold=kwargs.pop('error_change_threshold')
+        if 'rotation_change_threshold' in kwargs: \
+                                      rotation_change_threshold=kwargs.pop('rotation_change_threshold')
+        if 'translation_change_threshold' in kwargs: \
+                                translation_change_threshold=kwargs.pop('translation_change_threshold')
+        if 'max_seconds_for_icp' in kwargs: \
+                                                  max_seconds_for_icp=kwargs.pop('max_seconds_for_icp')
+        if 'error_metric' in kwargs                :              error_metric=kwargs.pop('error_metric')
+        if 'trim_fraction' in kwargs               :            trim_fraction=kwargs.pop('trim_fraction')
+        if 'robust_weighting' in kwargs            :      robust_weighting=kwargs.pop('robust_weighting')
+        if 'robust_weighting_scale' in kwargs: \
+                                            robust_weighting_scale=kwargs.pop('robust_weighting_scale')
+        if 'pyramid_levels' in kwargs              :        pyramid_levels=kwargs.pop('pyramid_levels')
+        if 'initial_pose' in kwargs                :            initial_pose=kwargs.pop('initial_pose')
+        if 'prealign' in kwargs                    :                    prealign=kwargs.pop('prealign')
+        if 'binary_subsampling' in kwargs          :  binary_subsampling=kwargs.pop('binary_subsampling')
+        if 'thin_edges' in kwargs                  :                thin_edges=kwargs.pop('thin_edges')
+        if 'edge_detection_low_threshold' in kwargs: \
+                                edge_detection_low_threshold=kwargs.pop('edge_detection_low_threshold')
+        if 'feature_cache' in kwargs               :          feature_cache=kwargs.pop('feature_cache')
         if len(kwargs) != 0:
                                   raise ValueError('''You have provided unrecognizable keyword args''')
+        # Image.open() reads only the header.  The pixels are decoded when they are first needed:
+        self.model_image_file = model_image
+        self.data_image_file = data_image
+        self._original_model_im = None
+        self._original_data_im = None
         if model_image: 
             self.model_im = Image.open(model_image)
-            self.original_model_im = Image.open(model_image)
         else:
             self.model_im = None
         if data_image: 
             self.data_im =  Image.open(data_image)
-            self.original_data_im = Image.open(data_image)
         else:
             self.data_im = None
         if binary_or_color:
             self.binary_or_color = binary_or_color
         else:
             raise ValueError('''You must specify either "binary" or "color" ''')
-        if font_file:
-            self.font_file = font_file
-        elif os.path.isfile("FreeSerif.ttf"):
-            self.font_file = "FreeSerif.ttf"
-        elif os.path.isfile("/usr/share/fonts/truetype/freefont/FreeSerif.ttf"):
-            self.font_file = "/usr/share/fonts/truetype/freefont/FreeSerif.ttf"
-        else:
-            print("Unable to find the font file 'FreeSerif.ttf' needed for displaying the results")
-            print("Use the 'font_file' option in the constructor to specify your own font file")
-            sys.exit(1)
+        # The font file is looked up by _display_font() only when the results are displayed:
+        self.font_file = font_file
         if corners_or_edges:
             self.corners_or_edges = corners_or_edges
         else:
@@ -1191,6 +2909,58 @@ class ICP(object):
             self.auto_select_model_and_data = auto_select_model_and_data
         else:
             self.auto_select_model_and_data = 0
+        if correspondence_backend:
+            if correspondence_backend not in ("brute_force", "kdtree"):
+                raise ValueError('''correspondence_backend must be either "brute_force" or "kdtree"''')
+            if correspondence_backend == "kdtree" and cKDTree is None:
+                raise ValueError('''The "kdtree" correspondence backend needs scipy.spatial.cKDTree. '''
+                                 '''Install scipy or use the "brute_force" backend.''')
+            self.correspondence_backend = correspondence_backend
+        else:
+            self.correspondence_backend = "brute_force"
+        # The convergence criteria are checked only when their thresholds are supplied:
+        self.error_change_threshold = error_change_threshold
+        self.rotation_change_threshold = rotation_change_threshold
+        self.translation_change_threshold = translation_change_threshold
+        self.max_seconds_for_icp = max_seconds_for_icp
+        self.iterations_run = None
+        self.stop_reason = None
+        if error_metric:
+            if error_metric not in ("point_to_point", "point_to_line"):
+                raise ValueError('''error_metric must be either "point_to_point" or "point_to_line"''')
+            self.error_metric = error_metric
+        else:
+            self.error_metric = "point_to_point"
+        _check_robust_params(trim_fraction, robust_weighting)
+        self.trim_fraction = trim_fraction
+        self.robust_weighting = robust_weighting if robust_weighting else "none"
+        self.robust_weighting_scale = robust_weighting_scale
+        if pyramid_levels:
+            if int(pyramid_levels) != pyramid_levels or pyramid_levels < 1:
+                raise ValueError('''pyramid_levels must be a positive integer''')
+            self.pyramid_levels = int(pyramid_levels)
+        else:
+            self.pyramid_levels = 1
+        self.pyramid_level_results = []
+        self.initial_pose = initial_pose
+        if prealign:
+            self.prealign = prealign
+        else:
+            self.prealign = 0
+        if binary_subsampling:
+            if binary_subsampling not in ("none", "random", "stratified"):
+                raise ValueError('''binary_subsampling must be one of "none", "random", or "stratified"''')
+            self.binary_subsampling = binary_subsampling
+        else:
+            self.binary_subsampling = "none"
+        if thin_edges:
+            self.thin_edges = thin_edges
+        else:
+            self.thin_edges = 0
+        self.edge_detection_low_threshold = edge_detection_low_threshold
+        if feature_cache is not None and not isinstance(feature_cache, FeatureCache):
+            raise ValueError("feature_cache must be a FeatureCache instance")
+        self.feature_cache = feature_cache
         self.model_rval =  None
         self.data_rval  =  None
         self.model_segmentation = None
@@ -1201,53 +2971,72 @@ class ICP(object):
         self.data_list = []
         self.model_edge_map = None
         self.data_edge_map = None
+        self.model_normals = None
+        self.data_normals = None
+
+    @property
+    def original_model_im(self):
+        '''
+        The model image as read from its file.  Since few runs need it, the
+        file is opened for it only on first use.
+        '''
+        if self._original_model_im is None and self.model_image_file:
+            self._original_model_im = Image.open(self.model_image_file)
+        return self._original_model_im
+
+    @original_model_im.setter
+    def original_model_im(self, im):
+        self._original_model_im = im
+
+    @property
+    def original_data_im(self):
+        '''
+        The data image as read from its file, opened on first use.
+        '''
+        if self._original_data_im is None and self.data_image_file:
+            self._original_data_im = Image.open(self.data_image_file)
+        return self._original_data_im
+
+    @original_data_im.setter
+    def original_data_im(self, im):
+        self._original_data_im = im
 
     def extract_pixels_from_color_image(self, model_or_data):
         if model_or_data == "model":
             im = self.model_im
         else:
             im = self.data_im
+        # Only a thumbnail of calculation_image_size is needed, so a JPEG that has not been decoded
+        # yet is decoded at the smallest of the scales 1/2, 1/4, and 1/8 that still leaves at least
+        # three times the thumbnail size along each side.  For the other formats, draft() does
+        # nothing:
+        reduced_size = 3 * self.calculation_image_size
+        im.draft(im.mode, (reduced_size, reduced_size))
+        if self.feature_cache is not None:
+            # The same image extracted with the same parameters yields the same pixels:
+            cache_key = self._feature_cache_key(im)
+            features = self.feature_cache.get(cache_key)
+            if features is not None:
+                self._restore_cached_features(model_or_data, features)
+                return
         im = im.convert('L')        ## convert to gray level
         im.thumbnail( (self.calculation_image_size, self.calculation_image_size), Image.ANTIALIAS )
         if self.debug1: im.show()
         width,height = im.size
         if self.debug1: print("width: %d    height: %d" % (width, height))
         if self.corners_or_edges == "edges":
-            dx = numpy.zeros((height, width), dtype="float")
-            dy = numpy.zeros((height, width), dtype="float")
-            rval = numpy.zeros((height, width), dtype="float")  # rval at a pixel = determinant / trace^2
             result_im = Image.new("1", (width,height), 0)
-            edge_im = Image.new("L", (width,height), 0)
             edge_pixel_list = []    
-            corner_pixels = []
             # Note that array indexing is 'opposite' of the image indexing with the first index along 
             # what is y for the image and the second index along what is x for the image.  For the image,
             # x is the horizontal axis to the right, y is the vertical axis pointing downwards.  In what 
             # follows, we treat i and j as the image coordinates.  That is, i increments horizontally to 
             # the right and j increments vertically downwards:
-            for i in range(3,width-3):
-                for j in range(3,height-3):
-                    ip1,im1,jp1,jm1 = i+1,i-1,j+1,j-1
-                    dx[(j,i)] = (im.getpixel((ip1,jm1)) + 2*im.getpixel((ip1,j)) + \
-                                 im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                                 2*im.getpixel((im1,j)) + im.getpixel((im1,jp1))) 
-                    dy[(j,i)] = (im.getpixel((im1,jp1)) + 2*im.getpixel((i,jp1)) + \
-                                 im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                                 2*im.getpixel((i,jm1)) + im.getpixel((ip1,jm1))) 
-            edge_pixel_dict = {}
-            for i in range(3,width-3):                 # i is for horizontal axis to the right
-                for j in range(3,height-3):            # j is for vertical axis to the bottom
-                    edge_strength = math.sqrt(dx[(j,i)]**2 + dy[(j,i)]**2)
-                    edge_im.putpixel((i,j), int(edge_strength))   
-                    if edge_strength > self.edge_detection_threshold:            
-                        edge_pixel_dict["e_" + str(i) + "_" + str(j)] = edge_strength
-            sorted_edge_pixels = sorted(edge_pixel_dict.keys(), \
-                                          key=lambda x: edge_pixel_dict[x], reverse=True)
-            if len(sorted_edge_pixels) > self.max_num_of_pixels_used_for_icp:
-                sorted_edge_pixels = sorted_edge_pixels[0:self.max_num_of_pixels_used_for_icp]
-            for pixel_label in sorted_edge_pixels: 
-                parts = re.split(r'_', pixel_label)
-                i_index,j_index = int(parts[-2]), int(parts[-1])
+            strongest_edge_pixels, edge_strength, dx, dy = edge_pixels(numpy.asarray(im),
+                                   self.edge_detection_threshold, self.max_num_of_pixels_used_for_icp,
+                                   self.thin_edges, self.edge_detection_low_threshold)
+            edge_im = Image.fromarray(numpy.minimum(edge_strength, 255).astype("uint8"), "L")
+            for i_index,j_index in strongest_edge_pixels.tolist():
                 edge_pixel_list.append((i_index,j_index))
                 result_im.putpixel((i_index,j_index), 255)
             if self.debug1: result_im.show()
@@ -1256,126 +3045,48 @@ class ICP(object):
                 self.model_im = result_im
                 self.model_list = edge_pixel_list
                 self.model_edge_map = edge_im
+                self.model_normals = _gradient_normals(dx, dy, edge_pixel_list)
                 if self.debug1: edge_im.save("model_edge_image.jpg")
             else:
                 if self.debug1: result_im.save("data_image_pixels_retained.jpg")
                 self.data_im = result_im
                 self.data_list = edge_pixel_list
                 self.data_edge_map = edge_im
+                self.data_normals = _gradient_normals(dx, dy, edge_pixel_list)
                 if self.debug1: edge_im.save("data_edge_image.jpg")
         else:
             # We want to use corners for ICP:
-            im2 = im.copy()
-            if self.smoothing_low_medium_or_high == "low":
-                how_much_smoothing = 1
-            elif self.smoothing_low_medium_or_high == "medium":
-                how_much_smoothing = 5
-            elif self.smoothing_low_medium_or_high == "high":
-                how_much_smoothing = 10
-            else:
+            if self.smoothing_low_medium_or_high not in ("low", "medium", "high"):
                 sys.exit('''\n\nYour value for smoothing_low_medium_or_high parameter must be '''
                          '''either "low", or "medium", or "high" ''')
-            for i in range(how_much_smoothing):
-                im2 = im2.filter(ImageFilter.BLUR) 
-            if self.debug1: im2.show()
-            hist = im2.histogram()
-            total_count = functools.reduce(lambda x,y: x+y, hist)
-            coarseness = 8              # make it a divisor of 256
-            probs = [functools.reduce(lambda x,y: x+y, hist[coarseness*i:coarseness*i+coarseness])/float(total_count)
-                                                     for i in range(int(len(hist)/coarseness))]
-            prob_times_graylevel = [coarseness * i * probs[i] for i in range(len(probs))]
-            mu_T = functools.reduce(lambda x,y: x+y, prob_times_graylevel)       # mean for the image
-            prob_times_graysquared = [(coarseness * i - mu_T)**2 * probs[i] for i in range(len(probs))]
-            sigma_squared_T = functools.reduce(lambda x,y: x+y, prob_times_graysquared)
-            m0 = [functools.reduce(lambda x,y: x+y, probs[:k]) for k in range(1,len(probs)+1)]
-            m1 = [functools.reduce(lambda x,y: x+y, prob_times_graylevel[:k]) for k in range(1,len(probs)+1)]
-            sigmaB_squared = [None] * len(m0)          # for between-class variance as a func of threshold
-            sigmaW_squared = [None] * len(m0)          # for within-class variance as a func of threshold
-            variance_ratio = [None] * len(m0)          # for the ratio of the two variances
-            for k in range(len(m0)):
-                if 0 < m0[k] < 1.0:
-                    sigmaB_squared[k] = (mu_T * m0[k] - m1[k])**2 / (m0[k] * (1.0 - m0[k]))
-                    sigmaW_squared[k] = sigma_squared_T - sigmaB_squared[k]
-                    variance_ratio[k] = sigmaB_squared[k] / sigmaW_squared[k]
-            variance_ratio_without_none = [x for x in variance_ratio if x is not None ]
-            otsu_threshold = variance_ratio.index(max(variance_ratio_without_none)) * coarseness
+            if self.image_polarity not in (1, -1):
+                sys.exit("You did not specify image polarity")
+            segmented_im2, otsu_threshold = otsu_segmentation(im, self.image_polarity, 
+                                                              self.smoothing_low_medium_or_high)
             if self.debug1: print( "\nbest threshold: %s" % str(otsu_threshold))
-            segmented_im2 = Image.new("1", (width,height), 0)            
-            for i in range(width):
-                for j in range(height):
-                    if self.image_polarity == 1:
-                        if im2.getpixel((i,j)) > otsu_threshold: segmented_im2.putpixel((i,j), 255)
-                    elif self.image_polarity == -1:
-                        if im2.getpixel((i,j)) < otsu_threshold: segmented_im2.putpixel((i,j), 255)
-                    else:
-                        sys.exit("You did not specify image polarity")
             if self.debug1: segmented_im2.show()
-            dx = numpy.zeros((height, width), dtype="float")
-            dy = numpy.zeros((height, width), dtype="float")
-            rval = numpy.zeros((height, width), dtype="float")  # rval at a pixel = determinant / trace^2
-            corner_pixels = []
             # Note that array indexing is 'opposite' of the image indexing with the first index along what 
             # is y for the image and the second index along what is x for the image.  For the image, x is 
             # the horizontal axis to the right, y is the vertical axis pointing downwards.  In what follows, 
             # we treat i and j as the image coordinates.  That is, i increments horizontally to the right
             # and j increments vertically downwards:
-            for i in range(3,width-3):
-                for j in range(3,height-3):
-                    if segmented_im2.getpixel((i,j)) == 255:
-                        ip1,im1,jp1,jm1 = i+1,i-1,j+1,j-1
-                        dx[(j,i)] = (im.getpixel((ip1,jm1)) + 2*im.getpixel((ip1,j)) + \
-                                     im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                                     2*im.getpixel((im1,j)) + im.getpixel((im1,jp1))) 
-                        dy[(j,i)] = (im.getpixel((im1,jp1)) + 2*im.getpixel((i,jp1)) + \
-                                     im.getpixel((ip1,jp1))) -  (im.getpixel((im1,jm1)) + \
-                                     2*im.getpixel((i,jm1)) + im.getpixel((ip1,jm1))) 
+            object_mask = numpy.asarray(segmented_im2.convert("L"), dtype="uint8") == 255
+            dx, dy = _sobel_gradients(numpy.asarray(im, dtype="float"))
+            # The gradients are only needed at the object pixels:
+            dx[~object_mask] = 0.0
+            dy[~object_mask] = 0.0
             if self.debug1:
                 self.display_array_as_image(dx)
                 self.display_array_as_image(dy)
-            corners_im = Image.new("1", (width,height), 0)
-            for i in range(3,width-3):                 # i is for horizontal axis to the right
-                for j in range(3,height-3):            # j is for vertical axis to the bottom
-                    if segmented_im2.getpixel((i,j)) == 255:
-                        Cmatrix = numpy.zeros((2, 2), dtype="float")
-                        c11=c12=c22=0.0
-                        for k in range(i-2,i+3):            # k is horizontal
-                            for l in range(j-2,j+3):        # l is vertical
-                                c11 += dx[(l,k)] * dx[(l,k)] 
-                                c12 += dx[(l,k)] * dy[(l,k)] 
-                                c22 += dy[(l,k)] * dy[(l,k)] 
-                        Cmatrix[(0,0)] = c11
-                        Cmatrix[(0,1)] = c12
-                        Cmatrix[(1,0)] = c12
-                        Cmatrix[(1,1)] = c22
-                        determinant = numpy.linalg.det(Cmatrix)
-                        trace       = numpy.trace(Cmatrix)                
-                        ratio = 0.0
-                        if trace != 0.0:
-                            ratio = determinant / (trace * trace)
-                        rval[(j,i)] = ratio
-                        if abs(ratio) > self.corner_detection_threshold:
-                            corner_pixels.append((i,j))
-                            corners_im.putpixel((i,j), 255)
+            # rval at a pixel = determinant / trace^2 of the structure tensor summed over 5x5 pixels:
+            rval = _corner_response(dx, dy, object_mask)
+            is_corner = numpy.abs(rval) > self.corner_detection_threshold
+            corners_im = Image.fromarray(numpy.where(is_corner, 255, 0).astype("uint8"), "L").convert("1")
             if self.debug1: corners_im.show()
-            singular_corners_im = Image.new("1", (width,height), 0)      
-            singular_corners = []
-            for candidate in corner_pixels:
-                i,j = candidate
-                non_singular_corner_found = False
-                for corner in corner_pixels:
-                    if corner == candidate: continue
-                    k,l = corner
-                    if abs(i-k) <=1 and abs(j-l) <= 1:
-                        if rval[(j,i)] <= rval[(l,k)]:
-                            non_singular_corner_found = True
-                            break
-                if non_singular_corner_found: continue
-                singular_corners.append(candidate)
-                singular_corners_im.putpixel((i,j), 255)
-            singular_corners.sort(key = lambda x: rval[(x[1],x[0])], reverse=True)
+            # A corner is retained only if its rval exceeds that of every other corner in its 3x3
+            # neighborhood.  The retained corners are then ordered by decreasing rval:
+            singular_corners = _non_maximum_corners(rval, is_corner, self.max_num_of_pixels_used_for_icp)
             sorted_singular_corners_im = Image.new("1", (width,height), 0)      
-            if len(singular_corners) > self.max_num_of_pixels_used_for_icp:
-                singular_corners = singular_corners[0:self.max_num_of_pixels_used_for_icp]
             for corner in singular_corners:
                 sorted_singular_corners_im.putpixel(corner, 255)
             if self.debug1: sorted_singular_corners_im.show()
@@ -1393,6 +3104,79 @@ class ICP(object):
                 self.data_all_corners = corners_im
                 self.data_list = singular_corners
                 self.data_rval = rval
+        if self.feature_cache is not None:
+            self.feature_cache.put(cache_key, self._cacheable_features(model_or_data))
+
+    def _feature_cache_key(self, im):
+        '''
+        The key of the pixels extracted from the color image im in the feature cache.
+        '''
+        params = { "calculation_image_size" : self.calculation_image_size,
+                   "corners_or_edges" : self.corners_or_edges,
+                   "max_num_of_pixels_used_for_icp" : self.max_num_of_pixels_used_for_icp }
+        if self.corners_or_edges == "edges":
+            params.update( { "edge_detection_threshold" : self.edge_detection_threshold,
+                             "edge_detection_low_threshold" : self.edge_detection_low_threshold,
+                             "thin_edges" : self.thin_edges } )
+        else:
+            params.update( { "corner_detection_threshold" : self.corner_detection_threshold,
+                             "image_polarity" : self.image_polarity,
+                             "smoothing_low_medium_or_high" : self.smoothing_low_medium_or_high } )
+        return self.feature_cache.key(im, params)
+
+    def _cacheable_features(self, model_or_data):
+        '''
+        Packs what extract_pixels_from_color_image() computed for the model or
+        the data into a dict of numpy arrays for the feature cache.
+        '''
+        pixel_list = self.model_list if model_or_data == "model" else self.data_list
+        pixel_im = self.model_im if model_or_data == "model" else self.data_im
+        features = { "pixels" : numpy.array(pixel_list, dtype="int").reshape(-1,2),
+                     "pixel_image" : numpy.asarray(pixel_im.convert("L")) }
+        if self.corners_or_edges == "edges":
+            edge_map = self.model_edge_map if model_or_data == "model" else self.data_edge_map
+            normals = self.model_normals if model_or_data == "model" else self.data_normals
+            features["edge_map"] = numpy.asarray(edge_map)
+            features["normals"] = normals
+        else:
+            if model_or_data == "model":
+                segmentation, all_corners, rval = \
+                                   self.model_segmentation, self.model_all_corners, self.model_rval
+            else:
+                segmentation, all_corners, rval = \
+                                   self.data_segmentation, self.data_all_corners, self.data_rval
+            features["segmentation"] = numpy.asarray(segmentation.convert("L"))
+            features["all_corners"] = numpy.asarray(all_corners.convert("L"))
+            features["rval"] = rval
+        return features
+
+    def _restore_cached_features(self, model_or_data, features):
+        '''
+        The inverse of _cacheable_features().
+        '''
+        binary_image = lambda name: Image.fromarray(features[name], "L").convert("1")
+        pixel_list = [tuple(pixel) for pixel in features["pixels"].tolist()]
+        if model_or_data == "model":
+            self.model_im = binary_image("pixel_image")
+            self.model_list = pixel_list
+        else:
+            self.data_im = binary_image("pixel_image")
+            self.data_list = pixel_list
+        if self.corners_or_edges == "edges":
+            edge_map = Image.fromarray(features["edge_map"], "L")
+            if model_or_data == "model":
+                self.model_edge_map, self.model_normals = edge_map, features["normals"].copy()
+            else:
+                self.data_edge_map, self.data_normals = edge_map, features["normals"].copy()
+        else:
+            if model_or_data == "model":
+                self.model_segmentation = binary_image("segmentation")
+                self.model_all_corners = binary_image("all_corners")
+                self.model_rval = features["rval"].copy()
+            else:
+                self.data_segmentation = binary_image("segmentation")
+                self.data_all_corners = binary_image("all_corners")
+                self.data_rval = features["rval"].copy()
 
     def condition_data(self):
         '''
@@ -1410,9 +3194,11 @@ class ICP(object):
         if num_of_data_pixels > num_of_model_pixels:
             how_many = int( num_of_model_pixels + cutoff * min_count )
             self.data_list = self.data_list[0:how_many]
+            if self.data_normals is not None: self.data_normals = self.data_normals[0:how_many]
         else:
             how_many = int( num_of_data_pixels + cutoff * min_count )
             self.model_list = self.model_list[0:how_many]
+            if self.model_normals is not None: self.model_normals = self.model_normals[0:how_many]
         if self.debug1:
             _print_points("\nmodel list (in pixel coords) in `condition_data()': ", self.model_list)
             _print_points("\ndata list (in pixel coords) in `condition_data()': ", self.data_list)
@@ -1452,29 +3238,22 @@ class ICP(object):
         save_im.save(label + ".jpg")
 
     def extract_pixels_from_binary_image(self, model_or_data):
+        if model_or_data not in ("model", "data"):
+            sys.exit("Wrong arg used for extract_pixels_from_binary_image()")
+        im = self.model_im if model_or_data == "model" else self.data_im
+        if im.size[0] > 100:
+            im.thumbnail( (self.calculation_image_size, self.calculation_image_size), Image.ANTIALIAS )
+        im = im.convert("L").convert("1")
+        pixels = _binary_image_pixels(numpy.asarray(im.convert("L")))
+        if self.binary_subsampling != "none":
+            pixels = _subsample_pixels(pixels, self.max_num_of_pixels_used_for_icp, self.binary_subsampling)
+        pixel_list = [tuple(pixel) for pixel in pixels.tolist()]
         if model_or_data == "model":
-            self.model_list = []
-            if self.model_im.size[0] > 100:
-                self.model_im.thumbnail( (self.calculation_image_size,\
-                                 self.calculation_image_size), Image.ANTIALIAS )
-            self.model_im = self.model_im.convert("L").convert("1")
-            width, height =  self.model_im.size
-            for i in range(3,width-3): 
-                for j in range(3,height-3):
-                    if ( self.model_im.getpixel((i,j)) != 0 ):  
-                        self.model_list.append( (i,j) )       
-        elif model_or_data == "data":
-            self.data_list = []
-            if self.data_im.size[0] > 100:
-                self.data_im.thumbnail( (self.calculation_image_size,\
-                                     self.calculation_image_size), Image.ANTIALIAS )
-            self.data_im = self.data_im.convert("L").convert("1")
-            width, height =  self.data_im.size
-            for i in range(3,width-3): 
-                for j in range(3,height-3):
-                    if ( self.data_im.getpixel((i,j)) != 0 ):  
-                        self.data_list.append( (i,j) )       
-        else: sys.exit("Wrong arg used for extract_pixels_from_binary_image()")
+            self.model_im = im
+            self.model_list = pixel_list
+        else:
+            self.data_im = im
+            self.data_list = pixel_list
         if self.debug1:
             if model_or_data == "model":    
                 print("model pixel list %s" % str(self.model_list))
@@ -1504,10 +3283,27 @@ class ICP(object):
             _print_points("\nzero mean model list (pixel coords): ", self.zero_mean_model_list)
             _print_points("\nzero mean data list (pixel coords): ", self.zero_mean_data_list)
 
-    def icp(self):
+    def icp(self, initial_pose=None):
+        '''
+        The optional initial_pose is a guess for the rotation and the
+        translation of the data with respect to the model, in the pixel
+        coordinates of the images used in the calculations, that the
+        iterations start from.  It overrides the initial_pose supplied to
+        the constructor.  See the constructor documentation for the forms it
+        can take.
+        '''
+        if initial_pose is None:
+            initial_pose = self.initial_pose
+        if initial_pose is None and self.prealign:
+            image_size = tuple(map(max, self.model_im.size, self.data_im.size))
+            initial_pose = prealign_points(self.model_list, self.data_list, image_size)
+            print("\nPre-alignment by phase correlation:  rotation %.2f degrees,  translation %s" % 
+                                                           (initial_pose[0], str(initial_pose[1])))
+        swapped = False
         if self.auto_select_model_and_data:
             if len(self.data_list) > len(self.model_list):
                 print("\n>>>> SWAPPING THE MODEL AND THE DATA IMAGES <<<<\n\n")
+                swapped = True
                 self.data_im, self.model_im = self.model_im, self.data_im
                 self.data_list, self.model_list = self.model_list, self.data_list
                 self.data_rval, self.model_rval = self.model_rval, self.data_rval
@@ -1516,115 +3312,194 @@ class ICP(object):
                 self.data_all_corners, self.model_all_corners = \
                                     self.model_all_corners, self.data_all_corners
                 self.data_edge_map, self.model_edge_map = self.model_edge_map, self.data_edge_map
+                self.data_normals, self.model_normals = self.model_normals, self.data_normals
         self.move_to_model_origin()
-        old_error = float('inf')
-        R = numpy.matrix( [[1.0, 0.0],[0.0, 1.0]] )
-        T = (numpy.matrix([[0.0, 0.0]])).T
-        self.R = R
-        self.T = T
+        self.R = numpy.matrix( [[1.0, 0.0],[0.0, 1.0]] )
+        self.T = (numpy.matrix([[0.0, 0.0]])).T
         self.R_for_iterations = {i : None for i in range(self.iterations)}
         self.T_for_iterations = {i : None for i in range(self.iterations)}
-        model = self.zero_mean_model_list
-        data = self.zero_mean_data_list
-        model_dict = {"m" + str(i) : model[i] for i in range(len(model))}
-        data_dict  = {"d" + str(i) : data[i] for i in range(len(data))}
+        model = numpy.array(self.zero_mean_model_list, dtype="float").reshape(-1,2)
+        data = numpy.array(self.zero_mean_data_list, dtype="float").reshape(-1,2)
         if self.debug2:
-            _print_points_in_dict("\nmodel dict: ", model_dict)
-            _print_points_in_dict("\ndata_dict: ", data_dict)
-        error_for_iterations = []
-        iteration = 0
+            _print_points("\nmodel points: ", model)
+            _print_points("\ndata points: ", data)
+        model_tree, model_normals = self._prepare_model(model, self.model_normals)
+        initial_R = initial_T = None
+        if initial_pose is not None:
+            R0, T0 = _initial_pose_about_origin(initial_pose, (0,0))
+            if swapped:
+                # The guess is for the images in the order supplied, so it must be inverted:
+                R0, T0 = R0.T, -R0.T.dot(T0)
+            initial_R, initial_T = _initial_pose_about_origin((R0, T0), self.model_mean)
+        self.pyramid_level_results = []
+        if self.pyramid_levels > 1:
+            initial_R, initial_T = self._pyramid_initial_pose(swapped, initial_pose)
         self.dir_name_for_results = "__result_" + str(self.subimage_index)
         if os.path.exists(self.dir_name_for_results):
             files = glob.glob(self.dir_name_for_results + "/*")
             map(lambda x: os.remove(x), files)
         else:
             os.mkdir(self.dir_name_for_results)
-        while 1:
-            if iteration == self.iterations: 
-                print("\n\n\n***** FINAL RESULTS ****** FINAL RESULTS ****** FINAL RESULTS ****** FINAL RESULTS ****")
-                print("\n\nImage size used in calculations:  width: %d  height: %d" % self.data_im.size)
-                print("\nModel mean used for calculations: ") 
-                print(str(self.model_mean))
-                print("\nFinal rotation and translation of the data image with respect to the model mean: ")
-                print("\nRotation:")
-                print(str(self.R)) 
-                print("\nTranslation:")
-                print(str(self.T))
-                print("\nData to Model Image Registration Error as a function of iterations: %s" % str(error_for_iterations))
-                break
+        displayWidth,displayHeight = self.data_im.size
+        model_mean = numpy.array([self.model_mean[0,0], self.model_mean[1,0]])
+        def save_iteration_result(iteration, R, T, error, number_of_points_matched):
             if self.subimage_index is None:
-                print("\n\n             STARTING ITERATION %s OUT OF %s\n" % (str(iteration+1), str(self.iterations)))
+                print("\n\n             DONE WITH ITERATION %s OUT OF %s\n" % (str(iteration+1), str(self.iterations)))
             else:
-                print("\n\n  For subimages indexed %s   ==>  STARTING ITERATION %s OUT OF %s\n" % (str(self.subimage_index), str(iteration+1), str(self.iterations)))
-            if self.debug2: _print_points_in_dict("\ndata_dict in loop: ", data_dict)
-            xformed_data_dict = {d : R * (numpy.matrix( list(data_dict[d]) )).T + T for d in data_dict}
-            xformed_data_dict = {d : (xformed_data_dict[d][0,0], xformed_data_dict[d][1,0]) \
-                                                                        for d in xformed_data_dict}
-            if self.debug2: _print_points_in_dict("\ntransformed data_dict in loop: ", xformed_data_dict)
-            leastDistMapping, error_dict = \
-              _least_dist_mapping(xformed_data_dict,model_dict,self.pixel_correspondence_dist_threshold)
-            number_of_points_matched = len([x for x in leastDistMapping \
-                                               if leastDistMapping[x] is not None])
-            if self.debug2:
-                print("\nleastDistMapping: ", [item[0]+"=>"+item[1] for item in sorted(leastDistMapping.items(),
-                    lambda x,y: cmp(int(x[0].lstrip('md')),int(y[0].lstrip('md')))) if item[1] is not None])
-            if self.debug2: _print_float_values_dict("\nerror values at data points: ", error_dict)
-            if self.debug2: print("\nnumber of points matched: %s" % str(number_of_points_matched))
-            error = functools.reduce(lambda x, y: x + y, [error_dict[x] for x in error_dict if error_dict[x] is not None])
-            error = error / number_of_points_matched
-            error_for_iterations.append(error)
-            if self.debug2: print("\nold_error: %s    error: %s" % (str(old_error), str(error)))
-            old_error = error
-            # Which model and data points participated in matching:
-            data_labels_used = [d for d in leastDistMapping.keys() if leastDistMapping[d] is not None]
-            data_labels_used.sort(key = lambda x: int(x.lstrip('md')))
-            model_labels_used = [leastDistMapping[d] for d in data_labels_used]
-            if self.debug2: print("\ndata labels used: %s" % str(data_labels_used))
-            if self.debug2: print("\nmodel labels used: %s" % str(model_labels_used)) 
-            # Construct A matrix from data pixels:
-            A = numpy.matrix([[data_dict[d][0] for d in data_labels_used],[data_dict[d][1] for d in data_labels_used]])
-            if self.debug2: print("\nA matrix: %s" % str(A))
-            # Now construct AATI matrix:
-            AATI = A.T * numpy.linalg.inv( A * A.T )
-            if self.debug2: print("\nAATI matrix: %s" % str(AATI))
-            # Next construct B matrix from model pixels:
-            B =  numpy.matrix([ [model_dict[m][0] - T[0,0] for m in model_labels_used], 
-                                [model_dict[m][1] - T[1,0] for m in model_labels_used] ])
-            if self.debug2: print("\nB matrix: %s" % str(B))
-            matched_model_mean = numpy.matrix(list(_mean_coordinates([(model_dict[m][0], 
-                                          model_dict[m][1]) for m in model_labels_used]))).T
-            if self.debug2: print("\nmatched model mean: %s" % str(matched_model_mean))
-            R_update = B * AATI * R.T
-            [U,S,VT] = numpy.linalg.svd(R_update)
-            U,VT = numpy.matrix(U), numpy.matrix(VT) 
-            deter = numpy.linalg.det(U * VT)
-            U[0,1] = U[0,1] * deter
-            U[1,1] = U[1,1] * deter
-            R_update = U * VT
-            R = R_update * R
+                print("\n\n  For subimages indexed %s   ==>  DONE WITH ITERATION %s OUT OF %s\n" % (str(self.subimage_index), str(iteration+1), str(self.iterations)))
+            self.R, self.T = numpy.matrix(R), numpy.matrix(T).T
+            self.R_for_iterations[iteration], self.T_for_iterations[iteration] = self.R, self.T
             print("\nRotation:")
-            print (R)
-            # Rotate the data for estimating the translation T
-            data_matrix2 = R * A
-            data_transformed_mean = numpy.matrix(list(_mean_coordinates([(data_matrix2[0,j], 
-                                   data_matrix2[1,j]) for j in range(data_matrix2.shape[1])]))).T
-            if self.debug2: print("\ndata transformed mean: %s" % str(data_transformed_mean))
-            T = matched_model_mean - data_transformed_mean  
+            print(self.R)
             print("\nTranslation:")
-            print(T)
-            # This is just for the binary case in the old icp()
-            data_matrix_new = [ R * (numpy.matrix( list(data[p]))).T + T for p in range(len(data)) ] 
-            data_transformed_new = \
-                [ ( p[0,0] + self.model_mean[0,0], p[1,0] + self.model_mean[1,0] ) for p in data_matrix_new]
-            displayWidth,displayHeight = self.data_im.size
+            print(self.T)
+            # Show where all of the data pixels land in the model image at this iteration:
+            data_transformed_new = (data.dot(R.T) + T + model_mean).astype("int")
             result_im = Image.new("1", (displayWidth,displayHeight), 0)
-            for p in data_transformed_new:
-                x,y = int(p[0]), int(p[1])
+            for x,y in data_transformed_new:
                 if ( (0 <= x < displayWidth) and (0 <= y < displayHeight ) ):
-                    result_im.putpixel( (x,y), 255 )
+                    result_im.putpixel( (int(x),int(y)), 255 )
             result_im.save( self.dir_name_for_results + "/__result" + str(iteration) + ".jpg")
-            iteration = iteration + 1
-            self.R,self.T = R,T
+        R, T, error_for_iterations, stop_reason = self._run_icp_kernel(model, data, model_tree, 
+                      model_normals, save_iteration_result, initial_R, initial_T)
+        self.error_for_iterations = error_for_iterations
+        self.iterations_run = len(error_for_iterations)
+        self.stop_reason = stop_reason
+        print("\n\n\n***** FINAL RESULTS ****** FINAL RESULTS ****** FINAL RESULTS ****** FINAL RESULTS ****")
+        print("\n\nImage size used in calculations:  width: %d  height: %d" % self.data_im.size)
+        print("\nModel mean used for calculations: ") 
+        print(str(self.model_mean))
+        print("\nFinal rotation and translation of the data image with respect to the model mean: ")
+        print("\nRotation:")
+        print(str(self.R)) 
+        print("\nTranslation:")
+        print(str(self.T))
+        print("\nData to Model Image Registration Error as a function of iterations: %s" % str(error_for_iterations))
+        print("\nNumber of iterations carried out: %d    (stopped on: %s)" % (self.iterations_run, self.stop_reason))
+
+    def _prepare_model(self, model, gradient_normals=None):
+        '''
+        Returns the KD-tree for the zero-mean model points when the 'kdtree'
+        correspondence backend is in use and the model normals when the
+        point-to-line error metric is in use, None otherwise.
+        '''
+        model_tree = None
+        if self.correspondence_backend == "kdtree":
+            # The model points do not move during the iterations, so the tree is built just once:
+            model_tree = cKDTree(model)
+        model_normals = None
+        if self.error_metric == "point_to_line":
+            # Use the image gradients at the model pixels when they are available and estimate the
+            # normals from the neighboring model pixels otherwise:
+            if gradient_normals is not None and len(gradient_normals) == len(model):
+                model_normals = gradient_normals
+            else:
+                model_normals = _estimate_normals(model)
+        return model_tree, model_normals
+
+    def _run_icp_kernel(self, model, data, model_tree, model_normals, callback=None,
+                              initial_R=None, initial_T=None):
+        return _icp_kernel(model, data, self.iterations, 
+                      self.pixel_correspondence_dist_threshold, model_tree = model_tree, 
+                      callback = callback, debug = self.debug2,
+                      error_change_threshold = self.error_change_threshold,
+                      rotation_change_threshold = self.rotation_change_threshold,
+                      translation_change_threshold = self.translation_change_threshold,
+                      max_seconds_for_icp = self.max_seconds_for_icp,
+                      initial_R = initial_R, initial_T = initial_T,
+                      model_normals = model_normals, trim_fraction = self.trim_fraction,
+                      robust_weighting = self.robust_weighting,
+                      robust_weighting_scale = self.robust_weighting_scale)
+
+    def _extract_pixels_at_size(self, calculation_image_size, swapped):
+        '''
+        Extracts the model and the data pixels from the original images as
+        they would be extracted for the given calculation_image_size.  This
+        is done on a shallow copy of the instance so that none of the
+        attributes set by the earlier calls to the extraction methods are
+        disturbed.  Returns the copy.
+        '''
+        level = copy.copy(self)
+        level.calculation_image_size = calculation_image_size
+        level.debug1 = 0
+        # The files are opened afresh so that each level can decode them at its own reduced scale:
+        level.model_im = Image.open(self.model_image_file)
+        level.data_im = Image.open(self.data_image_file)
+        for model_or_data in ("model", "data"):
+            if self.binary_or_color == "binary":
+                level.extract_pixels_from_binary_image(model_or_data)
+            else:
+                level.extract_pixels_from_color_image(model_or_data)
+        if swapped:
+            level.model_im, level.data_im = level.data_im, level.model_im
+            level.model_list, level.data_list = level.data_list, level.model_list
+            level.model_normals, level.data_normals = level.data_normals, level.model_normals
+        return level
+
+    def _pyramid_initial_pose(self, swapped, initial_pose=None):
+        '''
+        Runs ICP at the pyramid_levels-1 coarser resolutions, from the
+        coarsest to the finest, with each level starting from the pose found
+        at the previous level and the coarsest level starting from
+        initial_pose when it is supplied.  Returns the resulting pose as the initial R
+        and T for the iterations at calculation_image_size.  The pose is
+        carried from one level to the next in image coordinates, where only
+        the translation depends on the resolution.
+        '''
+        final_width = self.model_im.size[0]
+        final_mean = numpy.array([self.model_mean[0,0], self.model_mean[1,0]])
+        R, t, width = numpy.eye(2), numpy.zeros(2), None
+        if initial_pose is not None:
+            R, t = _initial_pose_about_origin(initial_pose, (0,0))
+            if swapped:
+                R, t = R.T, -R.T.dot(t)
+            width = final_width
+        for level_index in range(self.pyramid_levels - 1, 0, -1):
+            size = int(self.calculation_image_size / 2**level_index)
+            if size < 16: continue
+            level = self._extract_pixels_at_size(size, swapped)
+            if len(level.model_list) == 0 or len(level.data_list) == 0: continue
+            level_width = level.model_im.size[0]
+            if width is not None:
+                t = t * float(level_width) / width
+            width = level_width
+            model = numpy.array(level.model_list, dtype="float").reshape(-1,2)
+            data = numpy.array(level.data_list, dtype="float").reshape(-1,2)
+            model_mean = model.mean(axis=0)
+            model, data = model - model_mean, data - model_mean
+            model_tree, model_normals = self._prepare_model(model, level.model_normals)
+            initial_R, initial_T = _initial_pose_about_origin((R, t), model_mean)
+            try:
+                R, T, error_for_iterations, stop_reason = self._run_icp_kernel(model, data, 
+                                           model_tree, model_normals, None, initial_R, initial_T)
+            except ValueError:
+                # Nothing matched at this resolution; carry the pose to the next level as it is:
+                continue
+            t = T + model_mean - R.dot(model_mean)
+            self.pyramid_level_results.append((size, len(error_for_iterations), error_for_iterations[-1]))
+            print("\nPyramid level with calculation_image_size %d: %d iterations, error %s" % 
+                                             (size, len(error_for_iterations), str(error_for_iterations[-1])))
+        if width is not None:
+            t = t * float(final_width) / width
+        return _initial_pose_about_origin((R, t), final_mean)
+
+    def _display_font(self, fontsize):
+        '''
+        Returns the font for the labels in the displays of the results,
+        from the file supplied through the font_file option or else from
+        FreeSerif.ttf in the current directory or in the usual Ubuntu
+        location.
+        '''
+        if self.font_file is None:
+            if os.path.isfile("FreeSerif.ttf"):
+                self.font_file = "FreeSerif.ttf"
+            elif os.path.isfile("/usr/share/fonts/truetype/freefont/FreeSerif.ttf"):
+                self.font_file = "/usr/share/fonts/truetype/freefont/FreeSerif.ttf"
+            else:
+                print("Unable to find the font file 'FreeSerif.ttf' needed for displaying the results")
+                print("Use the 'font_file' option in the constructor to specify your own font file")
+                sys.exit(1)
+        return ImageFont.truetype(self.font_file, fontsize)
 
     def display_results_as_movie(self):
         mw = Tkinter.Tk()                       
@@ -1686,7 +3561,7 @@ class ICP(object):
         self.iteration_control_flag = 1
         xpos = int( (width - w_display)/2 )
         ypos = 20
-        for i in range(0,self.iterations):
+        for i in range(0,self.iterations_run):
             result_im = Image.open(self.dir_name_for_results + "/__result" + str(i) + ".jpg")
             (mingray,maxgray) = result_im.getextrema()
             rwidth,rheight = result_im.size
@@ -1698,7 +3573,7 @@ class ICP(object):
                         result_color_im.putpixel((m,n),(0,color_val,0))
             result_color_im.save( self.dir_name_for_results + "/__result_color" + str(i) + ".jpg")
         while self.iteration_control_flag:
-            for i in range(0,self.iterations):
+            for i in range(0,self.iterations_run):
                 try:
                     tkim[i] = Image.open(self.dir_name_for_results + "/__result_color" + str(i) + ".jpg")
                     out_image = ImageChops.add( model_image, tkim[i] )
@@ -1709,7 +3584,7 @@ class ICP(object):
                     label_image.place(x=xpos,y=ypos,width=w_display,height=h_display)
                     iterationLabelText.set( "Iteration Number: " + str(i+1) )
                     self.iteration_control_flag = 0
-                    if i < self.iterations - 1: mw.after(1000, mw.quit)       
+                    if i < self.iterations_run - 1: mw.after(1000, mw.quit)       
                     mw.mainloop(0)
                 except IOError: pass       
 
@@ -1775,7 +3650,7 @@ class ICP(object):
             fontsize = 25
         else:
             fontsize = 15
-        font = ImageFont.truetype(self.font_file, fontsize)
+        font = self._display_font(fontsize)
         data_image_width, data_image_height = self.data_im.size
         orig_image_width,orig_image_height = self.original_model_im.size
         original_model_im = self.original_model_im.copy()
@@ -1858,7 +3733,7 @@ class ICP(object):
             fontsize = 25
         else:
             fontsize = 15
-        font = ImageFont.truetype(self.font_file, fontsize)
+        font = self._display_font(fontsize)
         data_image_width, data_image_height = self.data_im.size
         orig_image_width,orig_image_height = self.original_model_im.size
         original_model_im = self.original_model_im.copy()
@@ -1945,7 +3820,7 @@ class ICP(object):
             fontsize = 25
         else:
             fontsize = 15
-        font = ImageFont.truetype(self.font_file, fontsize)
+        font = self._display_font(fontsize)
         data_image_width, data_image_height = self.data_im.size
         orig_image_width,orig_image_height = self.original_model_im.size
         orig_image_width,orig_image_height = 5 * orig_image_width, 5 * orig_image_height
@@ -4,6 +4,18 @@ import unittest
 import TestPixelAcquisitionModel
 import TestPixelAcquisitionData
 import TestFontFileAvailability 
+import TestCorrespondenceBackends
+import TestICPKernel
+import TestRegister
+import TestRobustICP
+import TestPyramid
+import TestInitialPose
+import TestPrealign
+import TestScanMatcher
+import TestPixelExtraction
+import TestFeatureCache
+import TestImageDecoding
+import TestModelIndex
 
 class ICPTestCase( unittest.TestCase ):
     def checkVersion(self):
@@ -15,6 +27,18 @@ for test_type in [
             TestPixelAcquisitionModel,
             TestPixelAcquisitionData,
             TestFontFileAvailability, 
+            TestCorrespondenceBackends,
+            TestICPKernel,
+            TestRegister,
+            TestRobustICP,
+            TestPyramid,
+            TestInitialPose,
+            TestPrealign,
+            TestScanMatcher,
+            TestPixelExtraction,
+            TestFeatureCache,
+            TestImageDecoding,
+            TestModelIndex,
     ]:
     testSuites.append(test_type.getTestSuites('test'))
 
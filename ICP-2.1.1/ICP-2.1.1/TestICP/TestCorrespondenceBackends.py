@@ -0,0 +1,43 @@
+import ICP
+import numpy
+import random
+import unittest
+
+class TestCorrespondenceBackends(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        # Integer pixel coordinates shifted by a non-integer mean produce lots of exact ties:
+        self.model = [(random.randint(0,60) - 30.4, random.randint(0,60) - 29.7) for _ in range(200)]
+        self.data  = [(random.randint(0,60) - 30.4, random.randint(0,60) - 29.7) for _ in range(150)]
+        self.model_dict = {"m" + str(i) : self.model[i] for i in range(len(self.model))}
+        self.data_dict  = {"d" + str(i) : self.data[i] for i in range(len(self.data))}
+
+    def check_against_least_dist_mapping(self, model_tree):
+        for threshold in (2, 5, 100):
+            mapping, errors = ICP._least_dist_mapping(self.data_dict, self.model_dict, threshold)
+            indexes, dists = ICP._closest_model_points(numpy.array(self.data), 
+                                      numpy.array(self.model), threshold, model_tree)
+            for i in range(len(self.data)):
+                d = "d" + str(i)
+                if mapping[d] is None:
+                    self.assertEqual( indexes[i], -1 )
+                else:
+                    self.assertEqual( "m" + str(indexes[i]), mapping[d] )
+                    self.assertAlmostEqual( dists[i], errors[d] )
+
+    def test_brute_force_mapping(self):
+        print("testing that the array-based brute-force search yields the same correspondences")
+        self.check_against_least_dist_mapping(None)
+
+    @unittest.skipIf(ICP.cKDTree is None, "scipy is not installed")
+    def test_kdtree_mapping(self):
+        print("testing that the kdtree correspondence backend yields the same correspondences")
+        self.check_against_least_dist_mapping(ICP.cKDTree(numpy.array(self.model)))
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestCorrespondenceBackends, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
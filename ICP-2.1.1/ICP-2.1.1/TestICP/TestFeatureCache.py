@@ -0,0 +1,64 @@
+import ICP
+import numpy
+import os
+import unittest
+from Fixtures import ImageTestCase
+
+class TestFeatureCache(ImageTestCase):
+
+    def _extract(self, feature_cache, corners_or_edges="edges", **kwargs):
+        icp = ICP.ICP(model_image="model.png", data_image="data.png", binary_or_color="color",
+                      corners_or_edges=corners_or_edges, calculation_image_size=200, image_polarity=1,
+                      corner_detection_threshold=0.2, max_num_of_pixels_used_for_icp=300,
+                      feature_cache=feature_cache, **kwargs)
+        icp.extract_pixels_from_color_image("model")
+        icp.extract_pixels_from_color_image("data")
+        return icp
+
+    def test_memory_cache(self):
+        print("testing that repeated pixel extraction is served from the feature cache")
+        cache = ICP.FeatureCache(max_entries=4)
+        for corners_or_edges in ("edges", "corners"):
+            expected = self._extract(None, corners_or_edges)
+            self._extract(cache, corners_or_edges)
+            hits = cache.hits
+            cached = self._extract(cache, corners_or_edges)
+            self.assertEqual( cache.hits, hits + 2 )
+            self.assertEqual( cached.model_list, expected.model_list )
+            self.assertEqual( cached.data_list, expected.data_list )
+            self.assertEqual( cached.model_im.tobytes(), expected.model_im.tobytes() )
+            if corners_or_edges == "edges":
+                self.assertEqual( cached.model_edge_map.tobytes(), expected.model_edge_map.tobytes() )
+                self.assertTrue( numpy.array_equal(cached.data_normals, expected.data_normals) )
+            else:
+                self.assertTrue( numpy.array_equal(cached.model_rval, expected.model_rval) )
+                self.assertEqual( cached.data_segmentation.tobytes(), expected.data_segmentation.tobytes() )
+        self.assertEqual( cache.misses, 4 )
+
+    def test_parameters_and_eviction(self):
+        print("testing that the feature cache misses on changed parameters and evicts old entries")
+        cache = ICP.FeatureCache(max_entries=2)
+        self._extract(cache)
+        self._extract(cache, edge_detection_threshold=80)
+        self.assertEqual( (cache.hits, cache.misses), (0, 4) )
+        self.assertEqual( len(cache.entries), 2 )
+        self._extract(cache, edge_detection_threshold=80)
+        self.assertEqual( cache.hits, 2 )
+        self.assertRaises( ValueError, ICP.FeatureCache, 0 )
+
+    def test_disk_cache(self):
+        print("testing that the feature cache is shared through .npz files")
+        expected = self._extract(ICP.FeatureCache(directory="features"))
+        self.assertEqual( len([name for name in os.listdir("features") if name.endswith(".npz")]), 2 )
+        cache = ICP.FeatureCache(directory="features")
+        cached = self._extract(cache)
+        self.assertEqual( (cache.hits, cache.misses), (2, 0) )
+        self.assertEqual( cached.model_list, expected.model_list )
+        self.assertTrue( numpy.array_equal(cached.model_normals, expected.model_normals) )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestFeatureCache, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import ICP
+import math
+import numpy
+import unittest
+
+class TestICPKernel(unittest.TestCase):
+
+    def setUp(self):
+        # A scatter of points and a copy of it that is rotated by 3 degrees and shifted:
+        numpy.random.seed(0)
+        self.model = numpy.random.uniform(-50, 50, (80,2))
+        self.model -= self.model.mean(axis=0)
+        theta = 3 * math.pi / 180
+        self.R_true = numpy.array([[math.cos(theta), -math.sin(theta)],[math.sin(theta), math.cos(theta)]])
+        self.T_true = numpy.array([2.0, -1.5])
+        # data = R_true^-1 (model - T_true), so that R_true data + T_true = model:
+        self.data = (self.model - self.T_true).dot(self.R_true)
+
+    def test_kernel_recovers_rotation_and_translation(self):
+        print("testing that the array-based ICP kernel registers a rotated and shifted pattern")
+        R, T, errors, stop_reason = ICP._icp_kernel(self.model, self.data, 30, 20)
+        self.assertTrue( numpy.allclose(R, self.R_true, atol=1e-3) )
+        self.assertTrue( numpy.allclose(T, self.T_true, atol=1e-2) )
+        self.assertEqual( len(errors), 30 )
+        self.assertEqual( stop_reason, "max_iterations" )
+        self.assertTrue( errors[-1] < errors[0] )
+
+    def test_kernel_stops_on_convergence(self):
+        print("testing that the ICP kernel stops early when the increments become negligible")
+        R, T, errors, stop_reason = ICP._icp_kernel(self.model, self.data, 30, 20,
+                        rotation_change_threshold = 0.001, translation_change_threshold = 0.001)
+        self.assertEqual( stop_reason, "increment_converged" )
+        self.assertTrue( len(errors) < 30 )
+        self.assertTrue( numpy.allclose(R, self.R_true, atol=1e-3) )
+        R, T, errors, stop_reason = ICP._icp_kernel(self.model, self.data, 30, 20,
+                                                    error_change_threshold = 0.01)
+        self.assertEqual( stop_reason, "error_converged" )
+        self.assertTrue( len(errors) < 30 )
+
+    def test_kernel_reproduces_the_label_dict_loop(self):
+        print("testing that the array-based ICP kernel gives the same R, T and errors as the old loop")
+        # Integer pixel coordinates of a scatter and of a copy of it rotated by 5 degrees and shifted:
+        random_state = numpy.random.RandomState(7)
+        model = [tuple(int(v) for v in p) for p in random_state.randint(20, 100, (60,2))]
+        theta = 5 * math.pi / 180
+        data = [(int(round(math.cos(theta) * (x-60) + math.sin(theta) * (y-60) + 57)),
+                 int(round(-math.sin(theta) * (x-60) + math.cos(theta) * (y-60) + 62))) for x,y in model]
+        # R, T and the error history recorded with the icp() of version 2.1.1 on these points:
+        R_recorded = numpy.array([[0.9962761320669119, -0.08621988560528843],
+                                  [0.08621988560528801, 0.9962761320669128]])
+        T_recorded = numpy.array([2.8564790871640193, -2.07812001100758])
+        errors_recorded = [3.278841079958938, 1.962846112212427, 0.7368061604949433, 0.3956845997499461,
+                           0.3960633074638694, 0.3960724991648846, 0.3960726029771976, 0.39607260414281703,
+                           0.39607260415590323, 0.39607260415604706, 0.396072604156047, 0.39607260415604545]
+        result = ICP.register(model, data, iterations = 12, pixel_correspondence_dist_threshold = 20,
+                              correspondence_backend = "brute_force")
+        self.assertTrue( numpy.allclose(result.R, R_recorded, rtol=0, atol=1e-10) )
+        self.assertTrue( numpy.allclose(result.T, T_recorded, rtol=0, atol=1e-10) )
+        self.assertTrue( numpy.allclose(result.error_for_iterations, errors_recorded, rtol=0, atol=1e-10) )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestICPKernel, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import ICP
+import unittest
+from PIL import Image
+from PIL import ImageDraw
+from Fixtures import ImageTestCase
+
+class TestImageDecoding(ImageTestCase):
+
+    def make_images(self):
+        # JPEGs large enough to be decoded in draft mode:
+        im = Image.new("RGB", (1600,1200), (0,0,0))
+        ImageDraw.Draw(im).rectangle([400,300,1200,900], fill=(200,180,160))
+        im.save("model.jpg")
+        im.save("data.jpg")
+
+    def test_lazy_draft_decoding(self):
+        print("testing that the original images are opened lazily and JPEGs are decoded in draft mode")
+        icp = ICP.ICP(model_image="model.jpg", data_image="data.jpg", binary_or_color="color",
+                      calculation_image_size=200, max_num_of_pixels_used_for_icp=300)
+        self.assertTrue( icp._original_model_im is None and icp._original_data_im is None )
+        model_im = icp.model_im
+        icp.extract_pixels_from_color_image("model")
+        # Half the size of the JPEG is the smallest scale that is at least three times the thumbnail:
+        self.assertEqual( model_im.size, (800,600) )
+        self.assertEqual( icp.model_im.size, (200,150) )
+        self.assertTrue( len(icp.model_list) > 0 )
+        self.assertTrue( icp._original_model_im is None )
+        self.assertEqual( icp.original_model_im.size, (1600,1200) )
+        self.assertTrue( icp.original_model_im is icp.original_model_im )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestImageDecoding, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
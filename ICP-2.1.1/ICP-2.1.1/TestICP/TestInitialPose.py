@@ -0,0 +1,92 @@
+import ICP
+import math
+import unittest
+from Fixtures import ImageTestCase
+
+class TestInitialPose(ImageTestCase):
+
+    def _icp(self, pixel_correspondence_dist_threshold=5, **params):
+        icp = ICP.ICP(model_image="model.png", data_image="data.png", binary_or_color="binary",
+                      calculation_image_size=200, iterations=30,
+                      pixel_correspondence_dist_threshold=pixel_correspondence_dist_threshold,
+                      max_num_of_pixels_used_for_icp=1000, error_change_threshold=1e-3, **params)
+        icp.extract_pixels_from_binary_image("model")
+        icp.extract_pixels_from_binary_image("data")
+        return icp
+
+    def _pose(self, icp):
+        '''Returns the angle in degrees and the translation in image coordinates'''
+        m = icp.model_mean
+        t = icp.T + m - icp.R * m
+        return math.degrees(math.atan2(icp.R[1,0], icp.R[0,0])), (t[0,0], t[1,0])
+
+    def _true_pose(self):
+        '''
+        Returns the angle and the translation that take the data image made by
+        make_test_images() into the model image, at the half scale of the calculations.
+        The data image is the model rotated by 4 degrees about (200,200) and shifted
+        by (28,-20), so x_m = R (x_d - center - shift) + center.
+        '''
+        theta = math.radians(4.0)
+        cx, cy, sx, sy = 100.0, 100.0, 14.0, -10.0
+        tx = cx - (math.cos(theta) * (cx + sx) - math.sin(theta) * (cy + sy))
+        ty = cy - (math.sin(theta) * (cx + sx) + math.cos(theta) * (cy + sy))
+        return 4.0, (tx, ty)
+
+    def _assert_true_pose(self, angle, tx, ty):
+        # The edge pixels of both images are quantized to the pixel grid of the calculations, so
+        # the pose is only determined to within about a pixel over a pattern some 100 pixels across,
+        # that is, to about half a degree and one pixel:
+        true_angle, (true_tx, true_ty) = self._true_pose()
+        self.assertTrue( abs(angle - true_angle) < 0.5 )
+        self.assertTrue( abs(tx - true_tx) < 1.0 and abs(ty - true_ty) < 1.0 )
+
+    def test_initial_angle_and_offset(self):
+        print("testing ICP with an initial angle and offset")
+        icp = self._icp(initial_pose=(4.0, (-7.0, 2.0)))
+        icp.icp()
+        angle, (tx, ty) = self._pose(icp)
+        self._assert_true_pose(angle, tx, ty)
+        self.assertTrue( icp.iterations_run < 10 )
+
+    def test_initial_pose_to_icp(self):
+        print("testing an initial rotation matrix and translation supplied to icp()")
+        theta = math.radians(4.0)
+        R0 = [[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]]
+        icp = self._icp()
+        icp.icp(initial_pose=(R0, (-7.0, 2.0)))
+        angle, (tx, ty) = self._pose(icp)
+        self._assert_true_pose(angle, tx, ty)
+
+    def test_initial_pose_with_swapped_images(self):
+        print("testing an initial pose when the model and the data images get swapped")
+        icp = self._icp(initial_pose=(4.0, (-7.0, 2.0)), auto_select_model_and_data=1)
+        icp.icp()
+        # The data image has more pixels, so the registration is carried out in the opposite direction
+        # and the pose found must be the inverse of the true pose, x_d = R^T x_m - R^T t:
+        angle, (tx, ty) = self._pose(icp)
+        true_angle, (true_tx, true_ty) = self._true_pose()
+        theta = math.radians(true_angle)
+        inverse_tx = -(math.cos(theta) * true_tx + math.sin(theta) * true_ty)
+        inverse_ty = -(-math.sin(theta) * true_tx + math.cos(theta) * true_ty)
+        self.assertTrue( abs(angle + true_angle) < 0.5 )
+        self.assertTrue( abs(tx - inverse_tx) < 1.0 and abs(ty - inverse_ty) < 1.0 )
+
+    def test_initial_pose_speeds_up_convergence(self):
+        print("testing that an initial pose makes ICP converge in fewer iterations")
+        # With a threshold that lets ICP find the pose without any help:
+        icp_without_prior = self._icp(pixel_correspondence_dist_threshold=10)
+        icp_without_prior.icp()
+        icp_with_prior = self._icp(pixel_correspondence_dist_threshold=10, initial_pose=(4.0, (-7.0, 2.0)))
+        icp_with_prior.icp()
+        for icp in (icp_without_prior, icp_with_prior):
+            angle, (tx, ty) = self._pose(icp)
+            self._assert_true_pose(angle, tx, ty)
+        self.assertTrue( icp_with_prior.iterations_run < icp_without_prior.iterations_run )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestInitialPose, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import ICP
+import math
+import numpy
+import os
+import unittest
+from Fixtures import ImageTestCase, make_test_points
+
+class TestModelIndex(ImageTestCase):
+
+    def setUp(self):
+        ImageTestCase.setUp(self)
+        self.model, data, R_true, T_true = make_test_points()
+        self.scans = [(self.model - T_true * k).dot(R_true) for k in (1.0, 0.5, -1.0)]
+
+    def test_register_with_model_index(self):
+        print("testing registration of several scans against one model index")
+        for backend in ("brute_force", "kdtree"):
+            if backend == "kdtree" and ICP.cKDTree is None: continue
+            index = ICP.ModelIndex(self.model, correspondence_backend=backend)
+            self.assertTrue( numpy.allclose(index.zero_mean_model + index.model_mean, self.model) )
+            for data in self.scans:
+                expected = ICP.register(self.model, data, iterations=30, correspondence_backend=backend,
+                                        pixel_correspondence_dist_threshold=20)
+                result = ICP.register(index, data, iterations=30, pixel_correspondence_dist_threshold=20)
+                self.assertTrue( numpy.array_equal(result.R, expected.R) )
+                self.assertEqual( result.error_for_iterations, expected.error_for_iterations )
+        self.assertRaises( ValueError, ICP.register, index, self.scans[0], correspondence_backend="kdtree" )
+        self.assertRaises( ValueError, ICP.ModelIndex, numpy.zeros((0,2)) )
+
+    def test_distance_field(self):
+        print("testing the correspondences looked up in the distance field of a model index")
+        index = ICP.ModelIndex(self.model, distance_field_margin=20, distance_field_resolution=0.5)
+        self.assertTrue( index.correspondence_search(20) is index.distance_field )
+        self.assertTrue( index.correspondence_search(21) is index.model_tree )
+        points = numpy.random.uniform(-80, 80, (500,2))
+        indexes, dists = ICP._closest_model_points(points, index.zero_mean_model, 20, index.distance_field)
+        exact_indexes, exact_dists = ICP._closest_model_points(points, index.zero_mean_model, 20)
+        both = (indexes >= 0) & (exact_indexes >= 0)
+        self.assertTrue( both.sum() > 100 )
+        # The correspondent looked up is within a cell diagonal of being the nearest:
+        self.assertTrue( (dists[both] - exact_dists[both] <= 0.5 * math.sqrt(2) + 1e-9).all() )
+        self.assertTrue( (indexes[both] == exact_indexes[both]).mean() > 0.95 )
+        self.assertTrue( numpy.isinf(ICP._closest_model_points(numpy.array([[500.0,500.0]]), 
+                                        index.zero_mean_model, 20, index.distance_field)[1]).all() )
+        for data in self.scans:
+            result = ICP.register(index, data, iterations=30, pixel_correspondence_dist_threshold=20)
+            self.assertAlmostEqual( result.angle, 4.0, places=2 )
+
+    def test_model_index_from_image(self):
+        print("testing a model index built from a model image")
+        params = dict(binary_or_color="binary", calculation_image_size=200)
+        index = ICP.ModelIndex.from_image("model.png", **params)
+        icp = ICP.ICP(model_image="model.png", data_image="data.png", **params)
+        icp.extract_pixels_from_binary_image("model")
+        icp.extract_pixels_from_binary_image("data")
+        self.assertTrue( numpy.array_equal(index.model_points, numpy.array(icp.model_list)) )
+        result = ICP.register(index, icp.data_list, iterations=30, pixel_correspondence_dist_threshold=40)
+        expected = ICP.register(icp.model_list, icp.data_list, iterations=30, 
+                                pixel_correspondence_dist_threshold=40)
+        self.assertTrue( numpy.array_equal(result.R, expected.R) )
+        self.assertTrue( numpy.array_equal(result.T, expected.T) )
+
+    def test_model_index_from_image_without_the_font_file(self):
+        print("testing that a model index is built from a model image without the font file")
+        isfile = os.path.isfile
+        try:
+            # The font file cannot be found anywhere:
+            os.path.isfile = lambda path: not path.endswith("FreeSerif.ttf") and isfile(path)
+            params = dict(binary_or_color="binary", calculation_image_size=200)
+            index = ICP.ModelIndex.from_image("model.png", **params)
+            self.assertTrue( len(index.model_points) > 0 )
+            icp = ICP.ICP(model_image="model.png", data_image="data.png", **params)
+            self.assertRaises( SystemExit, icp._display_font, 15 )
+        finally:
+            os.path.isfile = isfile
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestModelIndex, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import ICP
+import functools
+import numpy
+import unittest
+from PIL import Image
+
+class TestPixelExtraction(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(0)
+        self.gray = numpy.random.randint(0, 256, (23,31)).astype("float")
+
+    def test_sobel_gradients(self):
+        print("testing the array-based Sobel gradients against the per-pixel formulas")
+        dx, dy = ICP._sobel_gradients(self.gray)
+        g = lambda i,j: self.gray[j,i]
+        height, width = self.gray.shape
+        for i in range(width):
+            for j in range(height):
+                if 3 <= i < width-3 and 3 <= j < height-3:
+                    self.assertEqual( dx[j,i], (g(i+1,j-1) + 2*g(i+1,j) + g(i+1,j+1)) - 
+                                               (g(i-1,j-1) + 2*g(i-1,j) + g(i-1,j+1)) )
+                    self.assertEqual( dy[j,i], (g(i-1,j+1) + 2*g(i,j+1) + g(i+1,j+1)) - 
+                                               (g(i-1,j-1) + 2*g(i,j-1) + g(i+1,j-1)) )
+                else:
+                    self.assertEqual( (dx[j,i], dy[j,i]), (0.0, 0.0) )
+
+    def test_strongest_pixels(self):
+        print("testing the selection of the strongest pixels against sorting string-keyed pixels")
+        values = numpy.random.randint(0, 20, (30,40)).astype("float")
+        edge_pixel_dict = {}
+        for i in range(40):
+            for j in range(30):
+                if values[j,i] > 4: edge_pixel_dict["e_" + str(i) + "_" + str(j)] = values[j,i]
+        sorted_edge_pixels = sorted(edge_pixel_dict.keys(), key=lambda x: edge_pixel_dict[x], reverse=True)
+        expected = [tuple(int(part) for part in label.split("_")[1:]) for label in sorted_edge_pixels]
+        for max_num in (1, 50, 5000):
+            pixels = ICP._strongest_pixels(values, 4, max_num)
+            self.assertEqual( pixels.dtype.kind, "i" )
+            self.assertEqual( [tuple(pixel) for pixel in pixels.tolist()], expected[:max_num] )
+
+    def test_corner_response(self):
+        print("testing the array-based corner response against the per-pixel structure tensor")
+        dx, dy = ICP._sobel_gradients(self.gray)
+        mask = self.gray > 100
+        dx[~mask] = dy[~mask] = 0.0
+        rval = ICP._corner_response(dx, dy, mask)
+        height, width = self.gray.shape
+        for i in range(width):
+            for j in range(height):
+                if 3 <= i < width-3 and 3 <= j < height-3 and mask[j,i]:
+                    window = (slice(j-2,j+3), slice(i-2,i+3))
+                    c11 = (dx[window] * dx[window]).sum()
+                    c12 = (dx[window] * dy[window]).sum()
+                    c22 = (dy[window] * dy[window]).sum()
+                    C = numpy.array([[c11, c12], [c12, c22]])
+                    expected = numpy.linalg.det(C) / numpy.trace(C)**2 if numpy.trace(C) != 0 else 0.0
+                    self.assertAlmostEqual( rval[j,i], expected, places=9 )
+                else:
+                    self.assertEqual( rval[j,i], 0.0 )
+
+    def test_non_maximum_corners(self):
+        print("testing the non-maximum suppression of corners against the pairwise comparisons")
+        # Coarse values so that there are plenty of ties:
+        rval = numpy.round(numpy.random.uniform(-1, 1, (40,50)), 1)
+        is_corner = numpy.abs(rval) > 0.3
+        corner_pixels = [(i,j) for i in range(50) for j in range(40) if is_corner[j,i]]
+        singular_corners = []
+        for (i,j) in corner_pixels:
+            if not any(abs(i-k) <= 1 and abs(j-l) <= 1 and rval[j,i] <= rval[l,k] 
+                                        for (k,l) in corner_pixels if (k,l) != (i,j)):
+                singular_corners.append((i,j))
+        singular_corners.sort(key = lambda x: rval[x[1],x[0]], reverse=True)
+        for max_num in (5, 37, 1000):
+            self.assertEqual( ICP._non_maximum_corners(rval, is_corner, max_num), singular_corners[:max_num] )
+
+    def test_otsu_threshold(self):
+        print("testing the cumulative-sum Otsu threshold against the prefix sums")
+        hist = list(numpy.random.randint(0, 500, 256))
+        add = lambda x,y: x+y
+        probs = [functools.reduce(add, hist[8*i:8*i+8]) / float(sum(hist)) for i in range(32)]
+        prob_times_graylevel = [8 * i * probs[i] for i in range(32)]
+        mu_T = functools.reduce(add, prob_times_graylevel)
+        sigma_squared_T = functools.reduce(add, [(8 * i - mu_T)**2 * probs[i] for i in range(32)])
+        ratios = []
+        for k in range(1, 33):
+            m0, m1 = functools.reduce(add, probs[:k]), functools.reduce(add, prob_times_graylevel[:k])
+            if 0 < m0 < 1.0:
+                sigmaB_squared = (mu_T * m0 - m1)**2 / (m0 * (1.0 - m0))
+                ratios.append((sigmaB_squared / (sigma_squared_T - sigmaB_squared), k-1))
+        best = max(ratio for ratio, k in ratios)
+        self.assertEqual( ICP._otsu_threshold(hist), 8 * min(k for ratio, k in ratios if ratio == best) )
+
+    def test_otsu_segmentation(self):
+        print("testing the Otsu segmentation and its cache")
+        gray = numpy.full((40,60), 200, dtype="uint8")
+        gray[10:30,20:45] = 30
+        im = Image.fromarray(gray, "L")
+        segmentation, threshold = ICP.otsu_segmentation(im, -1, "low")
+        self.assertTrue( 30 < threshold < 200 )
+        mask = numpy.asarray(segmentation.convert("L")) == 255
+        self.assertTrue( mask[20,30] and not mask[2,2] )
+        segmentation.putpixel((2,2), 255)
+        cached_segmentation, cached_threshold = ICP.otsu_segmentation(im.copy(), -1, "low")
+        self.assertEqual( cached_threshold, threshold )
+        self.assertEqual( cached_segmentation.getpixel((2,2)), 0 )
+        self.assertRaises( ValueError, ICP.otsu_segmentation, im, 0 )
+
+    def test_binary_image_pixels(self):
+        print("testing the array-based extraction of the pixels of a binary image")
+        binary = numpy.random.randint(0, 2, (20,25)) * 255
+        pixels = ICP._binary_image_pixels(binary)
+        expected = [(i,j) for i in range(3,22) for j in range(3,17) if binary[j,i] != 0]
+        self.assertEqual( [tuple(pixel) for pixel in pixels.tolist()], expected )
+
+    def test_subsample_pixels(self):
+        print("testing the random and the stratified subsampling of pixels")
+        # A dense blob plus a sparse line; stratified sampling should not spend its budget on the blob:
+        blob = [(i,j) for i in range(10,40) for j in range(10,40)]
+        line = [(i,100) for i in range(0,200,4)]
+        pixels = numpy.array(sorted(blob + line))
+        for method in ("random", "stratified"):
+            subsample = ICP._subsample_pixels(pixels, 100, method)
+            self.assertTrue( len(subsample) <= 100 )
+            rows = [tuple(pixel) for pixel in subsample.tolist()]
+            self.assertEqual( rows, sorted(rows) )
+            self.assertTrue( set(rows) <= set(blob + line) )
+        stratified = ICP._subsample_pixels(pixels, 100, "stratified")
+        self.assertTrue( (stratified[:,1] == 100).sum() > 20 )
+        self.assertTrue( len(ICP._subsample_pixels(pixels, 5000, "random")) == len(pixels) )
+
+    def test_thin_edges(self):
+        print("testing the thinning of edges by non-maximum suppression and hysteresis")
+        gray = numpy.zeros((40,40))
+        gray[:,20:] = 200
+        gray[5:12,5:12] = 30
+        dx, dy = ICP._sobel_gradients(gray)
+        edge_strength = numpy.sqrt(dx**2 + dy**2)
+        self.assertTrue( (edge_strength[20] > 0).sum() > 1 )
+        results = []
+        for backend in (ICP.ndimage, None):
+            saved, ICP.ndimage = ICP.ndimage, backend
+            try:
+                results.append( ICP._thin_edges(dx, dy, edge_strength, 50, 500) )
+            finally:
+                ICP.ndimage = saved
+        is_edge = results[-1]
+        # The strong step edge survives with a width of one pixel per row:
+        self.assertTrue( (is_edge[3:-3].sum(axis=1) == 1).all() )
+        self.assertTrue( is_edge[3:-3,19:21].all(axis=0).any() )
+        # The weak square is not connected to the strong edge:
+        self.assertFalse( is_edge[:,:15].any() )
+        self.assertTrue( ICP._thin_edges(dx, dy, edge_strength, 50, 100)[:,:15].any() )
+        if results[0] is not None:
+            self.assertTrue( numpy.array_equal(results[0], results[1]) )
+
+    def test_edge_pixels(self):
+        print("testing the public extraction of the edge pixels")
+        gray = numpy.zeros((40,40))
+        gray[:,20:] = 200
+        gray[5:12,5:12] = 30
+        pixels, edge_strength, dx, dy = ICP.edge_pixels(gray.astype("uint8"), 50, 30)
+        self.assertTrue( numpy.array_equal((dx, dy), ICP._sobel_gradients(gray)) )
+        self.assertTrue( numpy.array_equal(edge_strength, numpy.sqrt(dx**2 + dy**2)) )
+        self.assertTrue( numpy.array_equal(pixels, ICP._strongest_pixels(edge_strength, 50, 30)) )
+        # With thinning, the pixels come from the thinned edges, whose low threshold defaults to half
+        # of edge_detection_threshold:
+        for threshold, weak_square_retained in ((500, False), (100, True)):
+            pixels = ICP.edge_pixels(gray, threshold, 1000, thin_edges=1)[0]
+            is_edge = ICP._thin_edges(dx, dy, edge_strength, threshold / 2.0, threshold)
+            self.assertEqual( sorted(map(tuple, pixels.tolist())), 
+                              sorted(zip(*numpy.nonzero(is_edge.T))) )
+            self.assertEqual( (pixels[:,0] < 15).any(), weak_square_retained )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestPixelExtraction, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
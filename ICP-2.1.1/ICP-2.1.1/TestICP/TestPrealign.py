@@ -0,0 +1,50 @@
+import ICP
+import math
+import numpy
+import unittest
+
+class TestPrealign(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(0)
+        # Points along the outline of a polygon with a spur, in a 200x200 image:
+        corners = numpy.array([(50,50), (150,60), (140,150), (90,125), (60,155)], dtype="float")
+        outline = [a + (b - a) * s for a, b in zip(corners, numpy.roll(corners, -1, axis=0))
+                                   for s in numpy.linspace(0, 1, 40, endpoint=False)]
+        spur = [numpy.array([75.0,75.0]) + numpy.array([50.0,25.0]) * s for s in numpy.linspace(0, 1, 30)]
+        self.model = numpy.array(outline + spur)
+        self.center = numpy.array([100.0, 100.0])
+
+    def _data(self, angle, shift):
+        '''Rotates the model about the image center by -angle and shifts it by -shift'''
+        theta = math.radians(angle)
+        R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        data = (self.model - self.center - numpy.array(shift)).dot(R) + self.center
+        return data + numpy.random.normal(0, 0.3, data.shape)
+
+    def test_prealign_points(self):
+        print("testing rotation and translation estimation by phase correlation")
+        for angle, shift in [(4, (14,-10)), (-75, (-30,12)), (150, (5,5)), (-170, (30,-30))]:
+            data = self._data(angle, shift)
+            estimated_angle, T0 = ICP.prealign_points(self.model, data, (200,200))
+            self.assertTrue( abs(estimated_angle - angle) < 0.5 )
+            theta = math.radians(estimated_angle)
+            R0 = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+            self.assertTrue( numpy.abs(data.dot(R0.T) + T0 - self.model).max() < 2.0 )
+
+    def test_register_with_prealign(self):
+        print("testing registration of a scan rotated by 120 degrees")
+        data = self._data(120, (10,-5))
+        result = ICP.register(self.model, data, iterations=30, pixel_correspondence_dist_threshold=10)
+        self.assertTrue( abs(result.angle - 120) > 10 )
+        result = ICP.register(self.model, data, iterations=30, pixel_correspondence_dist_threshold=10,
+                              prealign=1)
+        self.assertTrue( abs(result.angle - 120) < 0.5 )
+        self.assertTrue( numpy.abs(result.transform_points(data) - self.model).max() < 1.5 )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestPrealign, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import ICP
+import math
+import unittest
+from Fixtures import ImageTestCase
+
+class TestPyramid(ImageTestCase):
+
+    def _icp(self, pyramid_levels):
+        icp = ICP.ICP(model_image="model.png", data_image="data.png", binary_or_color="binary",
+                      calculation_image_size=200, pixel_correspondence_dist_threshold=5, iterations=30,
+                      max_num_of_pixels_used_for_icp=1000, pyramid_levels=pyramid_levels)
+        icp.extract_pixels_from_binary_image("model")
+        icp.extract_pixels_from_binary_image("data")
+        icp.icp()
+        return icp
+
+    def test_pyramid_recovers_large_offset(self):
+        print("testing coarse-to-fine registration of images with a large offset")
+        angle = lambda icp: math.degrees(math.atan2(icp.R[1,0], icp.R[0,0]))
+        single_level = self._icp(1)
+        self.assertTrue( abs(angle(single_level)) < 1.0 )
+        pyramid = self._icp(3)
+        self.assertTrue( abs(angle(pyramid) - 4.0) < 0.5 )
+        self.assertEqual( [level[0] for level in pyramid.pyramid_level_results], [50, 100] )
+        self.assertTrue( pyramid.error_for_iterations[-1] < 1.0 )
+
+    def test_bad_pyramid_levels(self):
+        print("testing that a bad value for pyramid_levels is rejected")
+        self.assertRaises( ValueError, ICP.ICP, model_image="model.png", data_image="data.png", 
+                           binary_or_color="binary", pyramid_levels=1.5 )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestPyramid, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import ICP
+import numpy
+import os
+import unittest
+from Fixtures import make_test_points
+
+class TestRegister(unittest.TestCase):
+
+    def setUp(self):
+        self.model, self.data, self.R_true, self.T_true = make_test_points()
+
+    def test_register_point_arrays(self):
+        print("testing headless registration of point arrays with register()")
+        files_before = sorted(os.listdir("."))
+        result = ICP.register(self.model, self.data, iterations=30, 
+                              pixel_correspondence_dist_threshold=20)
+        self.assertEqual( sorted(os.listdir(".")), files_before )
+        self.assertAlmostEqual( result.angle, 4.0, places=3 )
+        self.assertEqual( result.number_of_points_matched, 120 )
+        self.assertEqual( result.iterations_run, len(result.error_for_iterations) )
+        self.assertTrue( numpy.allclose(result.transform_points(self.data), self.model, atol=1e-3) )
+        self.assertTrue( result.timings['total'] >= result.timings['iterations'] )
+
+    def test_register_with_initial_pose(self):
+        print("testing headless registration with an initial pose")
+        result = ICP.register(self.model, self.data, init=(4.0, self.T_true), iterations=5,
+                              pixel_correspondence_dist_threshold=20)
+        self.assertTrue( result.error_for_iterations[0] < 1e-6 )
+        self.assertTrue( numpy.allclose(result.transform_points(self.data), self.model, atol=1e-6) )
+
+    def test_register_point_to_line(self):
+        print("testing point-to-line registration of a rectangular outline")
+        outline = [(x,0) for x in range(80)] + [(x,60) for x in range(80)] + \
+                  [(0,y) for y in range(1,60)] + [(79,y) for y in range(1,60)] + [(40,y) for y in range(25)]
+        model = numpy.array(outline, dtype="float")
+        data = (model - self.T_true).dot(self.R_true)
+        result = ICP.register(model, data, iterations=30, pixel_correspondence_dist_threshold=20,
+                              error_metric="point_to_line", rotation_change_threshold=1e-4)
+        self.assertEqual( result.stop_reason, "increment_converged" )
+        self.assertAlmostEqual( result.angle, 4.0, places=3 )
+        self.assertTrue( numpy.allclose(result.transform_points(data), model, atol=1e-3) )
+
+    def test_unknown_parameter(self):
+        print("testing that register() rejects unknown keyword args")
+        self.assertRaises( ValueError, ICP.register, self.model, self.data, iteration=3 )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestRegister, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import ICP
+import numpy
+import unittest
+from Fixtures import make_test_points
+
+class TestRobustICP(unittest.TestCase):
+
+    def setUp(self):
+        self.model, inliers, R_true, self.T_true = make_test_points()
+        # A quarter of the data points are spurious returns with no counterpart in the model:
+        self.data = numpy.vstack((inliers, numpy.random.uniform(0, 100, (40,2))))
+
+    def _register(self, **params):
+        return ICP.register(self.model, self.data, iterations=60, pixel_correspondence_dist_threshold=20,
+                            rotation_change_threshold=1e-5, translation_change_threshold=1e-4, **params)
+
+    def test_outliers_bias_plain_icp(self):
+        print("testing that outliers bias the unweighted ICP solution")
+        result = self._register()
+        self.assertTrue( abs(result.angle - 4.0) > 0.1 )
+
+    def test_trimmed_and_robust_weighting(self):
+        print("testing trimmed ICP and the Huber, Tukey and Cauchy weights")
+        for params in [{'trim_fraction' : 0.7}, {'robust_weighting' : 'huber'}, 
+                       {'robust_weighting' : 'tukey'}, {'robust_weighting' : 'cauchy'},
+                       {'trim_fraction' : 0.8, 'robust_weighting' : 'tukey'}]:
+            result = self._register(**params)
+            self.assertAlmostEqual( result.angle, 4.0, places=4 )
+            self.assertEqual( result.stop_reason, "increment_converged" )
+            inliers = result.transform_points(self.data[:120])
+            self.assertTrue( numpy.allclose(inliers, self.model, atol=1e-3) )
+
+    def test_robust_weights(self):
+        print("testing the robust weights for a set of residuals")
+        residuals = numpy.array([0.0, 1.0, 2.0, 50.0])
+        self.assertEqual( list(ICP._robust_weights(residuals, trim_fraction=0.75)), [1, 1, 1, 0] )
+        weights = ICP._robust_weights(residuals, robust_weighting="tukey", scale=10.0)
+        self.assertEqual( weights[0], 1.0 )
+        self.assertEqual( weights[3], 0.0 )
+        weights = ICP._robust_weights(residuals, robust_weighting="huber", scale=1.5)
+        self.assertTrue( numpy.allclose(weights, [1.0, 1.0, 0.75, 0.03]) )
+
+    def test_bad_parameters(self):
+        print("testing that bad robust ICP parameters are rejected")
+        self.assertRaises( ValueError, self._register, trim_fraction=0 )
+        self.assertRaises( ValueError, self._register, robust_weighting="bisquare" )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestRobustICP, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
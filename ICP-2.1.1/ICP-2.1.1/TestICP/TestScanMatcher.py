@@ -0,0 +1,74 @@
+import ICP
+import math
+import numpy
+import unittest
+
+class TestScanMatcher(unittest.TestCase):
+
+    def setUp(self):
+        numpy.random.seed(0)
+        corners = numpy.array([(50,50), (150,60), (140,150), (90,125), (60,155)], dtype="float")
+        self.model = numpy.array([a + (b - a) * s for a, b in zip(corners, numpy.roll(corners, -1, axis=0))
+                                                  for s in numpy.linspace(0, 1, 40, endpoint=False)])
+        self.matcher = ICP.CorrelativeScanMatcher(self.model, resolution=1.0, sigma=2.0, coarse_factor=4)
+
+    def _data(self, angle, shift, num_outliers=0):
+        theta = math.radians(angle)
+        R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        center = numpy.array([100.0, 100.0])
+        data = (self.model - center - numpy.array(shift)).dot(R) + center
+        data = data + numpy.random.normal(0, 0.3, data.shape)
+        return numpy.vstack((data, numpy.random.uniform(0, 200, (num_outliers,2))))
+
+    def test_match_with_outliers(self):
+        print("testing correlative scan matching of a scan with spurious points")
+        data = self._data(-15, (-18,7), num_outliers=40)
+        match = self.matcher.match(data, translation_window=20, angle_window=20)
+        self.assertTrue( abs(match.angle + 15) < 0.5 )
+        self.assertTrue( numpy.abs(match.transform_points(data[:200]) - self.model).max() < 2.0 )
+        result = ICP.register(self.model, data, init=(match.angle, match.T), iterations=20,
+                              pixel_correspondence_dist_threshold=3, robust_weighting="tukey")
+        self.assertTrue( abs(result.angle + 15) < 0.1 )
+
+    def test_pruned_search_is_exact(self):
+        print("testing that the coarse-to-fine search finds the best candidate in the window")
+        data = self._data(2, (3,-2))
+        match = self.matcher.match(data, translation_window=6, angle_window=3, angle_step=1.0)
+        centroid = data.mean(axis=0)
+        best_score = 0.0
+        for angle in numpy.arange(-3, 4):
+            theta = math.radians(angle)
+            R = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+            rotated = (data - centroid).dot(R.T) + centroid
+            cells = numpy.floor((rotated - self.matcher.origin) / self.matcher.resolution).astype(int)
+            offsets = numpy.array([(x, y) for x in range(-6, 7) for y in range(-6, 7)])
+            best_score = max(best_score, self.matcher._scores(self.matcher.fine_table, cells, offsets).max())
+        self.assertAlmostEqual( match.score, best_score )
+        self.assertTrue( match.number_of_candidates_scored < 7 * 13 * 13 )
+
+    def test_pruned_search_is_exact_at_the_edges_of_the_table(self):
+        print("testing that the pruned search is exact for data near the edges of the table with a small sigma")
+        # With sigma below coarse_factor * resolution / 4, the blocks of translations that move the
+        # data off the top or the left of the table still hold the best candidates:
+        random_state = numpy.random.RandomState(0)
+        offsets = numpy.array([(x, y) for x in range(-20, 21) for y in range(-20, 21)])
+        for trial in range(40):
+            model = random_state.uniform(0, 60, (40,2))
+            matcher = ICP.CorrelativeScanMatcher(model, resolution=1.0, sigma=1.0, coarse_factor=16)
+            data = model[numpy.argsort(model[:,0])][:15] + random_state.uniform(-12, 0, 2) + \
+                                                          random_state.normal(0, 0.5, (15,2))
+            match = matcher.match(data, translation_window=20, angle_window=0)
+            cells = numpy.floor((data - matcher.origin) / matcher.resolution).astype(int)
+            self.assertAlmostEqual( match.score, matcher._scores(matcher.fine_table, cells, offsets).max() )
+
+    def test_bad_parameters(self):
+        print("testing that bad scan matcher parameters are rejected")
+        self.assertRaises( ValueError, ICP.CorrelativeScanMatcher, self.model, resolution=0 )
+        self.assertRaises( ValueError, ICP.CorrelativeScanMatcher, [] )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestScanMatcher, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+
+import unittest
+import TestTiling
+import TestParallelScanner
+import TestInMemoryScanner
+import TestDisplacementField
+import TestMemoryMappedSource
+
+class ICPImageScannerTestCase( unittest.TestCase ):
+    def checkVersion(self):
+        import ICPImageScanner
+
+testSuites = [unittest.makeSuite(ICPImageScannerTestCase, 'test')] 
+
+for test_type in [
+            TestTiling,
+            TestParallelScanner,
+            TestInMemoryScanner,
+            TestDisplacementField,
+            TestMemoryMappedSource,
+    ]:
+    testSuites.append(test_type.getTestSuites('test'))
+
+
+def getTestDirectory():
+    try:
+        return os.path.abspath(os.path.dirname(__file__))
+    except:
+        return '.'
+
+import os
+os.chdir(getTestDirectory())
+
+runner = unittest.TextTestRunner()
+runner.run(unittest.TestSuite(testSuites))
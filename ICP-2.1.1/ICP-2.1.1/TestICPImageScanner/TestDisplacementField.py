@@ -0,0 +1,119 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import ICP
+import math
+import numpy
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from TestTiling import make_scanner_test_images, make_scanner
+import ICPImageScanner
+scanner_module = sys.modules["ICPImageScanner.ICPImageScanner"]
+
+class TestDisplacementField(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        make_scanner_test_images(shift=(6,4))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def test_positions_and_boxes_of_the_scanning_window(self):
+        print("testing the positions of the scanning window with and without overlap")
+        scanner = make_scanner()
+        self.assertEqual( scanner._scan_window_positions((240,216)), (2,2) )
+        self.assertEqual( scanner._scan_window_positions((250,220)), (2,2) )
+        self.assertEqual( scanner._scan_window_positions((100,216)), (0,0) )
+        self.assertEqual( scanner._tile_boxes((240,216)), 
+                          [(0,0,120,108), (120,0,240,108), (0,108,120,216), (120,108,240,216)] )
+        self.assertEqual( scanner._tile_boxes((100,216)), [] )
+        scanner = make_scanner(scanning_window_horizontal_stride=50, scanning_window_vertical_stride=40)
+        self.assertEqual( scanner._scan_window_positions((240,216)), (3,3) )
+        boxes = scanner._tile_boxes((240,216))
+        self.assertEqual( len(boxes), 9 )
+        self.assertEqual( boxes[:4], [(0,0,120,108), (50,0,170,108), (100,0,220,108), (0,40,120,148)] )
+        self.assertEqual( boxes[-1], (100,80,220,188) )
+
+    def test_field_of_known_transforms(self):
+        print("testing that the displacement field reproduces the transforms of the windows exactly")
+        # The data pixel of the model pixel q is A q + t, for a rotation by 2 degrees:
+        theta = math.radians(2.0)
+        A = numpy.array([[math.cos(theta), -math.sin(theta)], [math.sin(theta), math.cos(theta)]])
+        t = numpy.array([6.0, -4.0])
+        for strides in ({}, dict(scanning_window_horizontal_stride=50, scanning_window_vertical_stride=40)):
+            scanner = make_scanner(**strides)
+            # With calculation_image_size equal to the width of the window, the subimages are not reduced:
+            scanner.calculation_image_size = 120
+            boxes = scanner._tile_boxes((240,216))
+            scanner.subimage_results = []
+            R = numpy.linalg.inv(A)
+            model_mean = numpy.array([60.0, 54.0])
+            for box in boxes:
+                # The transform of the window in the coordinates of the subimages:
+                origin = numpy.array(box[:2], dtype="float")
+                T = R.dot(origin - t) - origin - model_mean + R.dot(model_mean)
+                scanner.subimage_results.append(ICP.ICPResult(R, T, model_mean, [0.0], "max_iterations", None, {}))
+            field = scanner.calculate_displacement_field()
+            self.assertEqual( field.dtype, numpy.float32 )
+            self.assertEqual( field.shape, (216,240,2) )
+            right, lower = max(box[2] for box in boxes), max(box[3] for box in boxes)
+            y, x = numpy.mgrid[0:lower, 0:right]
+            q = numpy.dstack([x, y]).astype("float")
+            expected = q.dot(A.T) + t - q
+            self.assertTrue( numpy.abs(field[:lower,:right] - expected).max() < 1e-3 )
+            self.assertTrue( not field[lower:].any() and not field[:,right:].any() )
+
+    def test_bilinear_remap(self):
+        print("testing the vectorized bilinear remap")
+        image = numpy.random.RandomState(0).randint(0, 256, (50,60)).astype("uint8")
+        field = numpy.zeros((50,60,2), dtype="float32")
+        field[...,0], field[...,1] = 6, 4
+        warped = scanner_module._bilinear_remap(image, field, numpy.empty((50,60), dtype="uint8"))
+        self.assertTrue( numpy.array_equal(warped[:46,:54], image[4:,6:]) )
+        self.assertTrue( not warped[46:].any() and not warped[:,54:].any() )
+        field[...,0], field[...,1] = 0.5, 0
+        warped = scanner_module._bilinear_remap(numpy.dstack([image] * 3), field, numpy.empty((50,60,3), dtype="uint8"))
+        expected = numpy.rint((image[:,:-1].astype("float") + image[:,1:]) / 2)
+        self.assertTrue( numpy.array_equal(warped[:,:-1,1], expected) )
+
+    def _check_field_and_warp(self, scanner):
+        scanner.calculation_image_size = 120
+        scanner.max_num_of_pixels_used_for_icp = 600
+        scanner.apply_icp_to_model_and_data_images_in_memory()
+        field = scanner.calculate_displacement_field()
+        # ICP comes up somewhat short of the full shift since the pixels near the borders of the
+        # windows have no counterparts in the other subimage:
+        self.assertTrue( abs(numpy.median(field[...,0]) - 6) < 1.0 )
+        self.assertTrue( abs(numpy.median(field[...,1]) - 4) < 1.0 )
+        model = numpy.asarray(Image.open("model.png"), dtype="float")[10:-10,10:-10]
+        data = numpy.asarray(Image.open("data.png"), dtype="float")[10:-10,10:-10]
+        warped = numpy.asarray(scanner.warp_data_image(), dtype="float")[10:-10,10:-10]
+        self.assertTrue( numpy.abs(model - warped).mean() < numpy.abs(model - data).mean() / 3 )
+
+    def test_field_and_warp_for_shifted_data(self):
+        print("testing the displacement field and the warp for a shifted data image")
+        self._check_field_and_warp(make_scanner())
+
+    def test_field_and_warp_with_overlapping_windows(self):
+        print("testing the displacement field and the warp with overlapping scanning windows")
+        scanner = make_scanner(scanning_window_horizontal_stride=60, scanning_window_vertical_stride=54)
+        self._check_field_and_warp(scanner)
+        self.assertEqual( len(scanner.subimage_results), 9 )
+
+    def test_interactive_chopper_rejects_strides(self):
+        print("testing that the interactive scanner refuses strides other than the window size")
+        scanner = make_scanner(scanning_window_horizontal_stride=60)
+        self.assertRaises( ValueError, scanner.chop_model_and_data_images_into_tiles_interactive )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestDisplacementField, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import ICP
+import numpy
+import shutil
+import tempfile
+import unittest
+from ICPImageScanner import ICPImageScanner
+from TestTiling import make_scanner_test_images, make_scanner
+
+class TestInMemoryScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        make_scanner_test_images(shift=(6,4))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def test_every_tile_registered_without_iterations(self):
+        print("testing the in-memory scanner pipeline with the default number of iterations")
+        scanner = ICPImageScanner(model_image_file = "model.png", data_image_file = "data.png",
+                                  binary_or_color = "color", corners_or_edges = "edges",
+                                  calculation_image_size = 100, max_num_of_pixels_used_for_icp = 200,
+                                  scanning_window_width = 120, scanning_window_height = 108)
+        self.assertEqual( scanner.iterations, 24 )
+        self.assertEqual( scanner.pixel_correspondence_dist_threshold, 20 )
+        results = scanner.apply_icp_to_model_and_data_images_in_memory()
+        self.assertTrue( results is scanner.subimage_results )
+        self.assertEqual( len(results), 4 )
+        for result in results:
+            self.assertTrue( isinstance(result, ICP.ICPResult) )
+            self.assertTrue( 0 < result.iterations_run <= 24 )
+        self.assertTrue( all(im is not None for im in scanner.model_subimages_with_retained_pixels) )
+
+    def test_same_registrations_as_the_scanner_dumps(self):
+        print("testing that the in-memory and the dump pipelines register the subimages alike")
+        dump_scanner = make_scanner()
+        dump_scanner.chop_model_and_data_images_into_tiles()
+        dump_scanner.apply_icp_to_model_and_data_scanner_dumps_fast()
+        memory_scanner = make_scanner()
+        memory_scanner.apply_icp_to_model_and_data_images_in_memory()
+        # The two differ only by the JPEG encoding of the subimages in the dumps:
+        for dump_result, memory_result in zip(dump_scanner.subimage_results, memory_scanner.subimage_results):
+            self.assertTrue( abs(dump_result.angle - memory_result.angle) < 1.0 )
+            self.assertTrue( numpy.abs(dump_result.T - memory_result.T).max() < 1.0 )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestInMemoryScanner, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
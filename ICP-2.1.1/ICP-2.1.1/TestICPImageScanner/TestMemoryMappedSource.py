@@ -0,0 +1,94 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import numpy
+import shutil
+import tempfile
+import unittest
+from PIL import Image
+from TestTiling import make_scanner_test_images, make_scanner
+
+class TestMemoryMappedSource(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        make_scanner_test_images(shift=(6,4))
+        self.model = numpy.asarray(Image.open("model.png").convert("L"))
+        self.data = numpy.asarray(Image.open("data.png").convert("L"))
+        numpy.save("model_map.npy", self.model)
+        numpy.save("data_map.npy", self.data)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def test_npy_and_raw_images_are_memory_mapped(self):
+        print("testing that .npy and .raw images are memory-mapped")
+        scanner = make_scanner("model_map.npy", "data_map.npy")
+        self.assertTrue( isinstance(scanner.model_source, numpy.memmap) )
+        self.assertTrue( numpy.array_equal(scanner.model_source, self.model) )
+        self.assertEqual( (scanner.model_im_width, scanner.model_im_height), (240,216) )
+        color_data = numpy.dstack([self.data] * 3)
+        color_data.tofile("data.raw")
+        scanner = make_scanner("model_map.npy", "data.raw", raw_image_shape = color_data.shape)
+        self.assertTrue( isinstance(scanner.data_source, numpy.memmap) )
+        self.assertTrue( numpy.array_equal(scanner.data_source, color_data) )
+        self.assertEqual( (scanner.data_im_width, scanner.data_im_height), (240,216) )
+        self.assertTrue( make_scanner().model_source is None )
+
+    def test_bad_memory_mapped_images_are_rejected(self):
+        print("testing that memory-mapped images without a shape or of the wrong type are rejected")
+        self.data.tofile("data.raw")
+        self.assertRaises( ValueError, make_scanner, "model_map.npy", "data.raw" )
+        numpy.save("float_model.npy", self.model.astype("float32"))
+        self.assertRaises( ValueError, make_scanner, "float_model.npy", "data_map.npy" )
+        numpy.save("rgba_model.npy", numpy.dstack([self.model] * 4))
+        self.assertRaises( ValueError, make_scanner, "rgba_model.npy", "data_map.npy" )
+        numpy.save("flat_model.npy", self.model.ravel())
+        self.assertRaises( ValueError, make_scanner, "flat_model.npy", "data_map.npy" )
+
+    def test_same_tiles_and_registrations_as_the_image_files(self):
+        print("testing that memory-mapped images give the same tiles and registrations as the image files")
+        png_scanner = make_scanner()
+        map_scanner = make_scanner("model_map.npy", "data_map.npy")
+        self.assertEqual( png_scanner.chop_model_and_data_images_into_tiles(),
+                          map_scanner.chop_model_and_data_images_into_tiles() )
+        for png_directory, map_directory in (("model_scanner_dump", "model_map_scanner_dump"),
+                                             ("data_scanner_dump", "data_map_scanner_dump")):
+            self.assertEqual( sorted(os.listdir(png_directory)), sorted(os.listdir(map_directory)) )
+            for name in os.listdir(png_directory):
+                png_tile = numpy.asarray(Image.open(os.path.join(png_directory, name)))
+                map_tile = numpy.asarray(Image.open(os.path.join(map_directory, name)))
+                self.assertTrue( numpy.array_equal(png_tile, map_tile) )
+        png_results = png_scanner.apply_icp_to_model_and_data_images_in_memory()
+        map_results = map_scanner.apply_icp_to_model_and_data_images_in_memory()
+        self.assertEqual( len(png_results), 4 )
+        for png_result, map_result in zip(png_results, map_results):
+            self.assertTrue( numpy.array_equal(png_result.R, map_result.R) )
+            self.assertTrue( numpy.array_equal(png_result.T, map_result.T) )
+            self.assertEqual( png_result.error_for_iterations, map_result.error_for_iterations )
+
+    def test_field_and_warp_written_to_files(self):
+        print("testing the displacement field and the warp written band by band to .npy files")
+        scanner = make_scanner("model_map.npy", "data_map.npy")
+        scanner.apply_icp_to_model_and_data_images_in_memory()
+        field = scanner.calculate_displacement_field()
+        field_map = scanner.calculate_displacement_field(field_file = "field.npy")
+        self.assertTrue( isinstance(field_map, numpy.memmap) )
+        self.assertTrue( scanner.displacement_field is field_map )
+        self.assertTrue( numpy.array_equal(numpy.load("field.npy"), field) )
+        warped = numpy.asarray(scanner.warp_data_image(field))
+        warped_map = scanner.warp_data_image(output_file = "warped.npy")
+        self.assertTrue( isinstance(warped_map, numpy.memmap) )
+        self.assertEqual( warped_map.dtype, numpy.uint8 )
+        self.assertTrue( numpy.array_equal(numpy.load("warped.npy"), warped) )
+        del field_map, warped_map
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestMemoryMappedSource, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
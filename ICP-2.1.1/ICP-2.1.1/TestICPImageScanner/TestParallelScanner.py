@@ -0,0 +1,44 @@
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import glob
+import numpy
+import shutil
+import tempfile
+import unittest
+from TestTiling import make_scanner_test_images, make_scanner
+
+class TestParallelScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+        make_scanner_test_images(shift=(6,4))
+        make_scanner().chop_model_and_data_images_into_tiles()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def test_pool_gives_the_serial_results(self):
+        print("testing that registering the scanner dumps in a process pool gives the serial results")
+        serial_scanner = make_scanner()
+        serial_scanner.apply_icp_to_model_and_data_scanner_dumps_fast()
+        parallel_scanner = make_scanner()
+        parallel_scanner.apply_icp_to_model_and_data_scanner_dumps_fast(processes=2)
+        self.assertEqual( len(parallel_scanner.subimage_results), 4 )
+        for serial, parallel in zip(serial_scanner.subimage_results, parallel_scanner.subimage_results):
+            self.assertTrue( serial is not None and parallel is not None )
+            self.assertTrue( numpy.array_equal(serial.R, parallel.R) )
+            self.assertTrue( numpy.array_equal(serial.T, parallel.T) )
+            self.assertEqual( serial.error_for_iterations, parallel.error_for_iterations )
+        self.assertEqual( glob.glob("__scratch_*"), [] )
+        self.assertEqual( len(glob.glob("__result_*")), 4 )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestParallelScanner, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import sys
+# The scanner imports the ICP package, so the tests run against the packages one level up:
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+import io
+import numpy
+import random
+import shutil
+import tempfile
+import unittest
+from PIL import Image, ImageDraw
+from ICPImageScanner import ICPImageScanner
+
+def make_scanner_test_images(model_size=(240,216), data_size=None, shift=(0,0)):
+    '''
+    Writes model.png and a data.png in which the scene of the model is moved by shift,
+    that is, the data pixel at (x + shift[0], y + shift[1]) is the model pixel at (x,y).
+    '''
+    data_size = data_size if data_size is not None else model_size
+    margin = 20
+    scene = Image.new("L", (max(model_size[0], data_size[0]) + 2 * margin, 
+                            max(model_size[1], data_size[1]) + 2 * margin), 0)
+    draw = ImageDraw.Draw(scene)
+    rng = random.Random(0)
+    for i in range(60):
+        x, y = rng.randint(0, scene.size[0]), rng.randint(0, scene.size[1])
+        w, h = rng.randint(8, 40), rng.randint(8, 40)
+        if i % 2:
+            draw.rectangle((x, y, x + w, y + h), fill=rng.randint(60, 255))
+        else:
+            draw.ellipse((x, y, x + w, y + h), fill=rng.randint(60, 255))
+    scene.crop((margin, margin, margin + model_size[0], margin + model_size[1])).save("model.png")
+    left, upper = margin - shift[0], margin - shift[1]
+    scene.crop((left, upper, left + data_size[0], upper + data_size[1])).save("data.png")
+
+def make_scanner(model_image_file="model.png", data_image_file="data.png", **params):
+    return ICPImageScanner(model_image_file = model_image_file, data_image_file = data_image_file,
+                           binary_or_color = "color", corners_or_edges = "edges",
+                           calculation_image_size = 100, max_num_of_pixels_used_for_icp = 200,
+                           pixel_correspondence_dist_threshold = 20, iterations = 24,
+                           scanning_window_width = 120, scanning_window_height = 108, **params)
+
+class TestTiling(unittest.TestCase):
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tempdir = tempfile.mkdtemp()
+        os.chdir(self.tempdir)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.tempdir)
+
+    def test_chop_into_tiles(self):
+        print("testing that the headless scanner dumps one file per position of the scanning window")
+        make_scanner_test_images(model_size=(240,216), data_size=(360,216))
+        scanner = make_scanner()
+        self.assertEqual( scanner.chop_model_and_data_images_into_tiles(), (4, 6) )
+        self.assertEqual( scanner.total_num_window_pos, 4 )
+        for name, columns, rows in (("model", 2, 2), ("data", 3, 2)):
+            image = Image.open(name + ".png").convert("RGB")
+            self.assertEqual( sorted(os.listdir(name + "_scanner_dump")),
+                              sorted("subimage_%d.jpg" % i for i in range(columns * rows)) )
+            for row in range(rows):
+                for column in range(columns):
+                    index = row * columns + column
+                    box = (column * 120, row * 108, (column + 1) * 120, (row + 1) * 108)
+                    # The dumps are JPEG files, so the crop goes through the same encoding:
+                    expected = io.BytesIO()
+                    image.crop(box).save(expected, "JPEG")
+                    expected.seek(0)
+                    tile = Image.open("%s_scanner_dump/subimage_%d.jpg" % (name, index))
+                    self.assertTrue( numpy.array_equal(numpy.asarray(tile), numpy.asarray(Image.open(expected))) )
+
+def getTestSuites(type):
+    return unittest.TestSuite([
+            unittest.makeSuite(TestTiling, type)
+                             ])                    
+if __name__ == '__main__':
+    unittest.main()